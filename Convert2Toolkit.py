@@ -1,20 +1,45 @@
 import argparse
 import json
+import multiprocessing
 from pathlib import Path
 
 from core.ConvertAPI import ConvertAPI
 from core.ConvertCLI import ConvertCLI
 from core.ConvertGUI import ConvertGUI
+from core.ConvertService import ConvertService
+from helpers.AuxDB import AUX_FORMATS
 from helpers.LSLibUtil import LSLibUtil
+from helpers.PakWriter import COMPRESSION_METHODS
 
 # Main entry for converter script or exe
 if __name__ == "__main__":
+	# needed for pipeline worker processes in the packed exe
+	multiprocessing.freeze_support()
+
 	# Load Settings
 	with open('settings.json', encoding="utf-8") as f:
 		settings = json.load(f)
 		bg3path = settings.get('bg3path', '')
 		compileAux = settings.get('compileAux', 1)
 		cli_mode = settings.get('cliMode', True)
+		batch_concurrency = settings.get('batchConcurrency', 1)
+		batch_temp_limit = settings.get('batchTempLimitMB', 0)
+		unpack_mode = settings.get('unpackMode', 'full')
+		unpack_patterns = settings.get('unpackPatterns', None)
+		log_files = settings.get('logFiles', True)
+		pipeline_workers = settings.get('pipelineWorkers', 0)
+		pipeline_max_pending = settings.get('pipelineMaxPending', 32)
+		service_port = settings.get('servicePort', 8765)
+		service_jobs = settings.get('serviceJobs', 1)
+		build_pak = settings.get('pakOutput', False)
+		pak_compression = settings.get('pakCompression', 'zlib')
+		pak_workers = settings.get('pakWorkers', 0)
+		incremental_stats = settings.get('incrementalStats', False)
+		stats_chunk_threshold = settings.get('statsChunkThresholdKB', 0)
+		stats_chunk_workers = settings.get('statsChunkWorkers', 0)
+		aux_db_format = settings.get('auxDbFormat', 'json')
+		db_version = settings.get('dbVersion', '')
+		log_level = settings.get('logLevel', 'normal')
 
 	# Handle command line args
 	parser = argparse.ArgumentParser(
@@ -32,11 +57,135 @@ if __name__ == "__main__":
 		action='store_true',
 		help='force gui mode (overrides settings.json). cannot be used with --cli'
 	)
+	group.add_argument(
+		'--serve',
+		action='store_true',
+		help='run as local conversion service, jobs are submitted with "py -m core.ConvertClient". cannot be used with --cli or --gui'
+	)
 	parser.add_argument(
 		'--compileAux',
 		action='store_true',
 		help='Compile additional UUIDs from Editor projects'
 	)
+	parser.add_argument(
+		'--concurrency',
+		type=int,
+		help='Number of pak files unpacked in parallel during batch conversion (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--tempLimit',
+		type=int,
+		help='Temp disk usage ceiling in MB for unpacked pak files during batch conversion, 0 for no limit (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--selectiveUnpack',
+		action='store_true',
+		help='Only extract files from pak files that need conversion, skipping assets (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--progress',
+		action='store_true',
+		help='Show a progress bar with throughput and ETA in cli mode'
+	)
+	parser.add_argument(
+		'--noFileLog',
+		action='store_true',
+		help='Do not log every converted file, only failures (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--workers',
+		type=int,
+		help='Number of processes converting stats files in a pipeline, 0 to convert serially (overrides settings.json)'
+	)
+
+	parser.add_argument(
+		'--dryRun', '--dry-run',
+		dest='dryRun',
+		action='store_true',
+		help='Only scan the convert folder and report what would be converted with an estimated runtime, in cli mode'
+	)
+	parser.add_argument(
+		'--verify',
+		action='store_true',
+		help='Convert copies of the convert folder with the reference and the fast code paths and compare the outputs, in cli mode'
+	)
+	parser.add_argument(
+		'--profile',
+		action='store_true',
+		help='Profile conversion stages and files, writes collapsed stacks for flamegraphs and lists the slowest files'
+	)
+	parser.add_argument(
+		'--profileTop',
+		type=int,
+		default=20,
+		help='Number of slowest files listed by --profile'
+	)
+	parser.add_argument(
+		'--memory',
+		action='store_true',
+		help='Track peak memory (python allocations and RSS) per file and stage, reported with the run metrics'
+	)
+	parser.add_argument(
+		'--memThreshold',
+		type=float,
+		default=0,
+		help='Flag files whose peak allocation exceeds this many MB while tracking memory'
+	)
+	parser.add_argument(
+		'--pak',
+		action='store_true',
+		help='Also write every built project into a .pak next to it (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--pakCompression',
+		choices=COMPRESSION_METHODS,
+		help='Compression of --pak output, none is fastest for local testing, lz4 needs the lz4 package (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--pakWorkers',
+		type=int,
+		help='Threads compressing --pak output, 0 for cpu count (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--incremental',
+		action='store_true',
+		help='Only regenerate stats files that changed or inherit from changed entries (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--chunkThreshold',
+		type=int,
+		help='Size in KB from which a stats file is split at entries and converted on several processes, 0 to never split (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--auxDb',
+		choices=AUX_FORMATS,
+		help='Keep the auxiliary ID database in auxdb.json or auxdb.sqlite (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--dbVersion',
+		help='Definition set of db_registry.sqlite to convert with, "auto" to match the game version of each mod (overrides settings.json)'
+	)
+	log_group = parser.add_mutually_exclusive_group()
+	log_group.add_argument(
+		'--quiet',
+		action='store_true',
+		help='Only print errors and the summary of the run, the run log still gets everything (overrides settings.json)'
+	)
+	log_group.add_argument(
+		'--verbose',
+		action='store_true',
+		help='Print every repeated warning instead of only the first one (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--port',
+		type=int,
+		help='Localhost port of the conversion service (overrides settings.json)'
+	)
+	parser.add_argument(
+		'--jobs',
+		type=int,
+		help='Number of jobs the conversion service runs at the same time (overrides settings.json)'
+	)
 
 	args = vars(parser.parse_args())
 	if args['cli']:
@@ -47,6 +196,39 @@ if __name__ == "__main__":
 	if args['compileAux']:
 		compileAux = True
 
+	if args['concurrency'] is not None:
+		batch_concurrency = args['concurrency']
+	if args['tempLimit'] is not None:
+		batch_temp_limit = args['tempLimit']
+	if args['selectiveUnpack']:
+		unpack_mode = 'selective'
+	if args['noFileLog']:
+		log_files = False
+	if args['workers'] is not None:
+		pipeline_workers = args['workers']
+	if args['pak']:
+		build_pak = True
+	if args['pakCompression'] is not None:
+		pak_compression = args['pakCompression']
+	if args['pakWorkers'] is not None:
+		pak_workers = args['pakWorkers']
+	if args['incremental']:
+		incremental_stats = True
+	if args['chunkThreshold'] is not None:
+		stats_chunk_threshold = args['chunkThreshold']
+	if args['auxDb'] is not None:
+		aux_db_format = args['auxDb']
+	if args['dbVersion'] is not None:
+		db_version = args['dbVersion']
+	if args['quiet']:
+		log_level = 'quiet'
+	elif args['verbose']:
+		log_level = 'verbose'
+	if args['port'] is not None:
+		service_port = args['port']
+	if args['jobs'] is not None:
+		service_jobs = args['jobs']
+
 	# Set up paths for file references (needed due to exe packing)
 	path_to_root = Path('.').resolve()
 	lib_path = Path(__file__).parent.resolve()
@@ -63,11 +245,33 @@ if __name__ == "__main__":
 		path_to_root=path_to_root,
 		path_to_templates=path_to_templates,
 		lslib_util=lslib_util,
-		compile_aux_db=compileAux
+		compile_aux_db=compileAux,
+		batch_concurrency=batch_concurrency,
+		batch_temp_limit_mb=batch_temp_limit,
+		unpack_mode=unpack_mode,
+		unpack_patterns=unpack_patterns,
+		log_files=log_files,
+		pipeline_workers=pipeline_workers,
+		pipeline_max_pending=pipeline_max_pending,
+		profile=args['profile'],
+		profile_top=args['profileTop'],
+		track_memory=args['memory'] or args['memThreshold'] > 0,
+		memory_threshold_mb=args['memThreshold'],
+		build_pak=build_pak,
+		pak_compression=pak_compression,
+		pak_workers=pak_workers,
+		incremental_stats=incremental_stats,
+		stats_chunk_threshold_kb=stats_chunk_threshold,
+		stats_chunk_workers=stats_chunk_workers,
+		aux_db_format=aux_db_format,
+		db_version=db_version,
+		log_level=log_level
 	)
 
-	# Determine process command line vs GUI
-	if cli_mode:
-		ConvertCLI(convert_api, path_to_root).run()
+	# Determine process service vs command line vs GUI
+	if args['serve']:
+		ConvertService(convert_api, path_to_root, port=service_port, max_jobs=service_jobs).run()
+	elif cli_mode:
+		ConvertCLI(convert_api, path_to_root, args['progress'], args['dryRun'], args['verify']).run()
 	else:
 		ConvertGUI(convert_api, path_to_root, path_to_resources).run()
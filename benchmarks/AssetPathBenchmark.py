@@ -0,0 +1,104 @@
+import argparse
+import random
+import sys
+
+from benchmarks.BenchUtil import report, timed
+from helpers.AssetPathRewriter import AssetPathRewriter, legacy_rewrite
+
+PROJECT = 'Bench_00000000-0000-0000-0000-000000000000'
+
+# Documents where per line and per attribute value rewriting differ, the rewriter has to match the legacy regex on all of them
+EDGE_CASES = {
+    'shared path later on a minified line': '<node><attribute id="A" value="Public/Mod/Assets/x.dds"/>'
+                                            '<attribute id="B" value="Public/Shared/Assets/y.dds"/>'
+                                            '<attribute id="C" value="Public/Mod/Assets/z.dds"/></node>\n',
+    'stray quote in a comment': '<!-- it\'s "odd -->\n<attribute id="A" value="Public/Mod/Assets/x.dds"/>\n'
+                                '<attribute id="B" value="Generated/Mod/Assets/m.GR2"/>\n',
+    'path spanning attributes': '<attribute value="Public/Mod/x" /><attribute value="y/Assets/z.dds" />\n',
+    'paths in text and comments': '<!-- Public/Mod/Assets/old.dds Generated/Mod/a.GR2 -->\n<text>Public/Mod/Assets/t.dds</text>\n',
+    'generated path without folder first': '<attribute value="Generated/" />\n<attribute value="Public/Mod/Assets/x.dds" />\n'
+                                           '<attribute value="Generated/Public/Mod/Assets/m.GR2" />\n',
+    'no generated path with a folder': '<attribute value="Generated/" />\n<attribute value="Public/Mod/Assets/x.dds" />',
+    'value spanning lines': '<attribute value="Public/Mod/Assets/a.dds\nPublic/Shared/Assets/b.dds Public/Mod/Assets/c.dds" />\n',
+    'windows line endings': '<attribute value="Generated/Mod/Assets/m.GR2" />\r\n<attribute value="Public/Mod/Assets/x.dds Public/Shared/Assets/y.dds" />\r\n',
+}
+# pieces of the random documents checked after the edge cases
+FUZZ_TOKENS = ['Public/', 'Shared/', 'Assets/', '/Assets/', 'Generated/', 'Generated/Public/', 'Public/Shared/Assets/',
+               'Mod/', 'Mod', '"', '\n', '\r\n', '\r', 'x', '/', ' ']
+
+
+def gen_resource_bank(resources: int, seed: int = 1, minified: bool = False, shared: bool = True, stray_quote: bool = True) -> str:
+    """
+        Synthetic visual bank lsx with generated model paths and public texture paths (about 10% shared),
+        pretty printed like LSLib writes it or minified onto a single line, optionally with an unbalanced quote in a comment
+    """
+    rnd = random.Random(seed)
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', '<save>', '<region id="VisualBank">', '<node id="VisualBank">', '<children>']
+    if stray_quote:
+        lines.insert(1, '<!-- it\'s "odd -->')
+    for i in range(resources):
+        mod = rnd.choice(['BenchMod', 'OtherMod'])
+        if shared and rnd.random() < 0.1:
+            texture = f'Public/Shared/Assets/Textures/Shared_{i}.dds'
+        else:
+            texture = f'Public/{mod}/Assets/Textures/{rnd.choice(["Body", "Armor/Plate"])}/Texture_{i}.dds'
+        lines += ['<node id="Resource">',
+                  f'<attribute id="ID" type="FixedString" value="{i:08x}-0000-0000-0000-000000000000" />',
+                  f'<attribute id="Name" type="LSString" value="Resource_{i}" />',
+                  f'<attribute id="SourceFile" type="LSString" value="Generated/{mod}/Assets/Models/Model_{i}.GR2" />',
+                  f'<attribute id="Texture" type="LSString" value="{texture}" />',
+                  '</node>']
+    lines += ['</children>', '</node>', '</region>', '</save>', '']
+    return ''.join(lines) if minified else '\n'.join('\t' * min(i, 4) + line for i, line in enumerate(lines))
+
+
+# Rewriter vs legacy regex on the edge cases and on random documents, with and without Generated/ paths
+def check_cases(documents: int = 2000, seed: int = 1) -> bool:
+    rnd = random.Random(seed)
+    cases = dict(EDGE_CASES)
+    cases.update({f'random {i}': ''.join(rnd.choices(FUZZ_TOKENS, k=rnd.randint(1, 40))) for i in range(documents)})
+    rows = [('case', 'generated', 'same output')]
+    different = {}
+    for name, data in cases.items():
+        for generated in (True, False):
+            if AssetPathRewriter(PROJECT, generated).rewrite(data) != legacy_rewrite(data, PROJECT, generated):
+                different[(name, generated)] = data
+            if name in EDGE_CASES:
+                rows.append((name, 'yes' if generated else 'no', 'NO' if (name, generated) in different else 'yes'))
+    random_different = sum(1 for name, _ in different if name not in EDGE_CASES)
+    rows.append((f'{documents} random documents', 'both', f'{random_different} different' if random_different else 'yes'))
+    report('Asset path rewrite equivalence', rows)
+    for (name, generated), data in list(different.items())[:5]:
+        print(f'  {name} (generated {"yes" if generated else "no"}): {data!r}')
+    return not different
+
+
+# Legacy whole document regex rewrite vs the single pass rewriter, pretty printed and minified resource banks
+def run(resources: list[int], repeat: int, legacy_limit: int):
+    rows = [('resources', 'layout', 'KB', 'legacy s', 'rewriter s', 'speedup', 'same output')]
+    for count in resources:
+        for minified in (False, True):
+            data = gen_resource_bank(count, minified=minified)
+            new, seconds = timed(lambda: AssetPathRewriter(PROJECT).rewrite(data), repeat=repeat)
+            layout = 'minified' if minified else 'pretty'
+            if minified and count > legacy_limit:
+                rows.append((count, layout, len(data) // 1024, 'skipped', f'{seconds:.4f}', '-', '-'))
+                continue
+            old, legacy_seconds = timed(legacy_rewrite, data, PROJECT, repeat=repeat)
+            rows.append((count, layout, len(data) // 1024, f'{legacy_seconds:.4f}', f'{seconds:.4f}',
+                         f'{legacy_seconds / seconds:.1f}', 'yes' if old == new else 'NO'))
+    report('Asset path rewrite (legacy regex vs single pass)', rows)
+    print(f'  minified legacy runs above {legacy_limit} resources are skipped, the legacy regex is quadratic on one line')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Asset path rewrite time and output of the legacy regex and the single pass rewriter')
+    parser.add_argument('--resources', type=int, nargs='+', default=[50, 100, 200, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--legacyLimit', type=int, default=200, help='Largest minified bank the legacy regex is run on')
+    parser.add_argument('--documents', type=int, default=2000, help='Random documents checked against the legacy regex')
+    args = parser.parse_args()
+    cases_same = check_cases(args.documents)
+    run(args.resources, args.repeat, args.legacyLimit)
+    if not cases_same:
+        sys.exit(1)
@@ -0,0 +1,60 @@
+import argparse
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from benchmarks.BenchUtil import measure, report
+from helpers.AuxDB import AuxDB
+
+
+def gen_aux_entries(entries: int, seed: int = 1) -> dict[str, str]:
+    """
+        Synthetic aux db, stat names mapped to Editor UUIDs
+    """
+    rnd = random.Random(seed)
+    return {f'Bench_{i}': '%08x-%04x-%04x-%04x-%012x' % (rnd.getrandbits(32), rnd.getrandbits(16), rnd.getrandbits(16),
+                                                          rnd.getrandbits(16), rnd.getrandbits(48)) for i in range(entries)}
+
+
+# Startup cost of the aux db (load auxdb.json vs open auxdb.sqlite) and parent lookups of a small run
+def run(entries: list[int], parents: int, repeat: int):
+    rows = [('entries', 'format', 'open ms', 'open peak MB', 'lookup ms', 'same parents')]
+    for count in entries:
+        table = gen_aux_entries(count)
+        names = random.Random(2).sample(list(table), min(parents, count))
+        with tempfile.TemporaryDirectory(prefix='aux_db_bench_') as work_dir:
+            json_file = Path(work_dir) / 'auxdb.json'
+            json_file.write_text(json.dumps(table, indent=4), encoding='utf-8')
+            store = AuxDB(Path(work_dir) / 'auxdb.sqlite')
+            store.import_json(json_file)
+            store.close()
+
+            def load_json():
+                with open(json_file, encoding='utf-8') as f:
+                    return json.load(f)
+
+            def open_store():
+                opened = AuxDB(store.path)
+                opened.connection()
+                return opened
+
+            loaded, seconds, peak, _ = measure(load_json, repeat=repeat)
+            _, lookup, _, _ = measure(lambda: {name: loaded.get(name) for name in names}, repeat=repeat)
+            rows.append((count, 'json', f'{seconds * 1000:.1f}', f'{peak / 1024 / 1024:.1f}', f'{lookup * 1000:.2f}', 'yes'))
+
+            opened, seconds, peak, _ = measure(open_store, repeat=repeat)
+            found, lookup, _, _ = measure(lambda: AuxDB(store.path).lookup(names), repeat=repeat)
+            same = found == {name: table[name] for name in names}
+            rows.append((count, 'sqlite', f'{seconds * 1000:.1f}', f'{peak / 1024 / 1024:.1f}', f'{lookup * 1000:.2f}', 'yes' if same else 'NO'))
+            opened.close()
+    report(f'Auxiliary ID database startup ({parents} parents looked up)', rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Startup time and memory of auxdb.json vs auxdb.sqlite')
+    parser.add_argument('--entries', type=int, nargs='+', default=[10000, 100000, 400000])
+    parser.add_argument('--parents', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.entries, args.parents, args.repeat)
@@ -0,0 +1,104 @@
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).parent.parent.resolve()
+
+# (field, value) pairs typical for spell/passive entries
+STATS_FIELDS = [
+    ('DisplayName', 'h{0:08x}g0000g0000g0000g000000000000;1'),
+    ('Description', 'h{0:08x}g1111g1111g1111g111111111111;2'),
+    ('Icon', 'Spell_Icon_{0}'),
+    ('Cooldown', 'OncePerTurn'),
+    ('SpellSchool', 'Evocation'),
+    ('TargetConditions', 'Character() and not Self()'),
+    ('SpellRoll', 'Attack(AttackType.RangedSpellAttack)'),
+    ('SpellSuccess', 'DealDamage(1d10,Fire,Magical)'),
+    ('SpellFlags', 'HasSomaticComponent;HasVerbalComponent;IsSpell'),
+    ('UseCosts', 'ActionPoint:1;SpellSlot:1:1:1'),
+    ('Level', '1'),
+    ('VerbalIntent', 'Damage'),
+]
+
+
+def load_db() -> dict:
+    with open(ROOT_PATH / 'db.json', encoding="utf-8") as f:
+        return json.load(f)
+
+
+def gen_stats_text(entries: int, seed: int = 1, prefix: str = 'Bench') -> str:
+    """
+        Synthetic stats txt with entries inheriting from the previous entry
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(entries):
+        lines.append(f'new entry "{prefix}_{i}"')
+        lines.append('type "SpellData"')
+        if i > 0:
+            lines.append(f'using "{prefix}_{rnd.randrange(i)}"')
+        for name, value in STATS_FIELDS:
+            lines.append(f'data "{name}" "{value.format(i)}"')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def gen_treasure_table_text(tables: int, seed: int = 1) -> str:
+    """
+        Synthetic TreasureTable.txt with a mix of plain tables and tables with several subtables
+    """
+    rnd = random.Random(seed)
+    lines = ['treasure itemtypes "Common","Uncommon","Rare","Epic","Legendary","Divine","Unique"', '']
+    for i in range(tables):
+        lines.append(f'new treasuretable "TT_Bench_{i}"')
+        if rnd.random() < 0.3:
+            lines.append('CanMerge 1')
+        for s in range(rnd.randint(1, 3)):
+            lines.append(f'new subtable "{rnd.randint(1, 3)},1"')
+            for o in range(rnd.randint(1, 4)):
+                lines.append(f'object category "I_Bench_{i}_{s}_{o}",1,0,0,0,0,0,0,0')
+            if rnd.random() < 0.2:
+                lines.append(f'MinLevel "{rnd.randint(1, 5)}"')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def measure(func, *args, repeat: int = 1):
+    """
+        Runs func with tracemalloc enabled
+
+    :return: (result of last call, seconds per call, peak bytes, live blocks allocated by the call)
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = None
+        for _ in range(repeat):
+            result = func(*args)
+        elapsed = (time.perf_counter() - start) / repeat
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak, blocks
+
+
+def timed(func, *args, repeat: int = 1):
+    """
+        Runs func without tracing overhead
+
+    :return: (result of last call, seconds per call)
+    """
+    start = time.perf_counter()
+    result = None
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def report(title: str, rows: list[tuple]):
+    print(f'\n{title}')
+    for row in rows:
+        print('  ' + ' | '.join(str(c) for c in row))
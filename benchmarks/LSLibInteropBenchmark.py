@@ -0,0 +1,126 @@
+import argparse
+import ctypes
+import ctypes.util
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from benchmarks.BenchUtil import report, timed
+
+LSX_TEMPLATE = '''<?xml version="1.0" encoding="utf-8"?>
+<save>
+  <version major="4" minor="0" revision="9" build="331" lslib_meta="v1,bswap_guids" />
+  <region id="Templates">
+    <node id="Templates">
+      <children>
+        <node id="GameObjects">
+          <attribute id="MapKey" type="FixedString" value="{uuid}" />
+          <attribute id="Name" type="LSString" value="Bench_{index}" />
+          <attribute id="Type" type="FixedString" value="item" />
+        </node>
+      </children>
+    </node>
+  </region>
+</save>
+'''
+
+
+# Stand-in for LSLibUtil when the CLR isn't available. Every call into "LSLib" crosses a real
+# ctypes boundary and marshals its string arguments, the conversion itself does nothing.
+# The numbers are the call overhead alone, run with --lslib for end to end timings.
+class StandInLSLib:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'msvcrt')
+        self.libc.wcslen.restype = ctypes.c_size_t
+        self.crossings = 0
+
+    def _cross(self, *strings: str) -> int:
+        self.crossings += 1
+        return sum(self.libc.wcslen(ctypes.c_wchar_p(s)) for s in strings)
+
+    def _cross_arrays(self, *arrays: list[str]) -> int:
+        self.crossings += 1
+        total = 0
+        for strings in arrays:
+            marshaled = (ctypes.c_wchar_p * len(strings))(*strings)
+            total += self.libc.wcslen(marshaled[0]) if strings else 0
+        return total
+
+    def convert_file(self, source_file: Path, output_path: Path):
+        input_str = str(source_file.resolve())
+        output_str = str(output_path.resolve())
+        self._cross(output_str)             # ExtensionToResourceFormat
+        self._cross(input_str)              # LoadResource
+        self._cross(output_str)             # SaveResource
+
+    def convert_files(self, pairs: list[tuple[Path, Path]]) -> list[Optional[str]]:
+        inputs = [str(source.resolve()) for source, _ in pairs]
+        outputs = [str(output.resolve()) for _, output in pairs]
+        self._cross_arrays(inputs, outputs)
+        return [None] * len(pairs)
+
+
+def gen_lsx_files(directory: Path, count: int) -> list[tuple[Path, Path]]:
+    pairs = []
+    for i in range(count):
+        source = directory / f'Bench_{i}.lsx'
+        source.write_text(LSX_TEMPLATE.format(uuid=uuid.uuid4(), index=i), encoding='utf-8')
+        pairs.append((source, source.with_suffix('.lsf')))
+    return pairs
+
+
+# Compares one interop round trip per call against LSLibUtil.convert_files
+def run(files: int, batch_size: int, repeat: int, lslib: str = None):
+    if lslib is None:
+        backend = StandInLSLib()
+        backend_name = 'stand-in (ctypes)'
+    else:
+        from helpers.LSLibUtil import LSLibUtil
+        backend = LSLibUtil(Path(lslib))
+        backend_name = 'LSLib'
+
+    work_dir = Path(tempfile.mkdtemp(prefix='lslib_bench_'))
+    try:
+        pairs = gen_lsx_files(work_dir, files)
+        # warm up, the first batch call also builds the compiled .NET loop
+        backend.convert_files(pairs[:1])
+        backend.convert_file(*pairs[0])
+
+        def per_file():
+            for source, output in pairs:
+                backend.convert_file(source, output)
+
+        def batched():
+            errors = []
+            for start in range(0, len(pairs), batch_size):
+                errors.extend(backend.convert_files(pairs[start:start + batch_size]))
+            return errors
+
+        _, single_time = timed(per_file, repeat=repeat)
+        errors, batch_time = timed(batched, repeat=repeat)
+        failed = sum(1 for e in errors if e is not None)
+        single_calls = files * 3
+        batch_calls = -(-files // batch_size)
+
+        report(f'LSLib interop, {backend_name} ({files} files, batch size {batch_size})', [
+            ('path', 'calls', 's', 'us/file', 'files/s', 'failed'),
+            ('convert_file', single_calls, f'{single_time:.3f}', f'{single_time / files * 1e6:.1f}', f'{files / single_time:.0f}', ''),
+            ('convert_files', batch_calls, f'{batch_time:.3f}', f'{batch_time / files * 1e6:.1f}', f'{files / batch_time:.0f}', failed),
+        ])
+        saved = max(1, single_calls - batch_calls)
+        print(f'  ~{(single_time - batch_time) / saved * 1e6:.2f} us overhead per avoided call, '
+              f'{single_time / batch_time:.2f}x speedup')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='LSLib per-call vs batched interop benchmark')
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--lslib', type=str, default=None, help='Path to Divine.exe/LSLib.dll, omit to use the stand-in backend')
+    args = parser.parse_args()
+    run(args.files, args.batch, args.repeat, args.lslib)
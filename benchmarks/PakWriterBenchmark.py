@@ -0,0 +1,60 @@
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+from benchmarks.BenchUtil import report, timed
+from helpers.PakWriter import COMPRESSION_LZ4, COMPRESSION_NONE, COMPRESSION_ZLIB, PakWriter, lz4_block
+
+
+def gen_project_files(count: int, size_kb: int, seed: int = 1) -> list[tuple[str, bytes]]:
+    """
+        Synthetic project contents, half random (textures, already compressed) and half repetitive (xml like)
+    """
+    rnd = random.Random(seed)
+    files = []
+    for i in range(count):
+        if i % 2 == 0:
+            data = rnd.randbytes(size_kb * 1024)
+        else:
+            row = f'<attribute id="Field_{i}" type="FixedString" value="{rnd.random()}" />\n'.encode('utf-8')
+            data = row * (size_kb * 1024 // len(row))
+        files.append((f'Public/Bench/Assets/File_{i}.bin', data))
+    return files
+
+
+# Pak write throughput per compression mode and number of compression threads
+def run(files: int, size_kb: int, workers: list[int], repeat: int):
+    project = gen_project_files(files, size_kb)
+    total = sum(len(data) for _, data in project)
+    modes = [(COMPRESSION_NONE, 1)] + [(COMPRESSION_ZLIB, w) for w in workers]
+    if lz4_block is not None:
+        modes += [(COMPRESSION_LZ4, w) for w in workers]
+
+    with tempfile.TemporaryDirectory(prefix='pak_bench_') as work_dir:
+        rows = [('compression', 'threads', 's', 'MB/s', 'pak MB')]
+        for compression, threads in modes:
+            pak_path = Path(work_dir) / f'{compression}_{threads}.pak'
+
+            def write():
+                pak = PakWriter(pak_path, compression, threads)
+                for name, data in project:
+                    pak.add(name, data)
+                return pak.close()
+
+            _, seconds = timed(write, repeat=repeat)
+            rows.append((compression, threads, f'{seconds:.3f}', f'{total / 1024 / 1024 / seconds:.0f}',
+                         f'{pak_path.stat().st_size / 1024 / 1024:.1f}'))
+        report(f'Pak writer ({files} files, {total / 1024 / 1024:.0f} MB)', rows)
+    if lz4_block is None:
+        print('  lz4 package not installed, lz4 rows skipped')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pak writer throughput per compression mode and thread count')
+    parser.add_argument('--files', type=int, default=400)
+    parser.add_argument('--sizeKB', type=int, default=256)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.files, args.sizeKB, args.workers, args.repeat)
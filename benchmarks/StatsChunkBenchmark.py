@@ -0,0 +1,60 @@
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.BenchUtil import gen_stats_text, load_db, report, timed
+from helpers.Stats2kit import StatsConvert
+
+GUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def normalize_ids(xml: str) -> str:
+    """
+        Replaces generated entry IDs by their order of appearance, outputs of two runs compare equal then
+    """
+    ids = {}
+    return GUID.sub(lambda m: ids.setdefault(m.group(0), f'id{len(ids)}'), xml)
+
+
+# Conversion time of a single huge stats file, serial and split into chunks on 1..n processes
+def run(entries: int, workers: list[int], repeat: int):
+    db = load_db()
+    with tempfile.TemporaryDirectory(prefix='stats_chunk_bench_') as work_dir:
+        work_path = Path(work_dir)
+        source = work_path / 'Spell_Target.txt'
+        source.write_text(gen_stats_text(entries, prefix='Target'), encoding='utf-8')
+        size_mb = source.stat().st_size / 1024 / 1024
+        output = Path(StatsConvert.output_path(str(source)))
+
+        converter = StatsConvert(db, {}, work_path)
+        _, serial = timed(converter.convert, str(source), repeat=repeat)
+        expected = normalize_ids(output.read_text())
+        rows = [('workers', 'chunks', 's', 'MB/s', 'speedup', 'pool start s', 'same output')]
+        rows.append(('serial', 1, f'{serial:.3f}', f'{size_mb / serial:.1f}', '1.00', '-', 'yes'))
+
+        for count in workers:
+            converter = StatsConvert(db, {}, work_path)
+            converter.chunk_threshold_kb = 1
+            converter.chunk_workers = count
+            start = time.perf_counter()
+            converter.chunk_pool().submit(int).result()
+            pool_start = time.perf_counter() - start
+            try:
+                _, seconds = timed(converter.convert, str(source), repeat=repeat)
+            finally:
+                converter.close_chunk_pool()
+            same = normalize_ids(output.read_text()) == expected
+            rows.append((count, count * 2 if count > 1 else 1, f'{seconds:.3f}', f'{size_mb / seconds:.1f}',
+                         f'{serial / seconds:.2f}', f'{pool_start:.2f}', 'yes' if same else 'NO'))
+        report(f'Chunked stats conversion ({entries} entries, {size_mb:.1f} MB)', rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scaling of chunked conversion on a single huge stats file')
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.entries, args.workers, args.repeat)
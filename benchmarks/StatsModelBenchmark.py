@@ -0,0 +1,45 @@
+import argparse
+
+import xmltodict
+
+from benchmarks.BenchUtil import ROOT_PATH, gen_stats_text, load_db, measure, report, timed
+from helpers.Stats2kit import StatsConvert
+
+
+# Compares the slotted stats model against the nested dict layout the converters used to build
+def run(entries: int):
+    db = load_db()
+    converter = StatsConvert(db, {}, ROOT_PATH)
+    converter.file = 'Passive.txt'
+    converter.data = gen_stats_text(entries)
+
+    def build_model():
+        return converter.convert_all(save_recovered=False)
+
+    def build_dicts():
+        return converter.convert_all(save_recovered=False).to_dict()
+
+    model, model_time, model_peak, model_blocks = measure(build_model)
+    _, dict_time, dict_peak, dict_blocks = measure(build_dicts)
+    fields = sum(len(o) for o in model.objects)
+
+    report(f'Intermediate model ({entries} entries, {fields} fields)', [
+        ('layout', 'build s', 'peak MB', 'live blocks'),
+        ('model', f'{model_time:.3f}', f'{model_peak / 1024 / 1024:.1f}', model_blocks),
+        ('dicts', f'{dict_time:.3f}', f'{dict_peak / 1024 / 1024:.1f}', dict_blocks),
+    ])
+
+    legacy = model.to_dict()
+    xml, write_time = timed(model.to_xml)
+    legacy_xml, unparse_time = timed(lambda: xmltodict.unparse(legacy, pretty=True, indent='  '))
+    report('Serialization', [
+        ('writer', 's', 'identical'),
+        ('StatsDocument.to_xml', f'{write_time:.3f}', xml == legacy_xml),
+        ('xmltodict.unparse', f'{unparse_time:.3f}', ''),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stats intermediate model memory benchmark')
+    parser.add_argument('--entries', type=int, default=20000)
+    run(parser.parse_args().entries)
@@ -0,0 +1,53 @@
+import argparse
+import io
+
+from benchmarks.BenchUtil import ROOT_PATH, gen_treasure_table_text, load_db, measure, report
+from helpers.StatsModel import StatsDocument
+from helpers.Stats2kit import StatsConvert
+from helpers.TreasureTable import TreasureTableConvert
+
+
+# Compares the legacy treasure table parser with the streaming state machine
+def run(tables: int, repeat: int):
+    db = load_db()
+    text = gen_treasure_table_text(tables)
+    size_mb = len(text.encode('utf-8')) / 1024 / 1024
+
+    converter = StatsConvert(db, {}, ROOT_PATH)
+    converter.file = 'TreasureTable.txt'
+    converter.data = text
+    engine = TreasureTableConvert(db)
+
+    def legacy_parse():
+        construct = StatsDocument()
+        converter.process_treasure_table(construct)
+        return construct
+
+    def streaming_parse():
+        return sum(1 for _ in engine.records(text.split('\n')))
+
+    def legacy():
+        return legacy_parse().to_xml()
+
+    def streaming_build():
+        return engine.build(text.split('\n')).to_xml()
+
+    def streaming_write():
+        output = io.StringIO()
+        engine.write(io.StringIO(text), output)
+        return output.getvalue()
+
+    rows = [('parser', 's', 'tables/s', 'MB/s', 'peak MB')]
+    for name, func in (('legacy parse', legacy_parse), ('engine parse', streaming_parse),
+                       ('legacy', legacy), ('engine build', streaming_build), ('engine write', streaming_write)):
+        _, elapsed, peak, _ = measure(func, repeat=repeat)
+        rows.append((name, f'{elapsed:.3f}', f'{tables / elapsed:.0f}', f'{size_mb / elapsed:.2f}', f'{peak / 1024 / 1024:.1f}'))
+    report(f'Treasure tables ({tables} tables, {size_mb:.1f} MB)', rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Treasure table parser throughput benchmark')
+    parser.add_argument('--tables', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    run(args.tables, args.repeat)
@@ -1,17 +1,41 @@
+import copy
 import json
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack
 from pathlib import Path
 
 from colorama import Fore
 
+from helpers import RunLog, Stats2kit
+from helpers.AuxDB import AUX_DB_FILE, AUX_JSON, AUX_SQLITE, AuxDB
+from helpers.CancelToken import CancelToken
 from helpers.CompileDB import CompileDB
+from helpers.ConvertPipeline import ConvertPipeline
+from helpers.ConvertPlan import COPY_ONLY, LOCALE, LSX_LSF, LSX_TBL, MEI, STATS, ConvertPlan, ThroughputHistory, peek_region_id, scan
+from helpers.ConvertVerifier import VerifyReport, compare_asset_paths, compare_outputs
+from helpers.DBRegistry import DB_REGISTRY_FILE, DB_VERSION_AUTO, DBRegistry, find_game_version, format_game_version
 from helpers.FixLocale import FixLocale
-from helpers.LSLibUtil import LSLibUtil
+from helpers.LegacyConvert import LegacyFixLocale, LegacyLSXconvert, LegacyStatsConvert
+from helpers.LSLibUtil import CONVERT_BATCH_SIZE, CONVERTIBLE_PATTERNS, LSLibUtil
 from helpers.LSXtoTBL import LSXconvert
+from helpers.MemoryTracker import MemoryTracker
+from helpers.PakBatchQueue import PakBatchQueue
+from helpers.PakWriter import COMPRESSION_ZLIB
+from helpers.Profiler import ConvertProfiler
+from helpers.ProgressEvents import ProgressReporter, StageTracker
 from helpers.ProjectBuilder import ProjectBuilder
 from helpers.Stats2kit import StatsConvert
+from helpers.StatsGraph import StatsGraph, fingerprint
 
 EXCLUSIONS = ['meta.lsx', 'metadata.lsf.lsx']
 FORCE_FAIL = ['SpellSet.txt']
+# sources copied for verify runs, everything else is left out of the copies
+VERIFY_SOURCES = ['.txt', '.lsx', '.xml']
+UNPACK_FULL = 'full'
+UNPACK_SELECTIVE = 'selective'
 
 
 # Primary object for clients to call for conversion logic
@@ -21,16 +45,71 @@ class ConvertAPI:
                  path_to_root: Path,
                  path_to_templates: Path,
                  lslib_util: LSLibUtil,
-                 compile_aux_db: bool = False):
+                 compile_aux_db: bool = False,
+                 batch_concurrency: int = 1,
+                 batch_temp_limit_mb: int = 0,
+                 unpack_mode: str = UNPACK_FULL,
+                 unpack_patterns: list[str] = None,
+                 log_files: bool = True,
+                 pipeline_workers: int = 0,
+                 pipeline_max_pending: int = 32,
+                 profile: bool = False,
+                 profile_top: int = 20,
+                 track_memory: bool = False,
+                 memory_threshold_mb: float = 0,
+                 build_pak: bool = False,
+                 pak_compression: str = COMPRESSION_ZLIB,
+                 pak_workers: int = 0,
+                 incremental_stats: bool = False,
+                 stats_chunk_threshold_kb: int = 0,
+                 stats_chunk_workers: int = 0,
+                 aux_db_format: str = AUX_JSON,
+                 db_version: str = '',
+                 log_level: str = 'normal'):
         self.path_to_root = path_to_root
+        # messages of every converter go through a background thread into logs/run_<time>.jsonl
+        self.run_log = RunLog.RunLogger(path_to_root / 'logs', RunLog.LOG_LEVELS[log_level])
+        RunLog.install(self.run_log)
         self.lslib_util = lslib_util
         self.src_bg3_path = src_bg3_path
+        self.batch_concurrency = batch_concurrency
+        self.batch_temp_limit_mb = batch_temp_limit_mb
+        self.unpack_mode = unpack_mode
+        self.unpack_patterns = unpack_patterns or CONVERTIBLE_PATTERNS
+        self.log_files = log_files
+        self.pipeline_workers = pipeline_workers
+        self.pipeline_max_pending = pipeline_max_pending
+        self.build_pak = build_pak
+        self.pak_compression = pak_compression
+        self.pak_workers = pak_workers
+        # only regenerate stats files that changed or inherit from changed entries
+        self.incremental_stats = incremental_stats
+        # stats files of at least this size are split at entries and converted on stats_chunk_workers processes
+        self.stats_chunk_threshold_kb = stats_chunk_threshold_kb
+        self.stats_chunk_workers = stats_chunk_workers
+        # auxdb.json loaded whole, or auxdb.sqlite queried for the parents a run uses
+        self.aux_db_format = aux_db_format
+        # '' for db.json, a set of db_registry.sqlite, or 'auto' for the set matching each mod's game version
+        self.db_version = db_version
+        self._db_registry = None
+        # clients subscribe here for typed progress events (stage start/end, file done/skipped/failed)
+        self.progress = ProgressReporter()
+        # cancelled by clients to stop a running conversion after the current file
+        self.cancel_token = CancelToken()
+        # per stage and per file timings plus sampled stacks, only when profiling
+        self.profiler = ConvertProfiler() if profile else None
+        # peak allocation and RSS per file and stage, only when tracking memory
+        self.memory_tracker = MemoryTracker(memory_threshold_mb) if track_memory else None
+        self.profile_top = profile_top
+        for instrument in self._instruments():
+            self.progress.subscribe(instrument)
+        # measured stage throughput, used to estimate runtime in plan()
+        self.throughput = ThroughputHistory(self.path_to_root / 'throughput.json')
+        self.progress.subscribe(self.throughput)
+        self.path_to_templates = path_to_templates
         self._aux_db = self._get_auxiliary_db(src_bg3_path, compile_aux_db)
         self._db = self._get_db()
-        self._stats_converter = StatsConvert(self._db, self._aux_db, self.path_to_root)
-        self._lsx_converter = LSXconvert(self._db, self.lslib_util, self.path_to_root)
-        self._locale_fixer = FixLocale()
-        self._proj_builder = ProjectBuilder(path_to_templates, self._lsx_converter)
+        self._init_converters(self.path_to_root)
 
     #region Public functions
     def convert(self, source_path: Path, output_dir: Path, is_cli: bool = True):
@@ -45,11 +124,67 @@ class ConvertAPI:
         :param output_dir: Location to output converted files
         :param is_cli: Flag to indicate if caller is command line or GUI
         """
+        self.select_db(source_path)
         self.convert_stat_files(source_path)
-        self.convert_lsx_files(source_path)
+        self.convert_lsx_files(source_path, self.find_projects(source_path))
         self.fix_locales(source_path)
         self.build_tk_project(source_path, output_dir, is_cli)
 
+    def convert_pak(self, source_path: Path, output_dir: Path, is_cli: bool = True):
+        """
+            Unpacks a single pak into a temp dir inside output_dir, converts it and removes the temp dir.
+
+        :param source_path: Pak file to convert
+        :param output_dir: Location to output converted files
+        :param is_cli: Flag to indicate if caller is command line or GUI
+        """
+        output_tmp = self._unpack_to_tmp(source_path, output_dir)
+        try:
+            self.convert(output_tmp, output_dir, is_cli)
+        finally:
+            shutil.rmtree(str(output_tmp), ignore_errors=True)
+
+    def convert_batch(self, pak_files: list[Path], output_dir: Path, is_cli: bool = True) -> list[Path]:
+        """
+            Converts many paks through a pipelined queue (unpack -> convert -> build -> cleanup).
+            Up to batch_concurrency paks are unpacked ahead while another one converts,
+            and unpacking waits while temp dirs would exceed batch_temp_limit_mb.
+
+        :param pak_files: Pak files to convert
+        :param output_dir: Location to output converted files
+        :param is_cli: Flag to indicate if caller is command line or GUI
+        :return: Paks that failed to convert
+        """
+        pak_files = [f for f in pak_files if self.is_pak(f)]
+        if not pak_files:
+            return []
+
+        RunLog.info(f'[batch] Converting {len(pak_files)} pak files:', Fore.CYAN)
+        batch_queue = PakBatchQueue(
+            unpack=lambda pak_file: self._unpack_to_tmp(pak_file, output_dir),
+            process=lambda pak_file, tmp_dir: self.convert(tmp_dir, output_dir, is_cli),
+            concurrency=self.batch_concurrency,
+            temp_limit_bytes=self.batch_temp_limit_mb * 1024 * 1024,
+            cancel=self.cancel_token
+        )
+        failed = batch_queue.run(pak_files)
+        RunLog.info(f'[batch] Converted {len(pak_files) - len(failed)}/{len(pak_files)} pak files', Fore.CYAN)
+        return failed
+
+    @staticmethod
+    def find_paks(source_path: Path) -> list[Path]:
+        if source_path is None or not source_path.is_dir():
+            return []
+        return sorted(f for f in source_path.iterdir() if f.is_file() and f.suffix == '.pak')
+
+    def find_projects(self, source_path: Path) -> list[Path]:
+        """
+            Dirs inside source_path build_tk_project builds projects from
+        """
+        if source_path is None or not source_path.is_dir():
+            return []
+        return [d for d in source_path.iterdir() if d.is_dir() and self.is_project_dir(d)]
+
     @staticmethod
     def is_project_dir(source_path: Path) -> bool:
         if not source_path.exists() or not source_path.is_dir():
@@ -60,6 +195,14 @@ class ConvertAPI:
                 return False
         return True
 
+    def cancel(self):
+        """
+            Stops the running conversion, unpack or aux db compile after the file it is working on.
+            The call running it raises ConvertCancelled once temp dirs and unfinished projects are removed.
+            Clients reset cancel_token before starting the next run.
+        """
+        self.cancel_token.cancel()
+
     def is_valid_source(self, source_path: Path) -> bool:
         return (source_path is not None
                 and source_path.exists()
@@ -73,60 +216,289 @@ class ConvertAPI:
 
     def unpack_file(self, source_path: Path, output_path: Path):
         if not self.is_pak(source_path):
-            print(f'{Fore.RED}[pak] Can\'t unpack {str(source_path)} (Not valid Pak file){Fore.RESET}')
+            RunLog.error(f'[pak] Can\'t unpack {str(source_path)} (Not valid Pak file)')
             return
 
         if output_path is None or not output_path.is_dir():
-            print(f'{Fore.RED}[pak] Can\'t unpack output to {str(output_path)} (Not valid dir){Fore.RESET}')
+            RunLog.error(f'[pak] Can\'t unpack output to {str(output_path)} (Not valid dir)')
             return
 
         self._unpack_internal(source_path, output_path)
 
     def convert_stat_files(self, source_path: Path):
-        print(f'{Fore.CYAN}[main] Converting Stats files:{Fore.RESET}')
-        for file in source_path.rglob('*.txt'):
-            if file.name in FORCE_FAIL:
-                print(f'{Fore.YELLOW}[info] Skipped file: {file.name} (Reason: Not yet supported){Fore.RESET}')
-                continue
-            elif file.full_match('**/Mods/*/Story/**'):
-                print(f'{Fore.YELLOW}[info] Skipped file: {file.name} (Reason: Osiris Script){Fore.RESET}')
-                continue
-            self._convert_internal(file, self._db['Stats'], self._stats_converter)
+        RunLog.info('[main] Converting Stats files:', Fore.CYAN)
+        files = list(source_path.rglob('*.txt'))
+        with self.progress.stage('stats', len(files)) as stage:
+            convert_files = []
+            for file in files:
+                self.cancel_token.check()
+                if file.name in FORCE_FAIL:
+                    self._skip_file(stage, file, 'Not yet supported')
+                    continue
+                elif file.full_match('**/Mods/*/Story/**'):
+                    self._skip_file(stage, file, 'Osiris Script')
+                    continue
+                convert_files.append(file)
 
-    def convert_lsx_files(self, source_path: Path):
-        print(f'\n{Fore.CYAN}[main] Converting LSX files:{Fore.RESET}')
-        for file in source_path.rglob('*.lsx'):
-            if file.name in FORCE_FAIL:
-                print(f'{Fore.YELLOW}[info] Skipped file: {file.name} (Reason: Not yet supported){Fore.RESET}')
-                continue
-            self._convert_internal(file, self._db['LSX'], self._lsx_converter)
+            if self.incremental_stats:
+                convert_files = self._plan_stats_rebuild(source_path, convert_files, stage)
+
+            try:
+                # files converted in worker processes can't be measured one by one
+                if self.pipeline_workers > 0 and not self._instruments():
+                    # huge files are split into chunks instead, one of them would hold up the whole pipeline
+                    chunked = [f for f in convert_files if self._stats_converter.use_chunks(f.stat().st_size)]
+                    self._convert_stats_pipelined([f for f in convert_files if f not in chunked], stage)
+                    convert_files = chunked
+                for file in convert_files:
+                    self.cancel_token.check()
+                    self._convert_internal(file, self._db['Stats'], self._stats_converter, stage)
+            finally:
+                self._stats_converter.close_chunk_pool()
+
+    def convert_lsx_files(self, source_path: Path, projects: list[Path] = None):
+        """
+        :param projects: Project dirs built afterwards. Their resources are converted to lsf once, by the
+            project build after rewriting paths, instead of here and again in the project.
+        """
+        RunLog.info('\n[main] Converting LSX files:', Fore.CYAN)
+        files = list(source_path.rglob('*.lsx'))
+        projects = projects or []
+        self._lsx_converter.deferred_lsf = []
+        with self.progress.stage('lsx', len(files)) as stage:
+            try:
+                for file in files:
+                    self.cancel_token.check()
+                    if file.name in FORCE_FAIL:
+                        self._skip_file(stage, file, 'Not yet supported')
+                        continue
+                    self._lsx_converter.defer_lsf = any(file.is_relative_to(p) for p in projects)
+                    # resources only need their lsf, tell them apart without parsing (mei files are built from the parsed data)
+                    if self._lsx_converter.defer_lsf and file.name not in EXCLUSIONS:
+                        region = peek_region_id(str(file))
+                        if region in self._lsx_converter.lsf_types and region != 'MultiEffectInfos':
+                            self._lsx_converter.deferred_lsf.append(str(file))
+                            self._skip_file(stage, file, 'Converted to LSF with the project')
+                            continue
+                    self._convert_internal(file, self._db['LSX'], self._lsx_converter, stage)
+            finally:
+                self._lsx_converter.defer_lsf = False
 
     def fix_locales(self, source_path: Path):
-        print(f'{Fore.CYAN}[main] Reviewing locale XML files:{Fore.RESET}')
-        for file in source_path.rglob('*.xml'):
-            if file.name[-8::] == '_fix.xml':
-                continue
-            if file.name in FORCE_FAIL:
-                print(f'{Fore.YELLOW}[info] Skipped file: {file.name} (Reason: Not yet supported){Fore.RESET}')
-                continue
-            self._locale_fixer.fix(file, self._lsx_converter)
+        RunLog.info('[main] Reviewing locale XML files:', Fore.CYAN)
+        files = [f for f in source_path.rglob('*.xml') if f.name[-8::] != '_fix.xml']
+        with self.progress.stage('locale', len(files)) as stage:
+            for file in files:
+                self.cancel_token.check()
+                if file.name in FORCE_FAIL:
+                    self._skip_file(stage, file, 'Not yet supported')
+                    continue
+                with self._file_scope(file):
+                    fixed = self._locale_fixer.fix(file, self.log_files)
+                if fixed:
+                    stage.file_done(file)
+                else:
+                    stage.file_skipped(file, 'Not a locale file')
 
     def build_tk_project(self, source_path: Path, output_dir: Path, is_cli: bool = True):
-        print(f'{Fore.CYAN}[main] Checking to construct tk project:{Fore.RESET}')
-        projects = []
+        RunLog.info('[main] Checking to construct tk project:', Fore.CYAN)
 
         if source_path is None or not source_path.is_dir():
-            print(f'{Fore.YELLOW}[info] Skipping construct tk project: {source_path} (Reason: Not a valid project dir){Fore.RESET}')
+            RunLog.info(f'[info] Skipping construct tk project: {source_path} (Reason: Not a valid project dir)', Fore.YELLOW)
             return
 
-        for dir_path in source_path.iterdir():
-            if dir_path.is_dir() and not dir_path in projects and self.is_project_dir(dir_path):
-                projects.append(dir_path)
+        projects = self.find_projects(source_path)
+
+        with self.progress.stage('project', len(projects)) as stage:
+            for project in projects:
+                self.cancel_token.check()
+                with self._file_scope(project):
+                    built = self._proj_builder.build(project, output_dir, is_cli, self.cancel_token)
+                if built:
+                    stage.file_done(project, 0)
+                else:
+                    stage.file_failed(project)
+                    self._convert_deferred_lsf(project)
+
+    def plan(self, source_path: Path, output_dir: Path, peek: bool = True, cancel: CancelToken = None) -> ConvertPlan:
+        """
+            Dry run of convert/convert_pak: a single scan counting the files every converter would touch,
+            projects that would be built and an estimated runtime from measured throughput.
+            Nothing is parsed or written, lsx files are only peeked at for their region id.
+
+        :param source_path: Dir or pak file that would be converted
+        :param output_dir: Location converted files would be written to
+        :param peek: Read the first bytes of lsx files to tell tbl, lsf and mei conversions apart
+        :param cancel: Stops the scan once set, the plan is returned with cancelled=True and no estimate
+        """
+        start = time.perf_counter()
+        plan = ConvertPlan(str(source_path), str(output_dir))
+        if self.is_pak(source_path):
+            size = source_path.stat().st_size
+            plan.paks.append({'name': source_path.name, 'path': str(source_path), 'bytes': size, 'files': None, 'unpacked_bytes': 0})
+            plan.total_files += 1
+            plan.total_bytes += size
+        elif source_path is not None and source_path.is_dir():
+            scan(plan, source_path, EXCLUSIONS, FORCE_FAIL, self._lsx_converter.lsf_types, peek, cancel)
+            if plan.cancelled:
+                return plan
+            plan.projects = sorted(str(d) for d in self.find_projects(source_path))
+
+        # counts of pak contents, by file type only (files, bytes)
+        pak_stats, pak_lsx, pak_locale, pak_unpacked = [0, 0], [0, 0], [0, 0], [0, 0]
+        for pak in plan.paks:
+            if cancel is not None and cancel.cancelled:
+                plan.cancelled = True
+                return plan
+            contents = self._list_pak(Path(pak['path']))
+            if contents is None:
+                pak_unpacked[0] += 1
+                pak_unpacked[1] += pak['bytes']
+                continue
+            pak['files'] = len(contents)
+            pak['unpacked_bytes'] = sum(size for _, size in contents)
+            pak_unpacked[0] += len(contents)
+            pak_unpacked[1] += pak['unpacked_bytes']
+            names = [name.replace('\\', '/') for name, _ in contents]
+            if any(n.startswith('Public/') for n in names) and any(n.startswith('Mods/') for n in names):
+                plan.projects.append(f'{pak["name"]} ({Path(pak["name"]).stem})')
+            for name, size in contents:
+                suffix = Path(name).suffix
+                counts = (pak_stats if suffix == '.txt'
+                          else pak_lsx if suffix == '.lsx' or self.lslib_util.is_lsx_family(suffix)
+                          else pak_locale if suffix in ['.xml', '.loca']
+                          else None)
+                if counts is not None:
+                    counts[0] += 1
+                    counts[1] += size
+
+        categories = plan.categories
+        stages = {
+            'unpack': pak_unpacked,
+            'stats': [categories[STATS].files + pak_stats[0], categories[STATS].bytes + pak_stats[1]],
+            'lsx': [sum(categories[c].files for c in [LSX_TBL, LSX_LSF, MEI]) + pak_lsx[0],
+                    sum(categories[c].bytes for c in [LSX_TBL, LSX_LSF, MEI]) + pak_lsx[1]],
+            'locale': [categories[LOCALE].files + pak_locale[0], categories[LOCALE].bytes + pak_locale[1]],
+            'project': [len(plan.projects), categories[COPY_ONLY].bytes]
+        }
+        for stage, (files, size) in stages.items():
+            plan.estimate[stage], plan.estimate_source[stage] = self.throughput.estimate(stage, files, size)
+        plan.scan_seconds = time.perf_counter() - start
+        return plan
+
+    def verify(self, source_path: Path) -> VerifyReport:
+        """
+            Converts two copies of the loose files and projects in source_path, one with the legacy converters
+            (serial, building xmltodict dicts without the stats model, see LegacyConvert) and one as configured
+            (pipeline, chunks, stats model and streaming writers), and compares the .tbl/.stats/.mei/_fix.xml outputs. Asset paths of project
+            files are rewritten with the legacy regex and AssetPathRewriter and compared too.
+            Nothing is written to source_path, resources are not converted to lsf and no project is built.
+        """
+        RunLog.info(f'[verify] Comparing reference and fast conversion of {source_path}', Fore.CYAN)
+        self.select_db(source_path)
+        with tempfile.TemporaryDirectory(prefix='verify_') as work_dir:
+            runs = {}
+            for run in ['reference', 'fast']:
+                run_dir = Path(work_dir) / run / source_path.name
+                shutil.copytree(source_path, run_dir, ignore=self._verify_ignore)
+                scratch_dir = Path(work_dir) / f'{run}_scratch'
+                api = self.spawn(scratch_dir)
+                api.log_files = False
+                api.incremental_stats = False
+                if run == 'reference':
+                    api.pipeline_workers = 0
+                    api._stats_converter = LegacyStatsConvert(api._db, api._aux_db, scratch_dir)
+                    api._lsx_converter = LegacyLSXconvert(api._db, api.lslib_util, scratch_dir)
+                    api._locale_fixer = LegacyFixLocale()
+                api.convert_stat_files(run_dir)
+                # every resource counts as part of a project, so none needs LSLib
+                api.convert_lsx_files(run_dir, [run_dir])
+                api.fix_locales(run_dir)
+                runs[run] = run_dir
+
+            report = compare_outputs(runs['reference'], runs['fast'])
+        return compare_asset_paths(self.find_projects(source_path), report)
+
+    def select_db(self, source_path: Path):
+        """
+            With db_version 'auto', switches to the registered definition set matching the game version
+            in the meta.lsx of the mods in source_path (the newest set when there is none)
+        """
+        if self.db_version != DB_VERSION_AUTO or self._db_registry is None:
+            return
+        game_version = find_game_version(source_path)
+        name = self._db_registry.select(game_version)
+        if name is None or name == getattr(self._db, 'version', None):
+            return
+        detected = 'not found' if game_version is None else format_game_version(game_version)
+        RunLog.info(f'[db] Game version {detected}, using definitions {name}', Fore.YELLOW)
+        self.set_db(self._db_registry.open(name))
 
-        self._proj_builder.build_all(projects, output_dir, is_cli)
+    def set_db(self, db):
+        # db is the db.json dict or a PatchDB of the registry
+        self._db = db
+        self._stats_converter.db = db
+        self._lsx_converter.db = db
+        self._stats_converter.close_chunk_pool()
 
     def refresh_aux_db(self):
-        self._aux_db = self._build_aux_db(self.src_bg3_path)
+        self.set_aux_db(self._build_aux_db(self.src_bg3_path, self.cancel_token))
+
+    def set_aux_db(self, aux_db):
+        # aux_db is a dict (auxdb.json) or an AuxDB (auxdb.sqlite)
+        self._aux_db = aux_db
+        self._stats_converter.auxdb = aux_db
+        self._stats_converter.close_chunk_pool()
+
+    def spawn(self, scratch_dir: Path) -> 'ConvertAPI':
+        """
+            Copy sharing the loaded db, aux db and LSLib, with its own converters and progress reporter,
+            so it can convert at the same time as this one. IDs recovered from stats files are
+            handed to the lsx converter in scratch_dir instead of path_to_root.
+
+        :param scratch_dir: Dir for temp files of the copy, created if missing
+        """
+        scratch_dir.mkdir(parents=True, exist_ok=True)
+        api = copy.copy(self)
+        api.progress = ProgressReporter()
+        api.cancel_token = CancelToken()
+        for instrument in api._instruments():
+            api.progress.subscribe(instrument)
+        api.progress.subscribe(api.throughput)
+        api._init_converters(scratch_dir)
+        return api
+
+    def write_run_report(self) -> Path:
+        """
+            Prints profile and memory summaries, writes the run metrics into path_to_root/profile/<time>,
+            closes the run log with a summary of errors and repeated warnings and starts collecting for the next run
+
+        :return: Report dir, None if neither profiling nor memory tracking is on
+        """
+        if not self._instruments():
+            self.run_log.close()
+            return None
+        # summaries are printed right away, after the messages still queued
+        RunLog.flush()
+        output_dir = self.path_to_root / 'profile' / time.strftime('%Y%m%d_%H%M%S')
+        output_dir.mkdir(parents=True, exist_ok=True)
+        metrics = {}
+        if self.profiler is not None:
+            self.profiler.print_summary(self.profile_top)
+            self.profiler.write(output_dir, self.profile_top)
+            metrics['profile'] = self.profiler.report(self.profile_top)
+            self.profiler.reset()
+        if self.memory_tracker is not None:
+            self.memory_tracker.print_summary(self.profile_top)
+            with open(output_dir / 'memory.json', 'w', encoding='utf-8') as f:
+                json.dump(self.memory_tracker.all_files(), f, indent=4)
+            metrics['memory'] = self.memory_tracker.report(self.profile_top)
+            self.memory_tracker.reset()
+        with open(output_dir / 'metrics.json', 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=4)
+        RunLog.info(f'[profile] Run metrics written to {output_dir}', Fore.CYAN)
+        self.run_log.close()
+        return output_dir
     #endregion
 
     # region Private helper functions
@@ -134,70 +506,283 @@ class ConvertAPI:
     def _is_file_guid(file: str) -> bool:
         return len(file) == 36 and file[8:9:] == "-" and file[13:14:] == "-" and file[18:19:] == "-" and file[23:24:] == "-"
 
-    def _get_auxiliary_db(self, src_bg3_path: str, compile_aux_db: bool) -> dict:
+    def _get_auxiliary_db(self, src_bg3_path: str, compile_aux_db: bool):
         try:
             if compile_aux_db:
                 return self._build_aux_db(src_bg3_path)
+            elif self.aux_db_format == AUX_SQLITE:
+                RunLog.info('[config] bg3.exe found\n[db] Opening auxiliary ID Database...', Fore.YELLOW)
+                return self._open_aux_store()
             else:
-                print(f'{Fore.YELLOW}[config] bg3.exe found\n[db] Loading auxiliary ID Database...{Fore.RESET}')
+                RunLog.info('[config] bg3.exe found\n[db] Loading auxiliary ID Database...', Fore.YELLOW)
                 with open(self.path_to_root / 'auxdb.json', encoding="utf-8") as aux_db_data:
                     return json.load(aux_db_data)
         except FileNotFoundError:
             return {}
 
-    @staticmethod
-    def _build_aux_db(src_bg3_path: str):
+    # auxdb.sqlite, filled from an existing auxdb.json the first time so switching formats needs no compile
+    def _open_aux_store(self) -> AuxDB:
+        store = AuxDB(self.path_to_root / AUX_DB_FILE)
+        json_file = self.path_to_root / 'auxdb.json'
+        if not store.recorded_files() and json_file.is_file():
+            RunLog.info(f'[db] Importing auxdb.json into {AUX_DB_FILE}...', Fore.YELLOW)
+            store.import_json(json_file)
+        return store
+
+    def _build_aux_db(self, src_bg3_path: str, cancel: CancelToken = None):
         # Check if bg3 path valid
         if not Path(f"{src_bg3_path}/bin/bg3.exe").is_file():
             raise FileNotFoundError('')
 
         compdb = CompileDB(src_bg3_path)
-        print(f'{Fore.YELLOW}[config] bg3.exe found\n[db] Compiling auxiliary ID Database...{Fore.RESET}')
-        return compdb.compileAuxiliaryDB()
+        RunLog.info('[config] bg3.exe found\n[db] Compiling auxiliary ID Database...', Fore.YELLOW)
+        store = AuxDB(self.path_to_root / AUX_DB_FILE) if self.aux_db_format == AUX_SQLITE else None
+        return compdb.compileAuxiliaryDB(cancel=cancel, store=store)
+
+    def _init_converters(self, root_path: Path):
+        self._stats_converter = StatsConvert(self._db, self._aux_db, root_path)
+        self._stats_converter.chunk_threshold_kb = self.stats_chunk_threshold_kb
+        self._stats_converter.chunk_workers = self.stats_chunk_workers
+        self._lsx_converter = LSXconvert(self._db, self.lslib_util, root_path)
+        self._locale_fixer = FixLocale()
+        self._proj_builder = ProjectBuilder(self.path_to_templates, self._lsx_converter,
+                                            self.build_pak, self.pak_compression, self.pak_workers)
 
-    def _get_db(self) -> dict:
+    @staticmethod
+    def _verify_ignore(directory: str, names: list[str]) -> list[str]:
+        return [name for name in names
+                if Path(directory, name).is_file() and (Path(name).suffix not in VERIFY_SOURCES or name.endswith('_fix.xml'))]
+
+    def _get_db(self):
+        if self.db_version:
+            registry_file = self.path_to_root / DB_REGISTRY_FILE
+            if registry_file.is_file():
+                self._db_registry = DBRegistry(registry_file)
+                name = self._db_registry.select() if self.db_version == DB_VERSION_AUTO else self.db_version
+                try:
+                    if name is not None:
+                        RunLog.info(f'[db] Using definitions {name} from {DB_REGISTRY_FILE}', Fore.YELLOW)
+                        return self._db_registry.open(name)
+                except KeyError as e:
+                    RunLog.error(f'[db] {e.args[0]}, falling back to db.json')
+            else:
+                RunLog.error(f'[db] {DB_REGISTRY_FILE} not found, falling back to db.json')
         with open(self.path_to_root / 'db.json', encoding="utf-8") as db_data:
             return json.load(db_data)
 
-    def _convert_internal(self, file: Path, db: dict, converter) -> None:
+    def _skip_file(self, stage: StageTracker, file: Path, reason: str):
+        if self.log_files:
+            RunLog.info(f'[info] Skipped file: {file.name} (Reason: {reason})', Fore.YELLOW)
+        stage.file_skipped(file, reason)
+
+    def _convert_internal(self, file: Path, db: dict, converter, stage: StageTracker = None) -> None:
         if file.name in EXCLUSIONS:
+            if stage is not None:
+                stage.file_skipped(file, 'Excluded')
             return None
         try:
-            fuuid = db.get(file.name.split('.')[0].replace('Spell_', ''), None)
+            fuuid = self._get_file_uuid(file, db)
             converter.setUUID(fuuid)
-            chk = converter.convert(str(file))
-            if chk:
-                if fuuid is None:
-                    print(f'{Fore.YELLOW}[info] Converted {file.name} (No UUID found: Incorrect filename){Fore.RESET}')
-                else:
-                    print(f'{Fore.GREEN}[info] Converted {file.name} (UUID: {fuuid}){Fore.RESET}')
+            with self._file_scope(file):
+                chk = converter.convert(str(file))
+            self._converted(file, fuuid, chk, stage)
         except Exception as e:
-            if self._is_file_guid(file.name.split(".")[0]):
-                print(f'{Fore.YELLOW}[info] Skipped file: {file.name} (Reason: Cannot convert binary){Fore.WHITE}')
-            else:
-                print(f'{Fore.RED}[info] Failed to convert {file.name}:\n\tError: {e}\n\tFile: {file}{Fore.RESET}')
+            self._convert_failed(file, e, stage)
         return None
 
+    def _convert_stats_pipelined(self, files: list[Path], stage: StageTracker = None):
+        """
+            Same as _convert_internal on every stats file, but reads, conversions and writes overlap:
+            files are prefetched on threads, convert_all runs on a process pool and outputs are
+            written by writer threads.
+        """
+        for file in files:
+            if file.name in EXCLUSIONS and stage is not None:
+                stage.file_skipped(file, 'Excluded')
+        files = [f for f in files if f.name not in EXCLUSIONS]
+        db = self._db['Stats']
+        recovered = {}
+
+        def read(file: Path):
+            # same newline handling as reading in text mode
+            text = file.read_bytes().decode('utf-8-sig').replace('\r\n', '\n').replace('\r', '\n')
+            return str(file), text, self._get_file_uuid(file, db)
+
+        def write(file: Path, result):
+            out, xml, aux_id_fix, records = result
+            RunLog.replay(records)
+            recovered[file] = aux_id_fix
+            if out is not None:
+                with open(out, 'wb') as f:
+                    f.write(xml)
+
+        pipeline = ConvertPipeline(
+            transform_workers=self.pipeline_workers,
+            max_pending=self.pipeline_max_pending,
+            initializer=Stats2kit.init_worker,
+            initargs=(self._db, self._aux_db)
+        )
+        completed = pipeline.run(
+            files,
+            read=read,
+            transform=Stats2kit.convert_worker,
+            write=write,
+            on_done=lambda file, result: self._converted(file, self._get_file_uuid(file, db), result[0] is not None, stage),
+            on_error=lambda file, e: self._convert_failed(file, e, stage),
+            cancel=self.cancel_token
+        )
+        if not completed:
+            self.cancel_token.check()
+
+        # the lsx converter picks up IDs recovered from the last converted stats file
+        for file in reversed(files):
+            if file in recovered:
+                self._stats_converter.save_recovered(recovered[file])
+                break
+
+    def _plan_stats_rebuild(self, source_path: Path, files: list[Path], stage: StageTracker) -> list[Path]:
+        # files outside the rebuild set keep their current output and are reported as skipped
+        graph = StatsGraph(self.path_to_root / 'stats_graph.json')
+        outputs = {str(f): Path(StatsConvert.output_path(str(f))) for f in files}
+        rebuild_plan = graph.plan(files, source_path, fingerprint(self._db, self._aux_db), outputs=outputs)
+        rebuild_plan.print_summary(self.log_files)
+        graph.save()
+        rebuild = []
+        for file in files:
+            if str(file) in rebuild_plan.rebuild:
+                rebuild.append(file)
+            else:
+                self._skip_file(stage, file, 'Up to date')
+        return rebuild
+
+    def _convert_deferred_lsf(self, project: Path):
+        # project was skipped or failed, its resources still get the lsf next to them they had before deferring
+        files = [f for f in self._lsx_converter.deferred_lsf if Path(f).is_relative_to(project)]
+        if not files:
+            return
+        RunLog.info(f'[Project] Converting {len(files)} resources of {project.name} to LSF in place', Fore.YELLOW)
+        for failed_file in self._lsx_converter.lsx2lsf_batch(files):
+            RunLog.warning(f'[Project] Could not convert {Path(failed_file).name} to LSF', 'Could not convert to LSF', file=Path(failed_file).name)
+
+    def _list_pak(self, pak_file: Path) -> list[tuple[str, int]]:
+        # pak index, only the files unpacking would extract (None without LSLib)
+        if self.lslib_util is None:
+            return None
+        try:
+            contents = self.lslib_util.list_package(pak_file)
+        except Exception as e:
+            RunLog.warning(f'[plan] Can\'t list {pak_file.name}: {e}', 'Can\'t list pak', file=pak_file.name)
+            return None
+        if self.unpack_mode == UNPACK_SELECTIVE:
+            contents = [(name, size) for name, size in contents if self.lslib_util.matches_patterns(name, self.unpack_patterns)]
+        return contents
+
+    def _instruments(self) -> list:
+        return [i for i in (self.profiler, self.memory_tracker) if i is not None]
+
+    def _file_scope(self, file: Path) -> ExitStack:
+        # attributes the work in the block to file when profiling or tracking memory
+        scope = ExitStack()
+        for instrument in self._instruments():
+            scope.enter_context(instrument.file(file))
+        return scope
+
+    @staticmethod
+    def _get_file_uuid(file: Path, db: dict):
+        return db.get(file.name.split('.')[0].replace('Spell_', ''), None)
+
+    def _converted(self, file: Path, fuuid: str, chk: bool, stage: StageTracker = None):
+        if chk and self.log_files:
+            if fuuid is None:
+                RunLog.info(f'[info] Converted {file.name} (No UUID found: Incorrect filename)', Fore.YELLOW)
+            else:
+                RunLog.info(f'[info] Converted {file.name} (UUID: {fuuid})')
+        if stage is not None:
+            stage.file_done(file)
+
+    def _convert_failed(self, file: Path, e: Exception, stage: StageTracker = None):
+        if self._is_file_guid(file.name.split(".")[0]):
+            if self.log_files:
+                RunLog.info(f'[info] Skipped file: {file.name} (Reason: Cannot convert binary)', Fore.YELLOW)
+            if stage is not None:
+                stage.file_skipped(file, 'Cannot convert binary')
+        else:
+            RunLog.error(f'[info] Failed to convert {file.name}:\n\tError: {e}\n\tFile: {file}')
+            if stage is not None:
+                stage.file_failed(file, e)
+
+    def _unpack_to_tmp(self, source_file: Path, output_dir: Path) -> Path:
+        output_tmp = output_dir / f'tmp_{uuid.uuid4()}'
+        pak_tmp = output_tmp / source_file.stem
+        pak_tmp.mkdir(parents=True, exist_ok=True)
+        try:
+            self.unpack_file(source_file, pak_tmp)
+        except BaseException:
+            shutil.rmtree(str(output_tmp), ignore_errors=True)
+            raise
+        return output_tmp
+
     def _unpack_internal(self, source_file: Path, output_path: Path, verbose=True):
         # unpack file
-        self.lslib_util.uncompress_package(source_file, output_path)
+        if self.unpack_mode == UNPACK_SELECTIVE:
+            file_list = self._unpack_selective(source_file, output_path, verbose)
+        else:
+            self.lslib_util.uncompress_package(source_file, output_path)
+            file_list = [f for f in output_path.resolve().glob('**/*') if f.is_file()]
 
         # convert binaries to lsx, loca to xml
-        file_list = [f for f in output_path.resolve().glob('**/*') if f.is_file()]
-        for file in file_list:
-            converted = False
-            resolved_file = file.resolve()
-            if self.lslib_util.is_lsx_family(resolved_file.suffix):
-                self.lslib_util.convert_file(resolved_file, resolved_file.with_suffix(resolved_file.suffix + '.lsx'))
-                converted = True
-            elif self.lslib_util.is_loca_type(resolved_file.suffix):
-                self.lslib_util.convert_loca_file(resolved_file, resolved_file.with_suffix(resolved_file.suffix + '.xml'))
-                converted = True
-
-            # if converted type, remove original file
-            if converted:
-                file.unlink(True)
+        with self.progress.stage('unpack', len(file_list)) as stage:
+            binaries = []
+            for file in file_list:
+                self.cancel_token.check()
+                resolved_file = file.resolve()
+                size = resolved_file.stat().st_size
+                if self.lslib_util.is_lsx_family(resolved_file.suffix):
+                    binaries.append((file, resolved_file, size))
+                    continue
+                if self.lslib_util.is_loca_type(resolved_file.suffix):
+                    self.lslib_util.convert_loca_file(resolved_file, resolved_file.with_suffix(resolved_file.suffix + '.xml'))
+                    file.unlink(True)
+                stage.file_done(file, size)
+
+            # binaries go through LSLib in batches, one interop call per batch
+            for start in range(0, len(binaries), CONVERT_BATCH_SIZE):
+                self.cancel_token.check()
+                batch = binaries[start:start + CONVERT_BATCH_SIZE]
+                errors = self.lslib_util.convert_files([(r, r.with_suffix(r.suffix + '.lsx')) for _, r, _ in batch])
+                for (file, resolved_file, size), error in zip(batch, errors):
+                    if error is None:
+                        file.unlink(True)
+                        stage.file_done(file, size)
+                    else:
+                        RunLog.error(f'[info] Failed to convert {file.name}:\n\tError: {error}\n\tFile: {file}')
+                        stage.file_failed(file, Exception(error))
 
         if verbose:
-            print(f'{Fore.GREEN}[info] Unpacked {source_file.name} (Out dir) {str(output_path)}{Fore.RESET}')
+            RunLog.info(f'[info] Unpacked {source_file.name} (Out dir) {str(output_path)}')
+
+    def _unpack_selective(self, source_file: Path, output_path: Path, verbose=True) -> list[Path]:
+        """
+            Lists the package first and extracts only files matching unpack_patterns.
+            Assets that never need conversion are skipped, so they won't be part of a built project.
+
+        :return: Extracted files
+        """
+        wanted = set()
+        skipped_count = 0
+        skipped_bytes = 0
+        for name, size in self.lslib_util.list_package(source_file):
+            if self.lslib_util.matches_patterns(name, self.unpack_patterns):
+                wanted.add(name)
+            else:
+                skipped_count += 1
+                skipped_bytes += size
+
+        if wanted:
+            self.lslib_util.uncompress_package_filtered(source_file, output_path, lambda name: name in wanted)
+        if verbose and skipped_count:
+            RunLog.info(f'[pak] Skipped {skipped_count} asset files ({skipped_bytes / 1024 / 1024:.1f} MB) in {source_file.name}', Fore.YELLOW)
+
+        file_list = [output_path.resolve() / name for name in sorted(wanted)]
+        return [f for f in file_list if f.is_file()]
     # endregion
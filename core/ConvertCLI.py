@@ -1,22 +1,74 @@
+import json
+import signal
+import sys
 from pathlib import Path
 
+from colorama import Fore
+
 from core.ConvertAPI import ConvertAPI
+from helpers import RunLog
+from helpers.CancelToken import ConvertCancelled
+from helpers.ProgressEvents import ConsoleProgressBar
 
 
 # Seems tad overkill, but if CLI options are expanded this will control that flow
 class ConvertCLI:
     def __init__(self,
                  convert_api: ConvertAPI,
-                 path_to_root: Path):
+                 path_to_root: Path,
+                 show_progress: bool = False,
+                 dry_run: bool = False,
+                 verify: bool = False):
         self.convert_api = convert_api
         self.path_to_root = path_to_root
+        self.show_progress = show_progress
+        self.dry_run = dry_run
+        self.verify = verify
 
     def run(self):
         """
             Might have more logic in the future, for now this is hard-coded to run
-            conversion logic on local "convert" folder and output result to the same
+            conversion logic on local "convert" folder and output result to the same.
+            Pak files placed directly in the folder are converted as a batch afterwards.
         """
         cli_path = self.path_to_root / 'convert'
         if not cli_path.exists():
             cli_path.mkdir(parents=True, exist_ok=True)
-        self.convert_api.convert(cli_path, cli_path, True)
+
+        if self.dry_run:
+            self.convert_api.plan(cli_path, cli_path).print_summary()
+            return
+
+        if self.verify:
+            report = self.convert_api.verify(cli_path)
+            self.convert_api.write_run_report()
+            report.print_summary()
+            with open(self.path_to_root / 'verify.json', 'w', encoding='utf-8') as f:
+                json.dump(report.to_dict(), f, indent=4)
+            # non zero exit code for CI
+            if not report.ok:
+                sys.exit(1)
+            return
+
+        progress_bar = ConsoleProgressBar() if self.show_progress else None
+        if progress_bar is not None:
+            self.convert_api.progress.subscribe(progress_bar)
+        # first Ctrl+C cancels after the current file and cleans up, a second one aborts right away
+        self.convert_api.cancel_token.reset()
+        previous_handler = signal.signal(signal.SIGINT, self._on_interrupt)
+        try:
+            self.convert_api.convert(cli_path, cli_path, True)
+            self.convert_api.convert_batch(self.convert_api.find_paks(cli_path), cli_path, True)
+        except ConvertCancelled:
+            RunLog.warning('[main] Conversion cancelled')
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+            if progress_bar is not None:
+                self.convert_api.progress.unsubscribe(progress_bar)
+            self.convert_api.write_run_report()
+
+    def _on_interrupt(self, signum, frame):
+        if self.convert_api.cancel_token.cancelled:
+            raise KeyboardInterrupt
+        print(f'\n{Fore.YELLOW}[main] Cancelling after the current file, press Ctrl+C again to abort{Fore.RESET}')
+        self.convert_api.cancel()
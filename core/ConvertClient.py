@@ -0,0 +1,126 @@
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from colorama import Fore
+
+
+# Thin client for ConvertService, only needs the standard library and colorama
+class ConvertClient:
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, timeout: float = 10):
+        self.url = f'http://{host}:{port}'
+        self.timeout = timeout
+
+    def submit(self, job_type: str, source: Path = None, output: Path = None) -> dict:
+        # the service may run in another working dir, so always send absolute paths
+        body = {'type': job_type,
+                'source': None if source is None else str(Path(source).resolve()),
+                'output': None if output is None else str(Path(output).resolve())}
+        return self._request('POST', '/jobs', body)
+
+    def job(self, job_id: str, wait: float = None) -> dict:
+        path = f'/jobs/{job_id}' if wait is None else f'/jobs/{job_id}?wait={wait}'
+        return self._request('GET', path, timeout=self.timeout + (wait or 0))
+
+    def wait(self, job_id: str, poll: float = 60) -> dict:
+        """
+            Blocks until the job finished
+        """
+        while True:
+            job = self.job(job_id, poll)
+            if job['status'] in ('done', 'failed', 'cancelled'):
+                return job
+
+    def cancel(self, job_id: str) -> dict:
+        return self._request('POST', f'/jobs/{job_id}/cancel', {})
+
+    def jobs(self) -> list[dict]:
+        return self._request('GET', '/jobs')
+
+    def status(self) -> dict:
+        return self._request('GET', '/status')
+
+    def shutdown(self) -> dict:
+        return self._request('POST', '/shutdown', {})
+
+    def _request(self, method: str, path: str, body: dict = None, timeout: float = None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read() or b'{}').get('error', str(e))) from None
+
+
+def print_job(job: dict):
+    color = {'done': Fore.GREEN, 'failed': Fore.RED, 'cancelled': Fore.YELLOW}.get(job['status'], Fore.CYAN)
+    duration = '' if job['duration'] is None else f' in {job["duration"]:.1f}s'
+    print(f'{color}[client] Job {job["id"]} ({job["type"]}) {job["status"]}{duration}{Fore.RESET}')
+    for stage, counts in job['stages'].items():
+        print(f'\t{stage}: {counts["done"]} done, {counts["skipped"]} skipped, {counts["failed"]} failed')
+    if job['error']:
+        print(f'{Fore.RED}\tError: {job["error"]}{Fore.RESET}')
+    for key, value in job['result'].items():
+        print(f'\t{key}: {value}')
+
+
+# Client cli: py -m core.ConvertClient <command> ...
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='ConvertClient', description='Submit jobs to a running Convert2Toolkit service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for job_type in ['convert', 'unpack', 'build']:
+        command = commands.add_parser(job_type, help=f'Submit a {job_type} job')
+        command.add_argument('source', type=Path)
+        command.add_argument('output', type=Path)
+        command.add_argument('--wait', action='store_true', help='Wait for the job and print its result')
+    command = commands.add_parser('compile_aux', help='Rebuild the auxiliary ID database of the service')
+    command.add_argument('--wait', action='store_true', help='Wait for the job and print its result')
+    command = commands.add_parser('job', help='Show a job')
+    command.add_argument('id')
+    command.add_argument('--wait', action='store_true', help='Wait for the job to finish')
+    command = commands.add_parser('cancel', help='Cancel a queued or running job')
+    command.add_argument('id')
+    command.add_argument('--wait', action='store_true', help='Wait until the job stopped')
+    commands.add_parser('jobs', help='List all jobs')
+    commands.add_parser('status', help='Show service status')
+    commands.add_parser('shutdown', help='Stop the service')
+    args = parser.parse_args()
+
+    client = ConvertClient(args.host, args.port)
+    try:
+        if args.command in ['convert', 'unpack', 'build', 'compile_aux']:
+            if args.command == 'compile_aux':
+                job = client.submit(args.command)
+            else:
+                job = client.submit(args.command, args.source, args.output)
+            if args.wait:
+                job = client.wait(job['id'])
+            print_job(job)
+            if job['status'] == 'failed':
+                sys.exit(1)
+        elif args.command == 'job':
+            job = client.wait(args.id) if args.wait else client.job(args.id)
+            print_job(job)
+        elif args.command == 'cancel':
+            job = client.cancel(args.id)
+            if args.wait:
+                job = client.wait(args.id)
+            print_job(job)
+        elif args.command == 'jobs':
+            for job in client.jobs():
+                print_job(job)
+        else:
+            print(json.dumps(getattr(client, args.command)(), indent=4))
+    except (urllib.error.URLError, ConnectionError) as e:
+        print(f'{Fore.RED}[client] Service not reachable at {client.url}: {e}{Fore.RESET}')
+        sys.exit(2)
+    except RuntimeError as e:
+        print(f'{Fore.RED}[client] {e}{Fore.RESET}')
+        sys.exit(1)
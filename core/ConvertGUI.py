@@ -1,12 +1,11 @@
-import shutil
 import sys
-import uuid
 from pathlib import Path
 
 from PyQt6.QtCore import (
     Qt,
     QTimer,
     QThread,
+    pyqtSignal,
     pyqtSlot,
     QUrl
 )
@@ -19,11 +18,15 @@ from PyQt6.QtWidgets import (
     QWidget,
     QLabel,
     QApplication,
-    QHBoxLayout, QSizePolicy,
+    QHBoxLayout, QSizePolicy, QProgressBar,
 )
 from pyqtwaitingspinner import SpinnerParameters, WaitingSpinner
 
 from core import ConvertAPI
+from helpers import RunLog
+from helpers.CancelToken import CancelToken, ConvertCancelled
+from helpers.ConvertPlan import COPY_ONLY, LOCALE, LSX_LSF, LSX_TBL, MEI, SKIPPED, STATS, format_duration
+from helpers.ProgressEvents import ProgressEvent, ProgressKind
 
 STYLE_CLASS = "class"
 DEFAULT_STYLE = "default"
@@ -34,6 +37,7 @@ INVALID_STYLE = "invalid"
 HIGHLIGHT_STYLE = "highlight"
 MENU_STYLE = "menu"
 MENU_BUTTON_STYLE = "menu_button"
+SOURCE_SEPARATOR = ";"
 
 
 def add_classes(element: QWidget, *args):
@@ -63,6 +67,10 @@ def remove_classes(element: QWidget, *args):
         element.setStyleSheet(style_sheet)
 
 
+def split_source_paths(path_text: str) -> list[Path]:
+    return [Path(p.strip()).resolve() for p in path_text.split(SOURCE_SEPARATOR) if p.strip()]
+
+
 # custom input to support drag-n-drop
 class DragNDropQLabel(QLabel):
     text_input = None
@@ -90,9 +98,14 @@ class DragNDropQLabel(QLabel):
 
     def dropEvent(self, event):
         remove_classes(self, HIGHLIGHT_STYLE)
-        url = event.mimeData().urls()[0]
-        drop_path = Path(url.toLocalFile())
+        drop_paths = [Path(url.toLocalFile()) for url in event.mimeData().urls()]
+
+        # multiple paks dropped at once are queued as a batch
+        if self.allow_paks and len(drop_paths) > 1 and all(self.convert_api.is_pak(p) for p in drop_paths):
+            self.text_input.setText(SOURCE_SEPARATOR.join(str(p.resolve()) for p in drop_paths))
+            return
 
+        drop_path = drop_paths[0]
         if drop_path.is_dir() or (self.allow_paks and self.convert_api.is_pak(drop_path)):
             self.text_input.setText(str(drop_path.resolve()))
         else:
@@ -101,6 +114,9 @@ class DragNDropQLabel(QLabel):
 
 # thread object to support converting
 class ConvertQThread(QThread):
+    # forwards ConvertAPI progress events to the ui thread
+    progress_event = pyqtSignal(object)
+
     def __init__(self, parent,
                  convert_api: ConvertAPI,
                  source_path_input: str,
@@ -111,18 +127,30 @@ class ConvertQThread(QThread):
         self.output_path_input: str = output_path_input
 
     def run(self):
-        source_path: Path = Path(self.source_path_input).resolve()
+        self.convert_api.cancel_token.reset()
+        self.convert_api.progress.subscribe(self.progress_event.emit)
+        try:
+            self._run_convert()
+        except ConvertCancelled:
+            RunLog.warning('[main] Conversion cancelled')
+        finally:
+            self.convert_api.progress.unsubscribe(self.progress_event.emit)
+            self.convert_api.write_run_report()
+
+    def _run_convert(self):
+        source_paths: list[Path] = split_source_paths(self.source_path_input)
         output_path: Path = Path(self.output_path_input).resolve()
 
+        if len(source_paths) > 1:
+            self.convert_api.convert_batch(source_paths, output_path, False)
+            return
+
+        source_path = source_paths[0]
         if self.convert_api.is_pak(source_path):
-            output_tmp = output_path / f'tmp_{uuid.uuid4()}'
-            pak_tmp = output_tmp / source_path.stem
-            pak_tmp.mkdir(parents=True, exist_ok=True)
-            self.convert_api.unpack_file(source_path, pak_tmp)
-            self.convert_api.convert(output_tmp, output_path, False)
-            shutil.rmtree(str(output_tmp))
+            self.convert_api.convert_pak(source_path, output_path, False)
         else:
             self.convert_api.convert(source_path, output_path, False)
+            self.convert_api.convert_batch(self.convert_api.find_paks(source_path), output_path, False)
 
 
 # thread object to support compiling auxdb
@@ -133,7 +161,74 @@ class CompileQThread(QThread):
         self.convert_api: ConvertAPI = convert_api
 
     def run(self):
-        self.convert_api.refresh_aux_db()
+        self.convert_api.cancel_token.reset()
+        try:
+            self.convert_api.refresh_aux_db()
+        except ConvertCancelled:
+            RunLog.warning('[db] Compiling auxiliary ID Database cancelled')
+
+
+# thread object checking the path inputs and pre-scanning the source, so slow drives
+# or network shares don't freeze the window. Every check has a request id, the window
+# drops results of requests that were replaced by newer input while they ran.
+class ValidateQThread(QThread):
+    # request id, source valid, output valid
+    validated = pyqtSignal(int, bool, bool)
+    # request id, preview text for the source
+    previewed = pyqtSignal(int, str)
+
+    def __init__(self, parent,
+                 convert_api: ConvertAPI,
+                 request_id: int,
+                 source_path_input: str,
+                 output_path_input: str):
+        super().__init__(parent)
+        self.convert_api: ConvertAPI = convert_api
+        self.request_id: int = request_id
+        self.source_path_input: str = source_path_input
+        self.output_path_input: str = output_path_input
+        self.cancel_token = CancelToken()
+
+    def cancel(self):
+        # a call stuck on the filesystem can't be interrupted, its result is dropped by request id instead
+        self.cancel_token.cancel()
+
+    def run(self):
+        source_paths = split_source_paths(self.source_path_input)
+        if len(source_paths) > 1:
+            valid_source = all(self.convert_api.is_pak(p) for p in source_paths)
+        else:
+            valid_source = len(source_paths) == 1 and self.convert_api.is_valid_source(source_paths[0])
+        output_path = Path(self.output_path_input)
+        valid_output = bool(self.output_path_input) and output_path.exists() and output_path.is_dir()
+        if self.cancel_token.cancelled:
+            return
+        self.validated.emit(self.request_id, valid_source, valid_output)
+
+        if valid_source:
+            preview = self._preview(source_paths, output_path)
+            if preview is not None and not self.cancel_token.cancelled:
+                self.previewed.emit(self.request_id, preview)
+
+    def _preview(self, source_paths: list[Path], output_path: Path) -> str:
+        if len(source_paths) > 1:
+            size = sum(p.stat().st_size for p in source_paths)
+            return f'{len(source_paths)} pak files, {size / 1024 / 1024:.1f} MB'
+
+        # lsx files are not peeked at here, the preview only needs counts per file type
+        plan = self.convert_api.plan(source_paths[0], output_path, peek=False, cancel=self.cancel_token)
+        if plan.cancelled:
+            return None
+        categories = plan.categories
+        lsx = sum(categories[c].files for c in [LSX_TBL, LSX_LSF, MEI])
+        counts = [f'{categories[STATS].files} stats', f'{lsx} lsx', f'{categories[LOCALE].files} locale',
+                  f'{categories[COPY_ONLY].files} other', f'{categories[SKIPPED].files} skipped']
+        preview = f'{plan.total_files} files, {plan.total_bytes / 1024 / 1024:.1f} MB: {", ".join(counts)}'
+        if plan.paks:
+            preview += f' - {len(plan.paks)} pak files'
+        if plan.projects:
+            preview += f' - {len(plan.projects)} projects'
+        return f'{preview} - est. {format_duration(plan.estimated_seconds)}'
 
 
 # timer used for delay before validating source/output fields
@@ -198,6 +293,14 @@ class ConverterUIWindow(QMainWindow):
         self.convert_button.clicked.connect(self.run_convert)
         self.enable_convert_button(False)
 
+        # stops a running conversion or aux db compile, only shown while one runs
+        self.cancel_button = QPushButton("Cancel")
+        add_classes(self.cancel_button, DEFAULT_STYLE)
+        self.cancel_button.setToolTip("Stop after the current file and remove unfinished output")
+        # noinspection PyUnresolvedReferences
+        self.cancel_button.clicked.connect(self.cancel_running)
+        self.cancel_button.setVisible(False)
+
         # compile aux db button
         self.compile_button = QPushButton("Compile AuxDB")
         add_classes(self.compile_button, MENU_BUTTON_STYLE)
@@ -225,6 +328,12 @@ class ConverterUIWindow(QMainWindow):
         )
         self.spinner = WaitingSpinner(self.convert_button, spin_pars)
 
+        # progress bar fed by convert thread progress events
+        self.progress_bar = QProgressBar()
+        add_classes(self.progress_bar, DEFAULT_STYLE)
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setVisible(False)
+
         # ui group for menu buttons
         self.menu_container = QHBoxLayout()
         self.menu_container.setAlignment(Qt.AlignmentFlag.AlignVCenter)
@@ -261,13 +370,21 @@ class ConverterUIWindow(QMainWindow):
         add_classes(self.output_container_widget, OUTPUT_STYLE, CONVERT_SOURCE_STYLE)
 
         # hint label for user on input
-        self.convert_info_label = QLabel("Drop pak file/directory or enter path to convert")
+        self.convert_info_label = QLabel("Drop pak file(s)/directory or enter path to convert")
         add_classes(self.convert_info_label, DEFAULT_STYLE, HINT_LABEL)
 
         # hint label for user on output
         self.output_info_label = QLabel("Drop directory or enter path for output")
         add_classes(self.output_info_label, DEFAULT_STYLE, HINT_LABEL)
 
+        # preview of the source contents, filled in by the validate thread
+        self.preview_label = QLabel("")
+        add_classes(self.preview_label, DEFAULT_STYLE, HINT_LABEL)
+
+        # latest path check, results of older ones are ignored
+        self._validate_request: int = 0
+        self._validate_qthread: ValidateQThread = None
+
         # setup main container for window
         self.main_container = QVBoxLayout()
         self.main_container.setAlignment(Qt.AlignmentFlag.AlignTop)
@@ -276,7 +393,10 @@ class ConverterUIWindow(QMainWindow):
         self.main_container.addWidget(self.convert_container_widget)
         self.main_container.addWidget(self.output_info_label)
         self.main_container.addWidget(self.output_container_widget)
+        self.main_container.addWidget(self.preview_label)
         self.main_container.addWidget(self.convert_button)
+        self.main_container.addWidget(self.cancel_button)
+        self.main_container.addWidget(self.progress_bar)
 
         # assemble central widget
         self.widget = QWidget()
@@ -290,29 +410,31 @@ class ConverterUIWindow(QMainWindow):
             self.output_text_input.setText(str(default_output_path.resolve()))
 
     def validate_paths(self):
-        valid_source = self.check_source_path()
-        valid_output = self.check_output_path()
-        if valid_source and valid_output:
-            self.enable_convert_button(True)
-
-    def check_source_path(self) -> bool:
-        path_text = self.source_text_input.text()
-        if path_text and self.convert_api.is_valid_source(Path(path_text)):
-            remove_classes(self.convert_container_widget, INVALID_STYLE)
-            return True
-        else:
-            add_classes(self.convert_container_widget, INVALID_STYLE)
-            return False
-
-    def check_output_path(self) -> bool:
-        path_text = self.output_text_input.text()
-        output_path = Path(path_text)
-        if path_text and output_path.exists() and output_path.is_dir():
-            remove_classes(self.output_container_widget, INVALID_STYLE)
-            return True
+        # filesystem checks run on a thread, the newest request replaces any still running
+        self._validate_request += 1
+        if self._validate_qthread is not None:
+            self._validate_qthread.cancel()
+        self.preview_label.setText("Checking paths...")
+
+        validate_qthread = ValidateQThread(
+            parent=self,
+            convert_api=self.convert_api,
+            request_id=self._validate_request,
+            source_path_input=self.source_text_input.text(),
+            output_path_input=self.output_text_input.text()
+        )
+        validate_qthread.validated.connect(self._paths_validated)
+        validate_qthread.previewed.connect(self._source_previewed)
+        validate_qthread.finished.connect(validate_qthread.deleteLater)
+        self._validate_qthread = validate_qthread
+        validate_qthread.start()
+
+    @staticmethod
+    def mark_path_valid(container: QWidget, valid: bool):
+        if valid:
+            remove_classes(container, INVALID_STYLE)
         else:
-            add_classes(self.output_container_widget, INVALID_STYLE)
-            return False
+            add_classes(container, INVALID_STYLE)
 
     def disable_convert_button(self):
         self.enable_convert_button(False)
@@ -325,9 +447,22 @@ class ConverterUIWindow(QMainWindow):
             self.convert_button.setEnabled(False)
             self.convert_button.setToolTip("Provide valid input & output path for converting")
 
+    def show_cancel_button(self, show: bool = True):
+        self.cancel_button.setText("Cancel")
+        self.cancel_button.setEnabled(show)
+        self.cancel_button.setVisible(show)
+
+    def cancel_running(self):
+        self.convert_api.cancel()
+        self.cancel_button.setText("Cancelling...")
+        self.cancel_button.setEnabled(False)
+
     def run_convert(self):
         self.spinner.start()
         self.compile_button.setDisabled(True)
+        self.show_cancel_button(True)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
 
         # spawn convert thread for processing
         convert_qthread = ConvertQThread(
@@ -337,6 +472,7 @@ class ConverterUIWindow(QMainWindow):
             output_path_input=self.output_text_input.text()
         )
         convert_qthread.finished.connect(self._convert_finished)
+        convert_qthread.progress_event.connect(self._convert_progress)
         convert_qthread.start()
 
     @staticmethod
@@ -347,6 +483,7 @@ class ConverterUIWindow(QMainWindow):
     def run_compile_auxdb(self):
         self.spinner.start()
         self.compile_button.setDisabled(True)
+        self.show_cancel_button(True)
 
         compile_qthread = CompileQThread(
             parent=self,
@@ -356,11 +493,42 @@ class ConverterUIWindow(QMainWindow):
         compile_qthread.start()
 
 
+    @pyqtSlot(int, bool, bool)
+    def _paths_validated(self, request_id: int, valid_source: bool, valid_output: bool):
+        if request_id != self._validate_request:
+            return
+        self.mark_path_valid(self.convert_container_widget, valid_source)
+        self.mark_path_valid(self.output_container_widget, valid_output)
+        self.enable_convert_button(valid_source and valid_output)
+        if valid_source:
+            self.preview_label.setText("Scanning source...")
+        else:
+            self.preview_label.setText("")
+
+    @pyqtSlot(int, str)
+    def _source_previewed(self, request_id: int, preview: str):
+        if request_id == self._validate_request:
+            self.preview_label.setText(preview)
+
+    @pyqtSlot(object)
+    def _convert_progress(self, event: ProgressEvent):
+        if event.kind == ProgressKind.STAGE_START:
+            self.progress_bar.setMaximum(max(event.total, 1))
+            self.progress_bar.setValue(0)
+        else:
+            self.progress_bar.setValue(min(event.index, self.progress_bar.maximum()))
+
+        eta = event.eta
+        eta_text = '' if eta is None else f' - ETA {int(eta // 60):02d}:{int(eta % 60):02d}'
+        self.progress_bar.setFormat(f'{event.stage}: %v/%m ({event.rate:.1f} files/s){eta_text}')
+
     @pyqtSlot()
     def _convert_finished(self):
         # TODO: may need to do cleanup?  notify user?
         self.spinner.stop()
         self.compile_button.setDisabled(False)
+        self.show_cancel_button(False)
+        self.progress_bar.setVisible(False)
 
 
     @pyqtSlot()
@@ -368,6 +536,7 @@ class ConverterUIWindow(QMainWindow):
         # TODO: may need to do cleanup?  notify user?
         self.spinner.stop()
         self.compile_button.setDisabled(False)
+        self.show_cancel_button(False)
 
 
 # Controlling object for GUI
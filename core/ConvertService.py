@@ -0,0 +1,358 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from colorama import Fore
+
+from core.ConvertAPI import ConvertAPI
+from helpers import RunLog
+from helpers.CancelToken import CancelToken, ConvertCancelled
+from helpers.ProgressEvents import ProgressEvent, ProgressKind
+
+JOB_CONVERT = 'convert'
+JOB_UNPACK = 'unpack'
+JOB_BUILD = 'build'
+JOB_COMPILE_AUX = 'compile_aux'
+JOB_TYPES = [JOB_CONVERT, JOB_UNPACK, JOB_BUILD, JOB_COMPILE_AUX]
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+FINISHED_STATUSES = [STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED]
+
+MAX_WAIT = 300  # seconds a client can block on a single GET /jobs/<id>?wait=
+KEEP_FINISHED = 256  # finished jobs kept for GET /jobs, older ones are dropped
+
+
+# Single submitted job, results are filled in by the worker running it
+class ServiceJob:
+    def __init__(self, job_type: str, source: str = None, output: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.source = source
+        self.output = output
+        self.status = STATUS_QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = {}
+        # per stage counts of files done/skipped/failed
+        self.stages: dict[str, dict] = {}
+        self.done = threading.Event()
+        # handed to the api running the job, so it can be cancelled while queued or running
+        self.cancel_token = CancelToken()
+
+    def on_progress(self, event: ProgressEvent):
+        counts = self.stages.setdefault(event.stage, {'total': 0, 'done': 0, 'skipped': 0, 'failed': 0})
+        counts['total'] = event.total
+        if event.kind == ProgressKind.FILE_DONE:
+            counts['done'] += 1
+        elif event.kind == ProgressKind.FILE_SKIPPED:
+            counts['skipped'] += 1
+        elif event.kind == ProgressKind.FILE_FAILED:
+            counts['failed'] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'source': self.source,
+            'output': self.output,
+            'status': self.status,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'duration': None if self.started is None or self.finished is None else self.finished - self.started,
+            'error': self.error,
+            'result': self.result,
+            'stages': self.stages
+        }
+
+
+# Long-running service keeping warm ConvertAPI instances, jobs are submitted over localhost HTTP.
+# Protocol (JSON bodies and responses):
+#   POST /jobs {"type": "convert"|"unpack"|"build"|"compile_aux", "source": path, "output": path} -> job
+#   GET  /jobs                     -> list of jobs
+#   GET  /jobs/<id>[?wait=seconds] -> job, optionally blocking until it finished
+#   POST /jobs/<id>/cancel         -> job, stops it after the current file (queued jobs never start)
+#   GET  /status                   -> queue and worker state
+#   POST /shutdown                 -> stops accepting jobs and exits once queued jobs finished
+# compile_aux jobs replace the aux db of every worker, so they run alone: they start once running
+# jobs finished and no other job starts until they are done.
+class ConvertService:
+    def __init__(self,
+                 convert_api: ConvertAPI,
+                 path_to_root: Path,
+                 host: str = '127.0.0.1',
+                 port: int = 8765,
+                 max_jobs: int = 1,
+                 max_queued: int = 64,
+                 keep_finished: int = KEEP_FINISHED):
+        """
+        :param convert_api: Warm api, every worker after the first runs on a copy of it
+        :param path_to_root: Service scratch files are kept in path_to_root/service
+        :param host: Interface to listen on, keep it on localhost, there is no authentication
+        :param port: Port to listen on
+        :param max_jobs: Jobs running at the same time
+        :param max_queued: Jobs waiting before submits are rejected
+        :param keep_finished: Finished jobs kept for clients to look up, the oldest are dropped first
+        """
+        self.convert_api = convert_api
+        self.host = host
+        self.port = port
+        self.max_jobs = max(1, max_jobs)
+        self.keep_finished = max(0, keep_finished)
+        self.jobs: dict[str, ServiceJob] = {}
+        self._queue: queue.Queue[ServiceJob] = queue.Queue(max(1, max_queued))
+        self._jobs_lock = threading.Lock()
+        # notified whenever a job starts or finishes, workers wait on it around exclusive jobs
+        self._jobs_changed = threading.Condition(self._jobs_lock)
+        self._running = 0
+        self._exclusive = False
+        self._apis = [convert_api] + [convert_api.spawn(path_to_root / 'service' / f'worker_{i}')
+                                      for i in range(1, self.max_jobs)]
+        self._workers: list[threading.Thread] = []
+        self._server: ThreadingHTTPServer = None
+
+    def run(self):
+        """
+            Serves until POST /shutdown or Ctrl+C, jobs already queued still run before it returns
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        for i, api in enumerate(self._apis):
+            worker = threading.Thread(target=self._work, args=(api,), name=f'service_worker_{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        print(f'{Fore.CYAN}[service] Listening on http://{self.host}:{self.port} ({self.max_jobs} concurrent jobs){Fore.RESET}')
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+            for _ in self._workers:
+                self._queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            print(f'{Fore.CYAN}[service] Stopped{Fore.RESET}')
+
+    def submit(self, job_type: str, source: str = None, output: str = None) -> ServiceJob:
+        """
+            Queues a job
+
+        :raises ValueError: Unknown job type or missing paths
+        :raises queue.Full: Too many jobs waiting
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f'Unknown job type {job_type}, expected one of {", ".join(JOB_TYPES)}')
+        if job_type != JOB_COMPILE_AUX and (not source or not output):
+            raise ValueError(f'{job_type} jobs need source and output paths')
+
+        job = ServiceJob(job_type, source, output)
+        with self._jobs_lock:
+            self._queue.put_nowait(job)
+            self.jobs[job.id] = job
+        RunLog.info(f'[service] Queued {job.type} job {job.id}: {source or ""}', Fore.CYAN)
+        return job
+
+    def cancel(self, job_id: str) -> ServiceJob:
+        """
+            Cancels a queued or running job, finished jobs are left as they are
+
+        :raises KeyError: Unknown job id
+        """
+        job = self.jobs[job_id]
+        if job.status not in FINISHED_STATUSES:
+            job.cancel_token.cancel()
+            # wakes a worker holding the job back until it can start
+            with self._jobs_changed:
+                self._jobs_changed.notify_all()
+            RunLog.info(f'[service] Cancelling job {job.id}', Fore.YELLOW)
+        return job
+
+    def status(self) -> dict:
+        with self._jobs_lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'max_jobs': self.max_jobs, 'running': self._running, 'queued': self._queue.qsize(), 'jobs': counts}
+
+    def shutdown(self):
+        # serve_forever has to be stopped from another thread than the one handling the request
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _work(self, api: ConvertAPI):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not self._start(job):
+                job.status = STATUS_CANCELLED
+                job.finished = time.time()
+                job.done.set()
+                self._forget_finished()
+                continue
+            job.status = STATUS_RUNNING
+            job.started = time.time()
+            api.cancel_token = job.cancel_token
+            api.progress.subscribe(job.on_progress)
+            try:
+                job.result = self._run_job(api, job) or {}
+                job.status = STATUS_DONE
+            except ConvertCancelled:
+                job.status = STATUS_CANCELLED
+            except Exception as e:
+                job.status = STATUS_FAILED
+                job.error = str(e) or type(e).__name__
+            finally:
+                api.progress.unsubscribe(job.on_progress)
+                job.finished = time.time()
+                self._finish(job)
+                if job.status == STATUS_DONE:
+                    RunLog.info(f'[service] Job {job.id} done in {job.finished - job.started:.1f}s')
+                elif job.status == STATUS_CANCELLED:
+                    RunLog.warning(f'[service] Job {job.id} cancelled')
+                else:
+                    RunLog.error(f'[service] Job {job.id} failed:\n\tError: {job.error}')
+                job.done.set()
+                self._forget_finished()
+
+    def _start(self, job: ServiceJob) -> bool:
+        # waits while an exclusive job runs, an exclusive job also waits for the running ones to finish
+        # :return: False when the job was cancelled before it could start
+        cancelled = job.cancel_token
+        with self._jobs_changed:
+            self._jobs_changed.wait_for(lambda: not self._exclusive or cancelled.cancelled)
+            if cancelled.cancelled:
+                return False
+            if job.type == JOB_COMPILE_AUX:
+                self._exclusive = True
+                self._jobs_changed.wait_for(lambda: self._running == 0 or cancelled.cancelled)
+                if cancelled.cancelled:
+                    self._exclusive = False
+                    self._jobs_changed.notify_all()
+                    return False
+            self._running += 1
+            return True
+
+    def _finish(self, job: ServiceJob):
+        with self._jobs_changed:
+            self._running -= 1
+            if job.type == JOB_COMPILE_AUX:
+                self._exclusive = False
+            self._jobs_changed.notify_all()
+
+    def _forget_finished(self):
+        with self._jobs_lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATUSES]
+            # jobs are kept in submit order
+            for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self.jobs[job_id]
+
+    def _run_job(self, api: ConvertAPI, job: ServiceJob) -> dict:
+        if job.type == JOB_COMPILE_AUX:
+            # no other job is running, see _start
+            aux_db = api._build_aux_db(api.src_bg3_path, api.cancel_token)
+            for worker_api in self._apis:
+                worker_api.set_aux_db(aux_db)
+            return {'entries': len(aux_db)}
+
+        source = Path(job.source)
+        output = Path(job.output)
+        if not source.exists():
+            raise FileNotFoundError(f'Source {source} does not exist')
+        output.mkdir(parents=True, exist_ok=True)
+
+        # projects are never built with prompts, there is no console to answer them
+        if job.type == JOB_CONVERT:
+            if api.is_pak(source):
+                api.convert_pak(source, output, False)
+            elif source.is_dir():
+                api.convert(source, output, False)
+                failed = api.convert_batch(api.find_paks(source), output, False)
+                return {'failed_paks': [str(f) for f in failed]}
+            else:
+                raise ValueError(f'Source {source} is not a dir or pak file')
+        elif job.type == JOB_UNPACK:
+            if not api.is_pak(source):
+                raise ValueError(f'Source {source} is not a pak file')
+            api.unpack_file(source, output)
+        elif job.type == JOB_BUILD:
+            api.build_tk_project(source, output, False)
+        return {}
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split('/') if p]
+                if parts == ['status']:
+                    self._reply(HTTPStatus.OK, service.status())
+                elif parts == ['jobs']:
+                    with service._jobs_lock:
+                        jobs = [job.to_dict() for job in service.jobs.values()]
+                    self._reply(HTTPStatus.OK, jobs)
+                elif len(parts) == 2 and parts[0] == 'jobs':
+                    job = service.jobs.get(parts[1], None)
+                    if job is None:
+                        self._reply(HTTPStatus.NOT_FOUND, {'error': f'Unknown job {parts[1]}'})
+                        return
+                    wait = parse_qs(url.query).get('wait', [None])[0]
+                    if wait is not None:
+                        try:
+                            job.done.wait(min(float(wait), MAX_WAIT))
+                        except ValueError:
+                            self._reply(HTTPStatus.BAD_REQUEST, {'error': f'Invalid wait {wait}'})
+                            return
+                    self._reply(HTTPStatus.OK, job.to_dict())
+                else:
+                    self._reply(HTTPStatus.NOT_FOUND, {'error': f'Unknown path {url.path}'})
+
+            def do_POST(self):
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                if parts == ['shutdown']:
+                    self._reply(HTTPStatus.OK, {'status': 'stopping'})
+                    service.shutdown()
+                elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                    try:
+                        self._reply(HTTPStatus.OK, service.cancel(parts[1]).to_dict())
+                    except KeyError:
+                        self._reply(HTTPStatus.NOT_FOUND, {'error': f'Unknown job {parts[1]}'})
+                elif parts == ['jobs']:
+                    try:
+                        length = int(self.headers.get('Content-Length', 0))
+                        body = json.loads(self.rfile.read(length) or b'{}')
+                        job = service.submit(body.get('type', ''), body.get('source', None), body.get('output', None))
+                        self._reply(HTTPStatus.ACCEPTED, job.to_dict())
+                    except queue.Full:
+                        self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Job queue is full'})
+                    except (ValueError, AttributeError) as e:
+                        self._reply(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+                else:
+                    self._reply(HTTPStatus.NOT_FOUND, {'error': 'Unknown path'})
+
+            def _reply(self, status: HTTPStatus, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # jobs are logged by the service itself
+
+        return Handler
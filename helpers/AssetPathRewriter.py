@@ -0,0 +1,144 @@
+import argparse
+import os
+import re
+from io import StringIO
+from pathlib import Path
+
+from colorama import Fore
+
+GENERATED = 'Generated/'
+PUBLIC = 'Public/'
+ASSETS = '/Assets/'
+SHARED_ASSETS = 'Public/Shared/Assets/'
+
+
+def legacy_rewrite(data: str, project_name: str, generated: bool = True) -> str:
+    """
+        Whole document regex rewrite used before AssetPathRewriter, kept to verify it against.
+        The Public/ lookahead rescans the rest of the line at every position, quadratic on long lines.
+    """
+    if generated:
+        try:
+            loc = re.search(r'Generated/.*?/', data).group().split('/')
+            if not loc[1] == 'Public':
+                data = data.replace('Generated/', f'Generated/Public/{project_name}/')
+            else:
+                data = data.replace('Generated/Public/', f'Generated/Public/{project_name}/')
+        except Exception as e:
+            pass # Ignore outlier files
+    return re.sub(r'(?!.*Public/Shared/Assets/)Public/.*?/Assets/', f'Public/{project_name}/Assets/', data)
+
+
+# Points Generated/ and Public/.../Assets/ paths of a copied resource file to a project, line by line
+# with plain string searches. Same rules and output as legacy_rewrite, which works per line too:
+# - Generated/ becomes Generated/Public/<project>/ everywhere (Generated/Public/ when the first generated
+#   path in the file already has a Public folder)
+# - Public/<anything>/Assets/ becomes Public/<project>/Assets/, unless Public/Shared/Assets/
+#   follows later on the same line, wherever the paths are (attribute values, text, comments)
+class AssetPathRewriter:
+    def __init__(self, project_name: str, generated: bool = True):
+        """
+        :param project_name: Project folder name paths are moved to
+        :param generated: Also rewrite Generated/ paths (visual resources, not UI files)
+        """
+        self.project_name = project_name
+        self.generated = generated
+        # Generated/ prefix replaced on every line, decided by the first generated path in the file
+        self.generated_from = None
+
+    def rewrite_line(self, line: str) -> str:
+        if self.generated_from is not None and GENERATED in line:
+            line = line.replace(self.generated_from, f'Generated/Public/{self.project_name}/')
+        if PUBLIC in line:
+            line = self._rewrite_public(line)
+        return line
+
+    def rewrite_lines(self, lines, output):
+        """
+            Streams lines to output. From a Generated/ path without a folder on its line until the first
+            one with a folder, lines are held back, as that one decides the prefix replaced in all of them.
+        """
+        held = []
+        decided = not self.generated
+        for line in lines:
+            if not decided and (held or GENERATED in line):
+                held.append(line)
+                self.generated_from = self._generated_prefix(line)
+                if self.generated_from is None:
+                    continue
+                decided = True
+                for held_line in held:
+                    output.write(self.rewrite_line(held_line))
+                held = []
+                continue
+            output.write(self.rewrite_line(line))
+        # no generated path with a folder, Generated/ paths are left as they are
+        for held_line in held:
+            output.write(self.rewrite_line(held_line))
+
+    def rewrite(self, data: str) -> str:
+        output = StringIO()
+        self.rewrite_lines(StringIO(data), output)
+        return output.getvalue()
+
+    def rewrite_file(self, file: str):
+        """
+            Rewrites file in place, through a temp file next to it
+        """
+        with open(file, 'r', encoding="utf-8") as src, open(file + '.tmp', 'w', encoding="utf-8") as dst:
+            self.rewrite_lines(src, dst)
+        os.replace(file + '.tmp', file)
+
+    @staticmethod
+    def _generated_prefix(text: str) -> str:
+        # first Generated/<folder>/ on one line, like re.search(r'Generated/.*?/') over the document
+        start = text.find(GENERATED)
+        while start != -1:
+            folder_end = text.find('/', start + len(GENERATED))
+            if folder_end == -1:
+                return None
+            line_end = text.find('\n', start + len(GENERATED))
+            if line_end == -1 or folder_end < line_end:
+                return 'Generated/Public/' if text[start + len(GENERATED):folder_end] == 'Public' else GENERATED
+            start = text.find(GENERATED, line_end)
+        return None
+
+    def _rewrite_public(self, line: str) -> str:
+        # the lookahead blocks every match starting before a shared asset path on the line, so matching starts after the last one
+        search_from = line.rfind(SHARED_ASSETS) + 1
+        parts = []
+        copied = 0
+        while True:
+            start = line.find(PUBLIC, search_from)
+            if start == -1:
+                break
+            end = line.find(ASSETS, start + len(PUBLIC))
+            if end == -1:
+                break
+            parts.append(line[copied:start])
+            parts.append(f'Public/{self.project_name}/Assets/')
+            copied = search_from = end + len(ASSETS)
+        if not parts:
+            return line
+        parts.append(line[copied:])
+        return ''.join(parts)
+
+
+# Compare with the legacy rewrite on real files: py -m helpers.AssetPathRewriter <dir> [--project <name>]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the asset path rewriter gives the same output as the legacy regex rewrite')
+    parser.add_argument('source', type=Path, help='Dir with lsx files')
+    parser.add_argument('--project', default='Project_00000000-0000-0000-0000-000000000000', help='Project name paths are moved to')
+    args = parser.parse_args()
+
+    checked = 0
+    different = []
+    for lsx_file in sorted(args.source.rglob('*.lsx')):
+        with open(lsx_file, 'r', encoding="utf-8", errors='replace') as f:
+            data = f.read()
+        checked += 1
+        if AssetPathRewriter(args.project).rewrite(data) != legacy_rewrite(data, args.project):
+            different.append(lsx_file)
+    print(f'{Fore.CYAN}[assets] {checked} files checked, {len(different)} different{Fore.RESET}')
+    for lsx_file in different:
+        print(f'\t{lsx_file}')
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+AUX_JSON = 'json'
+AUX_SQLITE = 'sqlite'
+AUX_FORMATS = [AUX_JSON, AUX_SQLITE]
+AUX_DB_FILE = 'auxdb.sqlite'
+
+# names per SELECT ... IN (...), below the host parameter limit of older SQLite builds
+LOOKUP_BATCH = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, ord INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (file TEXT NOT NULL, name TEXT NOT NULL, uuid TEXT NOT NULL, PRIMARY KEY (file, name));
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+'''
+
+
+# Auxiliary ID database (stat name -> UUID of the Editor entry) kept in SQLite instead of auxdb.json.
+# Entries are stored per Editor file, so a compile only parses files changed since the last one,
+# and names are resolved on lookup: the first file (in compile order) defining a name wins,
+# same as the json compile. Only looked up names are held in memory.
+class AuxDB:
+    def __init__(self, path: Path):
+        """
+        :param path: SQLite file, created when missing
+        """
+        self.path = Path(path)
+        # sqlite connections can't be shared between threads, jobs of the service and GUI threads get their own
+        self._local = threading.local()
+        # name -> UUID (None when not found) of names looked up since the last change
+        self._cache: dict[str, str] = {}
+
+    # pipeline and chunk worker processes reopen the file
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def lookup(self, names) -> dict[str, str]:
+        """
+            UUIDs of names, in batched queries for names not looked up before
+
+        :return: name -> UUID of the names found
+        """
+        missing = list({name for name in names if name not in self._cache})
+        connection = self.connection()
+        for start in range(0, len(missing), LOOKUP_BATCH):
+            batch = missing[start:start + LOOKUP_BATCH]
+            found = {}
+            # later files first, so the first file defining a name is the one kept
+            rows = connection.execute('SELECT e.name, e.uuid FROM entries e JOIN files f ON f.path = e.file '
+                                      f'WHERE e.name IN ({",".join("?" * len(batch))}) ORDER BY f.ord DESC', batch)
+            for name, uuid in rows:
+                found[name] = uuid
+            for name in batch:
+                self._cache[name] = found.get(name, None)
+        return {name: self._cache[name] for name in names if self._cache.get(name, None) is not None}
+
+    def get(self, name: str, default=None):
+        return self.lookup([name]).get(name, default)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.lookup([name])
+
+    def __len__(self) -> int:
+        return self.connection().execute('SELECT COUNT(DISTINCT name) FROM entries').fetchone()[0]
+
+    @property
+    def digest(self) -> str:
+        """
+            Changes whenever a compile changes the entries, stands in for the whole table in fingerprints
+        """
+        row = self.connection().execute("SELECT value FROM meta WHERE key = 'digest'").fetchone()
+        return '' if row is None else row[0]
+
+    def recorded_files(self) -> dict[str, tuple[int, int]]:
+        """
+            Editor file -> (mtime ns, size) when its entries were stored
+        """
+        return {path: (mtime, size) for path, mtime, size in self.connection().execute('SELECT path, mtime, size FROM files')}
+
+    def apply(self, files: list[tuple[str, int, int]], changed: dict[str, dict[str, str]]) -> int:
+        """
+            Records the result of a compile in one transaction
+
+        :param files: (path, mtime ns, size) of every Editor file in compile order, recorded files not in it are dropped
+        :param changed: path -> entries (name -> UUID) of files parsed again, replacing their stored entries
+        :return: Number of dropped files
+        """
+        connection = self.connection()
+        current = {path for path, _, _ in files}
+        removed = [path for path in self.recorded_files() if path not in current]
+        with connection:
+            for path in removed + list(changed):
+                connection.execute('DELETE FROM entries WHERE file = ?', (path,))
+            connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+            connection.executemany('INSERT OR REPLACE INTO files (path, mtime, size, ord) VALUES (?, ?, ?, ?)',
+                                   [(path, mtime, size, index) for index, (path, mtime, size) in enumerate(files)])
+            for path, entries in changed.items():
+                connection.executemany('INSERT INTO entries (file, name, uuid) VALUES (?, ?, ?)',
+                                       [(path, name, uuid) for name, uuid in entries.items()])
+            state = json.dumps([list(f) for f in files]).encode('utf-8')
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('digest', ?)", (hashlib.sha1(state).hexdigest(),))
+        self._cache.clear()
+        return len(removed)
+
+    def import_json(self, file: Path):
+        """
+            Stores an existing auxdb.json as a single file, replaced by the Editor files on the next compile
+        """
+        with open(file, encoding="utf-8") as f:
+            entries = json.load(f)
+        stat = os.stat(file)
+        self.apply([(str(file), stat.st_mtime_ns, stat.st_size)], {str(file): entries})
@@ -0,0 +1,34 @@
+import threading
+
+
+# Raised inside a conversion once its token was cancelled
+class ConvertCancelled(Exception):
+    pass
+
+
+# Cooperative cancellation of a running conversion. Clients call cancel() from any thread,
+# conversion loops call check() between files and unwind by raising ConvertCancelled,
+# cleaning up temp dirs and unfinished projects on the way out.
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def reset(self):
+        """
+            Re-arms the token, call before starting the next run
+        """
+        self._event.clear()
+
+    def check(self):
+        """
+        :raises ConvertCancelled: cancel() was called
+        """
+        if self._event.is_set():
+            raise ConvertCancelled('Conversion cancelled')
@@ -1,8 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import xml.etree.ElementTree as ET
+import argparse
 import xmltodict
 import json
 import os
 
+CACHE_FILE = './compiledb_cache.json'
+
+
+# Streaming read of the definition id and field headers of a .tbl/.stats file (runs in worker processes)
+def extract_definitions(file):
+	stat = os.stat(file)
+	entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'ext': os.path.splitext(file)[1], 'definition_id': None, 'fields': []}
+	try:
+		for event, elem in ET.iterparse(file, events=('start', 'end')):
+			if event == 'start':
+				if elem.tag == 'stats':
+					entry['definition_id'] = elem.get('stat_object_definition_id', None)
+				elif elem.tag == 'field':
+					entry['fields'].append((elem.get('name'), elem.get('type'), elem.get('enumeration_type_name', None)))
+			elif elem.tag == 'stat_object':
+				elem.clear() # drop finished objects, only headers are needed
+	except ET.ParseError as e:
+		entry['error'] = str(e)
+	return entry
+
 class CompileDB():
 	data = None
 	file = None
@@ -13,52 +36,167 @@ class CompileDB():
 	def __init__(self, bgpath=None):
 		self.bgpath = bgpath
 
-	def compile(self):
-		self.db = {"LSX":{},"Stats":{},"DataTypes":{"EnumTypes":{}}}
+	def compile(self, workers=None, use_cache=True):
+		"""
+			Rebuilds db.json from the Editor Mods definition files.
+			Files are read with a streaming parser on a process pool and only files changed since the
+			last run (by mtime and size) are parsed again. Hand maintained tables (EnumSubTypes) are kept
+			and a schema diff against the previous db.json is written to db_diff.json.
 
+		:param workers: Number of processes parsing files (None for cpu count)
+		:param use_cache: Reuse per file results from compiledb_cache.json
+		"""
 		if not self.bgpath is None:
 			rec = f'{self.bgpath}/Data/Editor/Mods/.'
 		else:
 			rec = '.'
 
+		files = []
 		for file in Path(rec).rglob('*.*'):
-			self.file = file
 			fname, fext = os.path.splitext(file)
 			fname = os.path.basename(fname)
-
 			if (fext != '.tbl' and fext != '.stats') or self.is_file_guid(fname):
 				continue
-			try:
-				self.data = self.readxml(str(file))
-				if fext == ".tbl":
-					self.db['LSX'][fname] = self.data['stats']['@stat_object_definition_id']
-				elif fext == ".stats":
-					self.db['Stats'][fname] = self.data['stats']['@stat_object_definition_id']
-
-				builder = self.data['stats']['stat_objects']['stat_object']
-				if not isinstance(builder, list):
-					builder = [builder]
-				for node in builder:
-					for subnode in node['fields']['field']:
-						self.db['DataTypes'][subnode['@name']] = subnode['@type']
-						if subnode['@type'] == 'EnumerationTableFieldDefinition':
-							self.db['DataTypes']['EnumTypes'][subnode['@name']] = subnode['@enumeration_type_name']
-
-				print(f'Compiled {file}')
-			except Exception as e:
-				if str(e) != "'NoneType' object is not subscriptable":
-					print(f'Failed to compile {os.path.basename(file)}:\n\t{e}')
+			files.append(file)
+
+		cache = self.load_cache() if use_cache else {}
+		results = {}
+		changed = []
+		for file in files:
+			stat = file.stat()
+			entry = cache.get(str(file), None)
+			if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+				results[str(file)] = entry
+			else:
+				changed.append(str(file))
+
+		print(f'Compiling {len(changed)} changed files ({len(files) - len(changed)} cached)')
+		if changed:
+			with ProcessPoolExecutor(workers) as pool:
+				for file, entry in zip(changed, pool.map(extract_definitions, changed, chunksize=16)):
+					if entry.get('error', None) is not None:
+						print(f'Failed to compile {os.path.basename(file)}:\n\t{entry["error"]}')
+						continue
+					results[file] = entry
+
+		# merge in file order so later files win, same as compiling serially
+		self.db = {"LSX":{},"Stats":{},"DataTypes":{"EnumTypes":{}}}
+		for file in files:
+			entry = results.get(str(file), None)
+			if entry is None:
+				continue
+			fname = os.path.basename(os.path.splitext(file)[0])
+			if entry['definition_id'] is not None:
+				if entry['ext'] == ".tbl":
+					self.db['LSX'][fname] = entry['definition_id']
+				elif entry['ext'] == ".stats":
+					self.db['Stats'][fname] = entry['definition_id']
+			for name, field_type, enum_type in entry['fields']:
+				self.db['DataTypes'][name] = field_type
+				if field_type == 'EnumerationTableFieldDefinition':
+					self.db['DataTypes']['EnumTypes'][name] = enum_type
+
+		previous = self.load_db()
+		if 'EnumSubTypes' in previous.get('DataTypes', {}):
+			self.db['DataTypes']['EnumSubTypes'] = previous['DataTypes']['EnumSubTypes']
+		diff = self.schema_diff(previous, self.db)
+		self.print_diff(diff)
 
 		print(f'\nCompile Completed')
 		with open(f'./db.json', 'w') as f:
 			f.write(json.dumps(self.db, indent=4))
+		with open(f'./db_diff.json', 'w') as f:
+			f.write(json.dumps(diff, indent=4))
+		self.save_cache({file: entry for file, entry in results.items()})
+
+	# Load per file results of the last compile
+	def load_cache(self):
+		try:
+			with open(CACHE_FILE, encoding="utf-8") as f:
+				return json.load(f)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return {}
+
+	def save_cache(self, cache):
+		with open(CACHE_FILE, 'w', encoding="utf-8") as f:
+			f.write(json.dumps(cache))
+
+	def load_db(self):
+		try:
+			with open(f'./db.json', encoding="utf-8") as f:
+				return json.load(f)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return {}
+
+	# Compare two db versions (e.g. before and after a game patch)
+	@staticmethod
+	def schema_diff(old, new):
+		diff = {}
+		for table in ['LSX', 'Stats', 'DataTypes', 'EnumTypes']:
+			if table == 'EnumTypes':
+				old_table = old.get('DataTypes', {}).get('EnumTypes', {})
+				new_table = new.get('DataTypes', {}).get('EnumTypes', {})
+			else:
+				old_table = {k: v for k, v in old.get(table, {}).items() if not isinstance(v, dict)}
+				new_table = {k: v for k, v in new.get(table, {}).items() if not isinstance(v, dict)}
+			diff[table] = {
+				'added': {k: new_table[k] for k in new_table.keys() - old_table.keys()},
+				'removed': {k: old_table[k] for k in old_table.keys() - new_table.keys()},
+				'changed': {k: [old_table[k], new_table[k]] for k in old_table.keys() & new_table.keys() if old_table[k] != new_table[k]},
+			}
+		return diff
+
+	@staticmethod
+	def print_diff(diff):
+		for table, changes in diff.items():
+			counts = {k: len(v) for k, v in changes.items()}
+			if any(counts.values()):
+				print(f'{table}: {counts["added"]} added, {counts["removed"]} removed, {counts["changed"]} changed')
 
 	# Compile auxiliary db for parent IDs at runtime
-	def compileAuxiliaryDB(self, append=None):
+	# cancel is a CancelToken checked between files, auxdb.json is left untouched when cancelled
+	# store is an AuxDB to update incrementally instead of writing auxdb.json
+	def compileAuxiliaryDB(self, append=None, cancel=None, store=None):
+		if not store is None:
+			return self.compileAuxiliaryStore(store, cancel)
+
 		self.auxdb = {}
 		if not append is None:
 			self.auxdb = append
 
+		for file in self.auxiliaryFiles():
+			if not cancel is None:
+				cancel.check()
+			for name, uuid in self.readAuxiliaryEntries(file).items():
+				if self.auxdb.get(name,'') == '':
+					self.auxdb[name] = uuid
+
+		print(f'Compiling Auxiliary DB Completed\n')
+		with open(f'./auxdb.json', 'w') as f:
+			f.write(json.dumps(self.auxdb, indent=4))
+
+		return self.auxdb
+
+	# Only parses files changed since the last compile (by mtime and size) and replaces their entries,
+	# the store is left untouched when cancelled
+	def compileAuxiliaryStore(self, store, cancel=None):
+		recorded = store.recorded_files()
+		files = []
+		changed = {}
+		for file in self.auxiliaryFiles():
+			if not cancel is None:
+				cancel.check()
+			stat = file.stat()
+			files.append((str(file), stat.st_mtime_ns, stat.st_size))
+			if recorded.get(str(file), None) != (stat.st_mtime_ns, stat.st_size):
+				changed[str(file)] = self.readAuxiliaryEntries(file)
+
+		removed = store.apply(files, changed)
+		print(f'Compiling Auxiliary DB Completed ({len(changed)} changed files, {removed} removed)\n')
+		return store
+
+	# Editor .tbl/.stats files in compile order
+	def auxiliaryFiles(self):
 		if not self.bgpath is None:
 			rec = f'{self.bgpath}/Data/Editor/Mods/.'
 		else:
@@ -67,38 +205,38 @@ class CompileDB():
 		for file in Path(rec).rglob('*.*'):
 			fname, fext = os.path.splitext(file)
 			fname = os.path.basename(fname)
-
 			if (fext != '.tbl' and fext != '.stats') or self.is_file_guid(fname):
 				continue
-			try:
-				self.data = self.readxml(str(file))
-				builder = self.data['stats']['stat_objects']['stat_object']
-				if not isinstance(builder, list):
-					builder = [builder]
-				for node in builder:
-					uuid = ''
-					name = ''
-					for subnode in node['fields']['field']:
-						if subnode['@name'] == 'Name':
-							if fname == "Projectile" or fname == "Target" or fname == "Zone" or fname == "Shout" or fname == "ProjectileStrike" or fname == "Rush" or fname == "Teleportation" or fname == "Throw":
-								name = f'{fname}_{subnode["@value"]}'
-							else:
-								name = subnode['@value']
-						if subnode['@name'] == 'UUID':
-							uuid = subnode['@value']
-						if name != '' and uuid != '':
-							if self.auxdb.get(name,'') != '':
-								break
-							self.auxdb[name] = uuid
-							break
-			except Exception as e:
-				pass
-
-		print(f'Compiling Auxiliary DB Completed\n')
-		with open(f'./auxdb.json', 'w') as f:
-			f.write(json.dumps(self.auxdb, indent=4))
+			yield file
 
-		return self.auxdb
+	# Name -> UUID of the entries in one file, the first one wins for names defined twice
+	def readAuxiliaryEntries(self, file):
+		entries = {}
+		fname = os.path.basename(os.path.splitext(file)[0])
+		try:
+			self.data = self.readxml(str(file))
+			builder = self.data['stats']['stat_objects']['stat_object']
+			if not isinstance(builder, list):
+				builder = [builder]
+			for node in builder:
+				uuid = ''
+				name = ''
+				for subnode in node['fields']['field']:
+					if subnode['@name'] == 'Name':
+						if fname == "Projectile" or fname == "Target" or fname == "Zone" or fname == "Shout" or fname == "ProjectileStrike" or fname == "Rush" or fname == "Teleportation" or fname == "Throw":
+							name = f'{fname}_{subnode["@value"]}'
+						else:
+							name = subnode['@value']
+					if subnode['@name'] == 'UUID':
+						uuid = subnode['@value']
+					if name != '' and uuid != '':
+						if entries.get(name,'') != '':
+							break
+						entries[name] = uuid
+						break
+		except Exception as e:
+			pass
+		return entries
 
 	# Read data from xml file
 	def readxml(self, file):
@@ -112,5 +250,11 @@ class CompileDB():
 		return False
 
 if __name__ == "__main__":
-	cdb = CompileDB()
-	cdb.compile()
+	parser = argparse.ArgumentParser(description='Compile db.json from Editor definition files')
+	parser.add_argument('bgpath', nargs='?', default=None, help='Path to BG3 installation (defaults to current dir)')
+	parser.add_argument('--workers', type=int, default=None, help='Number of parsing processes')
+	parser.add_argument('--full', action='store_true', help='Ignore cached results and parse every file')
+	args = parser.parse_args()
+
+	cdb = CompileDB(args.bgpath)
+	cdb.compile(args.workers, not args.full)
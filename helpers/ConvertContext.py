@@ -0,0 +1,16 @@
+from dataclasses import dataclass, field
+
+
+# Everything a single in-memory conversion needs besides the source data, and what it leaves behind
+# for the next one (IDs recovered from a stats file are read by the lsx conversions after it)
+@dataclass
+class ConvertContext:
+    db: dict                    # db.json tables, or a PatchDB of the registry
+    auxdb: dict = None          # auxiliary ID table, or an AuxDB
+    uuid: str = None            # definition ID of the converted file (db Stats/LSX entry), None for ''
+    # stat name -> ID of entries defined by the last converted stats file
+    recovered: dict[str, str] = field(default_factory=dict)
+    # set by convert_lsx_bytes: suffix of the returned data ('.tbl' or '.mei') and of the LSLib
+    # conversion the source still needs ('.lsf' or '.lsfx'), which in-memory conversion doesn't do
+    suffix: str = None
+    lsf: str = None
@@ -0,0 +1,119 @@
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+from helpers.CancelToken import CancelToken
+
+
+# Pipelined executor overlapping disk reads, cpu transforms and writes.
+# Reads and writes run on thread pools, transforms on a process pool (or inline thread when
+# transform_workers is 0). At most max_pending items are in flight, which keeps memory bounded.
+class ConvertPipeline:
+    def __init__(self,
+                 transform_workers: int = 0,
+                 read_workers: int = 4,
+                 write_workers: int = 2,
+                 max_pending: int = 32,
+                 initializer: Callable = None,
+                 initargs: tuple = ()):
+        """
+        :param transform_workers: Processes running the transform stage (0 to transform on a single thread)
+        :param read_workers: Threads prefetching input
+        :param write_workers: Threads flushing output
+        :param max_pending: Items read but not yet written before reading pauses (back-pressure)
+        :param initializer: Called once in every transform process (e.g. to set up a converter)
+        :param initargs: Arguments for initializer
+        """
+        self.transform_workers = transform_workers
+        self.read_workers = max(1, read_workers)
+        self.write_workers = max(1, write_workers)
+        self.max_pending = max(1, max_pending)
+        self.initializer = initializer
+        self.initargs = initargs
+
+    def run(self,
+            items: Iterable,
+            read: Callable[[Any], Any],
+            transform: Callable[..., Any],
+            write: Callable[[Any, Any], None],
+            on_done: Callable[[Any, Any], None],
+            on_error: Callable[[Any, Exception], None],
+            cancel: CancelToken = None) -> bool:
+        """
+            Runs every item through read -> transform -> write.
+            read(item) returns the argument tuple for transform, which must be picklable
+            when transform_workers > 0. write(item, result) persists the transform result.
+            on_done/on_error are called on the calling thread, in completion order.
+
+        :param cancel: Once cancelled no new items are read and queued ones are dropped,
+                       items already transforming or writing still finish
+        :return: False if the run was cancelled
+        """
+        results = queue.Queue()
+        if self.transform_workers > 0:
+            transform_pool = ProcessPoolExecutor(self.transform_workers, initializer=self.initializer, initargs=self.initargs)
+        else:
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            transform_pool = ThreadPoolExecutor(1, thread_name_prefix='pipeline_transform')
+        read_pool = ThreadPoolExecutor(self.read_workers, thread_name_prefix='pipeline_read')
+        write_pool = ThreadPoolExecutor(self.write_workers, thread_name_prefix='pipeline_write')
+
+        def fail(item, future: Future) -> bool:
+            if future.cancelled():
+                return True
+            error = future.exception()
+            if error is not None:
+                results.put((item, None, error))
+                return True
+            return False
+
+        def written(item, result, future: Future):
+            if not fail(item, future):
+                results.put((item, result, None))
+
+        def transformed(item, future: Future):
+            if fail(item, future):
+                return
+            result = future.result()
+            write_pool.submit(write, item, result).add_done_callback(lambda f: written(item, result, f))
+
+        def read_done(item, future: Future):
+            if fail(item, future):
+                return
+            try:
+                transform_pool.submit(transform, *future.result()).add_done_callback(lambda f: transformed(item, f))
+            except Exception as e:
+                results.put((item, None, e))
+
+        cancelled = False
+        try:
+            pending = 0
+            items = iter(items)
+            exhausted = False
+            while not exhausted or pending > 0:
+                if cancel is not None and cancel.cancelled:
+                    cancelled = True
+                    break
+                # fill the pipeline up to max_pending, then wait for items to leave it
+                while not exhausted and pending < self.max_pending:
+                    item = next(items, StopIteration)
+                    if item is StopIteration:
+                        exhausted = True
+                        break
+                    pending += 1
+                    read_pool.submit(read, item).add_done_callback(lambda f, i=item: read_done(i, f))
+                if pending == 0:
+                    break
+
+                item, result, error = results.get()
+                pending -= 1
+                if error is None:
+                    on_done(item, result)
+                else:
+                    on_error(item, error)
+        finally:
+            read_pool.shutdown(cancel_futures=cancelled)
+            transform_pool.shutdown(cancel_futures=cancelled)
+            write_pool.shutdown()
+        return not cancelled
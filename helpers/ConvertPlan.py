@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from colorama import Fore
+
+from helpers.CancelToken import CancelToken
+from helpers.ProgressEvents import ProgressEvent, ProgressKind
+
+# Converter categories of a plan, in the order they run
+STATS = 'stats'
+LSX_TBL = 'lsx_tbl'
+LSX_LSF = 'lsx_lsf'
+MEI = 'mei'
+LOCALE = 'locale'
+SKIPPED = 'skipped'
+COPY_ONLY = 'copy_only'
+CATEGORIES = [STATS, LSX_TBL, LSX_LSF, MEI, LOCALE, SKIPPED, COPY_ONLY]
+
+# Seconds per MB (per project for builds) used until a conversion has been measured
+DEFAULT_SECONDS_PER_MB = {'stats': 1.0, 'lsx': 2.0, 'locale': 0.5, 'unpack': 0.2}
+DEFAULT_SECONDS_PER_PROJECT = 5.0
+
+REGION_ID = re.compile(rb'<region\s+id="([^"]+)"')
+# same as Path.full_match('**/Mods/*/Story/**') used when converting, without building paths
+OSIRIS_PATH = re.compile(r'(^|/)Mods/[^/]+/Story/')
+PEEK_BYTES = 2048
+LSF_EFFECT_TYPES = ['Effect', 'Dependencies']
+ATLAS_TYPES = ['IconUVList', 'TextureAtlasInfo']
+
+
+@dataclass
+class CategoryPlan:
+    files: int = 0
+    bytes: int = 0
+
+    def add(self, size: int):
+        self.files += 1
+        self.bytes += size
+
+
+@dataclass
+class ConvertPlan:
+    source: str
+    output: str
+    categories: dict[str, CategoryPlan] = field(default_factory=lambda: {c: CategoryPlan() for c in CATEGORIES})
+    projects: list[str] = field(default_factory=list)
+    paks: list[dict] = field(default_factory=list)
+    total_files: int = 0
+    total_bytes: int = 0
+    scan_seconds: float = 0.0
+    # set when the scan was stopped early, counts only cover what was scanned until then
+    cancelled: bool = False
+    # stage -> estimated seconds, and whether the estimate comes from measured runs
+    estimate: dict[str, float] = field(default_factory=dict)
+    estimate_source: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def estimated_seconds(self) -> float:
+        return sum(self.estimate.values())
+
+    def to_dict(self) -> dict:
+        return {
+            'source': self.source,
+            'output': self.output,
+            'categories': {name: vars(c) for name, c in self.categories.items()},
+            'projects': self.projects,
+            'paks': self.paks,
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'scan_seconds': self.scan_seconds,
+            'cancelled': self.cancelled,
+            'estimate': self.estimate,
+            'estimate_source': self.estimate_source,
+            'estimated_seconds': self.estimated_seconds
+        }
+
+    def print_summary(self):
+        print(f'{Fore.CYAN}[plan] {self.source} -> {self.output}{Fore.RESET}')
+        print(f'\t{self.total_files} files, {self.total_bytes / 1024 / 1024:.1f} MB (scanned in {self.scan_seconds:.1f}s)')
+        for name, category in self.categories.items():
+            print(f'\t{name}: {category.files} files, {category.bytes / 1024 / 1024:.1f} MB')
+        for pak in self.paks:
+            contents = '' if pak['files'] is None else f', {pak["files"]} files, {pak["unpacked_bytes"] / 1024 / 1024:.1f} MB unpacked'
+            print(f'\tpak {pak["name"]}: {pak["bytes"] / 1024 / 1024:.1f} MB{contents}')
+        if self.projects:
+            print(f'{Fore.CYAN}[plan] Projects that would be built:{Fore.RESET}')
+            for project in self.projects:
+                print(f'\t{project}')
+        else:
+            print(f'{Fore.YELLOW}[plan] No projects detected{Fore.RESET}')
+        print(f'{Fore.CYAN}[plan] Estimated runtime: {format_duration(self.estimated_seconds)}{Fore.RESET}')
+        for stage, seconds in self.estimate.items():
+            print(f'\t{stage}: {format_duration(seconds)} ({self.estimate_source[stage]})')
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def peek_region_id(path: str) -> str:
+    """
+        Region id from the start of a lsx file, without parsing it (None if not found)
+    """
+    try:
+        with open(path, 'rb') as f:
+            match = REGION_ID.search(f.read(PEEK_BYTES))
+        return None if match is None else match.group(1).decode('utf-8', errors='replace')
+    except OSError:
+        return None
+
+
+# Measured throughput per conversion stage, persisted between runs for plan estimates.
+# Subscribe it to ConvertAPI.progress, every finished stage updates the history.
+class ThroughputHistory:
+    def __init__(self, path: Path, decay: float = 0.5):
+        """
+        :param path: Json file the history is kept in
+        :param decay: Weight of older runs when a new run of a stage is recorded
+        """
+        self.path = path
+        self.decay = decay
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.stages: dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self.stages = {}
+
+    def __call__(self, event: ProgressEvent):
+        if event.kind != ProgressKind.STAGE_END or event.index == 0 or event.elapsed <= 0:
+            return
+        with self._lock:
+            stage = self.stages.get(event.stage, None)
+            measured = {'seconds': event.elapsed, 'files': event.index, 'bytes': event.stage_bytes}
+            if stage is None:
+                self.stages[event.stage] = measured
+            else:
+                for key, value in measured.items():
+                    stage[key] = stage[key] * self.decay + value
+            try:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self.stages, f, indent=4)
+            except OSError:
+                pass  # estimates are optional, never fail a conversion for them
+
+    def estimate(self, stage: str, files: int, size: int) -> tuple[float, str]:
+        """
+        :return: (estimated seconds, 'history' or 'default')
+        """
+        if files == 0:
+            return 0.0, 'nothing to do'
+        history = self.stages.get(stage, None)
+        if history is not None and history['seconds'] > 0:
+            if history['bytes'] > 0 and size > 0:
+                return size * history['seconds'] / history['bytes'], 'history'
+            return files * history['seconds'] / history['files'], 'history'
+        if stage in DEFAULT_SECONDS_PER_MB:
+            return size / 1024 / 1024 * DEFAULT_SECONDS_PER_MB[stage], 'default'
+        return files * DEFAULT_SECONDS_PER_PROJECT, 'default'
+
+
+def scan(plan: ConvertPlan, source: Path, exclusions: list[str], force_fail: list[str], lsf_types: list[str],
+         peek: bool = True, cancel: CancelToken = None):
+    """
+        Sorts every file below source into the converter that would handle it, in a single directory walk.
+        Lsx files are assigned by the region id in their first bytes (peek=False counts them all as lsx_tbl).
+        Setting cancel stops the walk before the next directory and marks the plan cancelled.
+    """
+    # scandir entries carry their stat on Windows, so sizes come without extra calls there
+    pending = [str(source)]
+    while pending:
+        if cancel is not None and cancel.cancelled:
+            plan.cancelled = True
+            return
+        root = pending.pop()
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                    continue
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            plan.total_files += 1
+            plan.total_bytes += size
+            suffix = os.path.splitext(entry.name)[1]
+            if suffix == '.pak' and root == str(source):
+                plan.paks.append({'name': entry.name, 'path': entry.path, 'bytes': size, 'files': None, 'unpacked_bytes': 0})
+                continue
+            plan.categories[categorize(entry.path, entry.name, suffix, exclusions, force_fail, lsf_types, peek)].add(size)
+
+
+def categorize(path: str, name: str, suffix: str, exclusions: list[str], force_fail: list[str], lsf_types: list[str], peek: bool) -> str:
+    if name in force_fail:
+        return SKIPPED
+    if suffix == '.txt':
+        if OSIRIS_PATH.search(path.replace('\\', '/')):
+            return SKIPPED
+        return STATS
+    if suffix == '.lsx':
+        if name in exclusions:
+            return SKIPPED
+        region = peek_region_id(path) if peek else None
+        if region in ATLAS_TYPES:
+            return SKIPPED
+        if region == 'MultiEffectInfos':
+            return MEI
+        if region in LSF_EFFECT_TYPES or region in lsf_types:
+            return LSX_LSF
+        return LSX_TBL
+    if suffix == '.xml' and not name.endswith('_fix.xml'):
+        return LOCALE
+    return COPY_ONLY
@@ -0,0 +1,167 @@
+import argparse
+import difflib
+import json
+import re
+import sys
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from colorama import Fore
+
+from helpers.AssetPathRewriter import AssetPathRewriter, legacy_rewrite
+
+GUID = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+OUTPUT_PATTERNS = ['*.tbl', '*.stats', '*.mei', '*_fix.xml']
+# project name asset paths are rewritten to when comparing the rewriters
+VERIFY_PROJECT = 'Verify_00000000-0000-0000-0000-000000000000'
+DIFF_LINES = 20
+
+
+def normalize_ids(reference: str, fast: str) -> tuple[str, str]:
+    """
+        Replaces IDs generated during conversion by their order of appearance. IDs found in both
+        outputs come from the source or the databases and are kept, a changed one is a difference.
+        An ID found in only one output counts as generated, so one replaced by another in the same
+        place is not reported.
+    """
+    shared = set(GUID.findall(reference)) & set(GUID.findall(fast))
+
+    def relabel(text: str) -> str:
+        labels = {}
+        return GUID.sub(lambda m: m.group(0) if m.group(0) in shared else labels.setdefault(m.group(0), f'generated-{len(labels)}'), text)
+
+    return relabel(reference), relabel(fast)
+
+
+def canonical_xml(text: str) -> str:
+    """
+        One element per line with whitespace around text stripped. Attributes keep their order,
+        the toolkit reads them as written and a reordered field is a difference.
+    """
+    root = ET.fromstring(text)
+    for element in root.iter():
+        element.text = (element.text or '').strip() or None
+        element.tail = (element.tail or '').strip() or None
+    return ET.tostring(root, encoding='unicode').replace('><', '>\n<')
+
+
+def compare_xml(reference: str, fast: str) -> str:
+    """
+        :return: None when both documents are the same after normalizing generated IDs and whitespace,
+            otherwise the start of a unified diff of their canonical forms
+    """
+    reference, fast = normalize_ids(reference, fast)
+    # identical text is the common case, canonicalizing is only needed to tell formatting from content changes
+    if reference == fast:
+        return None
+    try:
+        reference, fast = canonical_xml(reference), canonical_xml(fast)
+    except ET.ParseError as e:
+        return f'Invalid xml: {e}'
+    if reference == fast:
+        return None
+    diff = difflib.unified_diff(reference.split('\n'), fast.split('\n'), 'reference', 'fast', lineterm='', n=1)
+    return '\n'.join(line for _, line in zip(range(DIFF_LINES), diff))
+
+
+@dataclass
+class VerifyReport:
+    files: int = 0
+    same: int = 0
+    # relative output path -> diff, or which run didn't write it
+    different: dict[str, str] = field(default_factory=dict)
+    missing: dict[str, str] = field(default_factory=dict)
+    asset_files: int = 0
+    # project lsx file -> diff of the asset path rewrite
+    asset_different: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.different and not self.missing and not self.asset_different
+
+    def to_dict(self) -> dict:
+        return {
+            'files': self.files,
+            'same': self.same,
+            'different': self.different,
+            'missing': self.missing,
+            'asset_files': self.asset_files,
+            'asset_different': self.asset_different,
+            'ok': self.ok
+        }
+
+    def print_summary(self, verbose: bool = True):
+        color = Fore.GREEN if self.ok else Fore.RED
+        print(f'{color}[verify] {self.same}/{self.files} outputs identical, {len(self.different)} different, {len(self.missing)} missing; '
+              f'asset paths of {self.asset_files - len(self.asset_different)}/{self.asset_files} project files identical{Fore.RESET}')
+        for file, run in self.missing.items():
+            print(f'{Fore.YELLOW}[verify] {file}: only written by the {run} run{Fore.RESET}')
+        for file, diff in list(self.different.items()) + list(self.asset_different.items()):
+            print(f'{Fore.YELLOW}[verify] {file} differs{Fore.RESET}')
+            if verbose:
+                print('\t' + diff.replace('\n', '\n\t'))
+
+
+def collect_outputs(root: Path) -> dict[str, Path]:
+    return {str(f.relative_to(root)): f for pattern in OUTPUT_PATTERNS for f in root.rglob(pattern)}
+
+
+def compare_outputs(reference_dir: Path, fast_dir: Path, report: VerifyReport = None) -> VerifyReport:
+    """
+        Compares the converted files written into two copies of the same source
+    """
+    report = report or VerifyReport()
+    reference = collect_outputs(reference_dir)
+    fast = collect_outputs(fast_dir)
+    for file in sorted(reference.keys() | fast.keys()):
+        report.files += 1
+        if file not in fast:
+            report.missing[file] = 'reference'
+            continue
+        if file not in reference:
+            report.missing[file] = 'fast'
+            continue
+        diff = compare_xml(reference[file].read_text(encoding='utf-8', errors='replace'),
+                           fast[file].read_text(encoding='utf-8', errors='replace'))
+        if diff is None:
+            report.same += 1
+        else:
+            report.different[file] = diff
+    return report
+
+
+def compare_asset_paths(projects: list[Path], report: VerifyReport = None) -> VerifyReport:
+    """
+        Rewrites the asset paths of every lsx file of the projects with the legacy regex and with
+        AssetPathRewriter, in memory, the way a project build would
+    """
+    report = report or VerifyReport()
+    for project in projects:
+        for file in sorted(project.rglob('*.lsx')):
+            data = file.read_text(encoding='utf-8', errors='replace').replace('\r\n', '\n')
+            report.asset_files += 1
+            expected = legacy_rewrite(data, VERIFY_PROJECT)
+            actual = AssetPathRewriter(VERIFY_PROJECT).rewrite(data)
+            if expected != actual:
+                diff = difflib.unified_diff(expected.split('\n'), actual.split('\n'), 'legacy', 'rewriter', lineterm='', n=0)
+                report.asset_different[str(file.relative_to(project.parent))] = '\n'.join(line for _, line in zip(range(DIFF_LINES), diff))
+    return report
+
+
+# Compare two converted copies of a corpus, e.g. from two versions of the tool in CI:
+# py -m helpers.ConvertVerifier <reference dir> <fast dir> [--json <file>]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare converted .tbl/.stats/.mei/_fix.xml files of two runs on the same source')
+    parser.add_argument('reference', type=Path, help='Dir converted with the reference code')
+    parser.add_argument('fast', type=Path, help='Dir converted with the code to check')
+    parser.add_argument('--json', type=Path, default=None, help='Also write the report to this file')
+    parser.add_argument('--brief', action='store_true', help='Only list differing files, without diffs')
+    args = parser.parse_args()
+
+    verify_report = compare_outputs(args.reference, args.fast)
+    verify_report.print_summary(not args.brief)
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(verify_report.to_dict(), f, indent=4)
+    sys.exit(0 if verify_report.ok else 1)
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import zlib
+from contextlib import closing
+from pathlib import Path
+
+from colorama import Fore
+
+DB_REGISTRY_FILE = 'db_registry.sqlite'
+# dbVersion setting: '' loads db.json, 'auto' picks the set matching the game version of each converted mod
+DB_VERSION_AUTO = 'auto'
+# header of lsx files, the game build that saved the file
+GAME_VERSION = re.compile(rb'<version major="(\d+)" minor="(\d+)" revision="(\d+)" build="(\d+)"')
+PEEK_BYTES = 512
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, game_version TEXT);
+CREATE TABLE IF NOT EXISTS tables (version TEXT NOT NULL, name TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (version, name));
+CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL);
+'''
+
+
+def parse_game_version(text: str) -> tuple:
+    return tuple(int(part) for part in text.split('.'))
+
+
+def format_game_version(version: tuple) -> str:
+    return '.'.join(str(part) for part in version)
+
+
+def peek_game_version(meta_file: Path) -> tuple:
+    """
+        Game version from the header of a meta.lsx, without parsing it (None if not found)
+    """
+    try:
+        with open(meta_file, 'rb') as f:
+            match = GAME_VERSION.search(f.read(PEEK_BYTES))
+        return None if match is None else tuple(int(part) for part in match.groups())
+    except OSError:
+        return None
+
+
+def find_game_version(source_path: Path) -> tuple:
+    """
+        Newest game version of the mods in source_path (a mod or a dir of projects), None without a readable meta.lsx
+    """
+    if source_path is None or not source_path.is_dir():
+        return None
+    versions = [peek_game_version(meta) for pattern in ['Mods/*/meta.lsx', '*/Mods/*/meta.lsx']
+                for meta in source_path.glob(pattern)]
+    versions = [v for v in versions if v is not None]
+    return max(versions) if versions else None
+
+
+# One definition set of the registry, used like the db.json dict. Top level tables (LSX, Stats, DataTypes)
+# are read and decompressed the first time they are used, a stats only mod never loads the LSX table.
+class PatchDB:
+    def __init__(self, path: Path, version: str, hashes: dict[str, str]):
+        """
+        :param path: Registry file
+        :param version: Name of the set
+        :param hashes: Table name -> hash of its stored data
+        """
+        self.path = Path(path)
+        self.version = version
+        self.hashes = hashes
+        self._tables: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    # pipeline and chunk worker processes load the tables they use themselves
+    def __getstate__(self):
+        return {'path': self.path, 'version': self.version, 'hashes': self.hashes}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['version'], state['hashes'])
+
+    def __getitem__(self, name: str) -> dict:
+        table = self._tables.get(name, None)
+        if table is None:
+            with self._lock:
+                if name not in self._tables:
+                    if name not in self.hashes:
+                        raise KeyError(name)
+                    self._tables[name] = self._load(self.hashes[name])
+                table = self._tables[name]
+        return table
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self.hashes else default
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.hashes
+
+    def __iter__(self):
+        return iter(self.hashes)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def keys(self):
+        return self.hashes.keys()
+
+    def loaded(self) -> list[str]:
+        return list(self._tables)
+
+    @property
+    def digest(self) -> str:
+        """
+            Hash of the stored tables, stands in for the whole set in fingerprints
+        """
+        return hashlib.sha1(json.dumps(self.hashes, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _load(self, table_hash: str) -> dict:
+        with closing(sqlite3.connect(self.path)) as connection:
+            row = connection.execute('SELECT data FROM blobs WHERE hash = ?', (table_hash,)).fetchone()
+        if row is None:
+            raise KeyError(f'Table {table_hash} missing from {self.path}')
+        return json.loads(zlib.decompress(row[0]))
+
+
+# Several versions of the db.json definition sets in one file, e.g. one per game patch a mod can target.
+# Tables are stored compressed and once per content, so versions sharing a table don't store it twice.
+# Each version can record the game version it starts at, mods are matched to the newest version not
+# newer than the game version in their meta.lsx.
+class DBRegistry:
+    def __init__(self, path: Path):
+        """
+        :param path: SQLite file, created when missing
+        """
+        self.path = Path(path)
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def versions(self) -> dict[str, tuple]:
+        """
+            Registered set -> game version it starts at (None if not recorded), in the order they were added
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute('SELECT name, game_version FROM versions ORDER BY rowid').fetchall()
+        return {name: None if game_version is None else parse_game_version(game_version) for name, game_version in rows}
+
+    def add(self, name: str, db: dict, game_version: tuple = None):
+        """
+            Registers db (a db.json dict) as name, replacing a set of the same name
+        """
+        with closing(self.connect()) as connection, connection:
+            connection.execute('DELETE FROM tables WHERE version = ?', (name,))
+            connection.execute('INSERT OR REPLACE INTO versions (name, game_version) VALUES (?, ?)',
+                               (name, None if game_version is None else format_game_version(game_version)))
+            for table, data in db.items():
+                encoded = json.dumps(data).encode('utf-8')
+                table_hash = hashlib.sha1(encoded).hexdigest()
+                connection.execute('INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)', (table_hash, zlib.compress(encoded, 9)))
+                connection.execute('INSERT INTO tables (version, name, hash) VALUES (?, ?, ?)', (name, table, table_hash))
+            self._drop_unused(connection)
+
+    def remove(self, name: str):
+        with closing(self.connect()) as connection, connection:
+            connection.execute('DELETE FROM versions WHERE name = ?', (name,))
+            connection.execute('DELETE FROM tables WHERE version = ?', (name,))
+            self._drop_unused(connection)
+
+    def open(self, name: str) -> PatchDB:
+        """
+            Set registered as name, no table is read until it is used
+        """
+        with closing(self.connect()) as connection:
+            if connection.execute('SELECT 1 FROM versions WHERE name = ?', (name,)).fetchone() is None:
+                raise KeyError(f'{name} is not in {self.path.name}')
+            hashes = dict(connection.execute('SELECT name, hash FROM tables WHERE version = ?', (name,)).fetchall())
+        return PatchDB(self.path, name, hashes)
+
+    def select(self, game_version: tuple = None) -> str:
+        """
+            Newest set starting at or before game_version. Without a match the last added set without
+            a game version, else the oldest set for mods older than every set (the newest one when
+            game_version is None). None for an empty registry.
+        """
+        versions = self.versions()
+        if not versions:
+            return None
+        if game_version is not None:
+            matching = [(start, name) for name, start in versions.items() if start is not None and start <= game_version]
+            if matching:
+                return max(matching)[1]
+        unversioned = [name for name, start in versions.items() if start is None]
+        if unversioned:
+            return unversioned[-1]
+        versioned = sorted((start, name) for name, start in versions.items())
+        return versioned[0][1] if game_version is not None else versioned[-1][1]
+
+    @staticmethod
+    def _drop_unused(connection: sqlite3.Connection):
+        connection.execute('DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM tables)')
+
+
+# Manage the registry: py -m helpers.DBRegistry list | add <name> [--db db.json] [--gameVersion 4.7.1.3] | remove <name> | detect <dir>
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Versioned db.json definition sets, selected per game patch')
+    parser.add_argument('--registry', type=Path, default=Path(DB_REGISTRY_FILE), help=f'Registry file (default ./{DB_REGISTRY_FILE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List registered sets')
+    add_parser = commands.add_parser('add', help='Register a db.json as a set')
+    add_parser.add_argument('name', help='Name of the set, e.g. patch7')
+    add_parser.add_argument('--db', type=Path, default=Path('db.json'), help='db.json to register (default ./db.json)')
+    add_parser.add_argument('--gameVersion', default=None, help='First game version (as in the meta.lsx version header) the set applies to')
+    remove_parser = commands.add_parser('remove', help='Remove a set')
+    remove_parser.add_argument('name')
+    detect_parser = commands.add_parser('detect', help='Show the set selected for a mod or dir of projects')
+    detect_parser.add_argument('source', type=Path)
+    args = parser.parse_args()
+
+    registry = DBRegistry(args.registry)
+    if args.command == 'add':
+        with open(args.db, encoding='utf-8') as f:
+            registry.add(args.name, json.load(f), None if args.gameVersion is None else parse_game_version(args.gameVersion))
+        print(f'{Fore.GREEN}[db] Registered {args.name} ({args.registry.stat().st_size / 1024:.0f} KB registry){Fore.RESET}')
+    elif args.command == 'remove':
+        registry.remove(args.name)
+    elif args.command == 'detect':
+        detected = find_game_version(args.source)
+        print(f'{Fore.CYAN}[db] Game version {"not found" if detected is None else format_game_version(detected)}, '
+              f'using {registry.select(detected)}{Fore.RESET}')
+    else:
+        for version_name, start in registry.versions().items():
+            print(f'\t{version_name}: {"any game version" if start is None else "from " + format_game_version(start)}')
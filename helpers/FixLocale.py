@@ -1,39 +1,59 @@
 from pathlib import Path
 from colorama import Fore, Back, Style
 import colorama
+from helpers import RunLog
+from helpers.MemoryTracker import memory_phase
 import xmltodict
 import json
 import os
 
 class FixLocale():
-	def fix(self, file, conv):
+	def fix(self, file, verbose=True):
 		try:
-			data = conv.readxml(file)
-			dupes = 0
-			vfix = 0
-			db = {}
-			construct = []
-
-			# Fix dupes
-			for x in data["contentList"]["content"]:
-				if not x['@contentuid'] in db.keys():
-					construct.append(x)
-					db[x['@contentuid']] = x['@version']
-					continue
-				dupes += 1
-				#print(x['@contentuid'])
-				if int(x['@version']) > int(db[x['@contentuid']]):
-					db[x['@contentuid']] = x['@version']
-
-			# Set Versions all to 1
-			for x in construct:
-				if x['@version'] != '1':
-					vfix += 1
-				x['@version'] = '1'
-
-			data["contentList"]["content"] = construct
-			conv.writexml(data, str(file).replace('.xml', '_fix.xml'))
-			print(f'{Fore.GREEN}[locale] Fixed {os.path.basename(file)} (Duplicates: {dupes}; Version Resets: {vfix}){Fore.WHITE}')
+			with open(file, 'rb') as f:
+				data, dupes, vfix = fix_locale(f.read())
+			with open(str(file).replace('.xml', '_fix.xml'), 'wb') as f:
+				f.write(data)
+			if verbose:
+				RunLog.info(f'[locale] Fixed {os.path.basename(file)} (Duplicates: {dupes}; Version Resets: {vfix})')
 			return True
 		except Exception as e:
 			return False
+
+
+# Fixed locale xml without touching the disk, raises for data that isn't a locale file
+def fix_locale_bytes(data):
+	return fix_locale(data)[0]
+
+
+# Drop duplicate entries and set all versions to 1
+# :return: (fixed xml, number of duplicates, number of version resets)
+def fix_locale(data):
+	with memory_phase('parse'):
+		data = xmltodict.parse(data)
+	dupes = 0
+	vfix = 0
+	db = {}
+	construct = []
+
+	with memory_phase('convert'):
+		# Fix dupes
+		for x in data["contentList"]["content"]:
+			if not x['@contentuid'] in db.keys():
+				construct.append(x)
+				db[x['@contentuid']] = x['@version']
+				continue
+			dupes += 1
+			#print(x['@contentuid'])
+			if int(x['@version']) > int(db[x['@contentuid']]):
+				db[x['@contentuid']] = x['@version']
+
+		# Set Versions all to 1
+		for x in construct:
+			if x['@version'] != '1':
+				vfix += 1
+			x['@version'] = '1'
+
+	data["contentList"]["content"] = construct
+	with memory_phase('write'):
+		return xmltodict.unparse(data, pretty=True, indent='  ').encode('utf-8'), dupes, vfix
@@ -1,9 +1,18 @@
 import sys
+from fnmatch import fnmatch
 from pathlib import Path
+from typing import Callable, Optional
+
+from helpers import RunLog
 
 
 LSX_SUFFIX_FAMILY: list[str] = [".lsf", ".lsb", ".lsbs", ".lsbc", ".lsfx"]
 LOCA_TYPE = ".loca"
+# Files that need conversion (or are needed to detect projects), everything else is an asset
+CONVERTIBLE_PATTERNS: list[str] = ["*.txt", "*.lsx", "*.lsf", "*.lsb", "*.lsbs", "*.lsbc", "*.lsfx",
+                                   "*.loca", "*.xml", "meta.lsx"]
+# Files per LSLibUtil.convert_files call when converting many resources
+CONVERT_BATCH_SIZE = 256
 
 
 class LSLibUtil:
@@ -20,29 +29,73 @@ class LSLibUtil:
 
         # set up LSLib types for local use
         clr.AddReference("LSLib")  # type: ignore
-        from LSLib.LS import LocaFormat, LocaUtils, Packager, ResourceUtils, ResourceConversionParameters, ResourceLoadParameters  # type: ignore
+        from LSLib.LS import LocaFormat, LocaUtils, Packager, PackageReader, PackagedFileInfo, ResourceUtils, ResourceConversionParameters, ResourceLoadParameters  # type: ignore
+        from LSLib.LS.Enums import ResourceFormat  # type: ignore
         from LSLib.LS.Enums import Game  # type: ignore
 
         self.load_params = ResourceLoadParameters.FromGameVersion(Game.BaldursGate3)
         self.conversion_params = ResourceConversionParameters.FromGameVersion(Game.BaldursGate3)
         self.packager = Packager()
+        self.package_reader = PackageReader
+        self.packaged_file_info = PackagedFileInfo
         self.resource_utils = ResourceUtils
+        self.resource_format = ResourceFormat
+        self.resource_load_parameters = ResourceLoadParameters
+        self.resource_conversion_parameters = ResourceConversionParameters
         self.loca_utils = LocaUtils
         self.loca_format = LocaFormat
 
         # setup System types for file conversion
         clr.AddReference('System')  # type: ignore
-        from System.IO import File, FileStream, FileMode  # type: ignore
+        from System import Array, Boolean, Func, String  # type: ignore
+        from System.IO import File, FileStream, FileMode, MemoryStream  # type: ignore
+        from System.Text import Encoding  # type: ignore
 
+        self.clr = clr
+        self.array = Array
+        self.string = String
+        self.func = Func
+        self.boolean = Boolean
         self.file = File
         self.file_stream = FileStream
         self.file_mode = FileMode
+        self.memory_stream = MemoryStream
+        self.encoding = Encoding
+
+        # compiled .NET loops used by convert_files (False) and convert_texts (True), built on first use
+        self._batch_convert: dict[bool, object] = {}
+        self._formats: dict[str, object] = {}
 
     def uncompress_package(self, source_file: Path, output_path: Path):
         if source_file is None or output_path is None:
             return
         self.packager.UncompressPackage(str(source_file.resolve()), str(output_path.resolve()))
 
+    def list_package(self, source_file: Path) -> list[tuple[str, int]]:
+        """
+            Lists package contents without extracting anything
+
+        :return: (name, uncompressed size) for every file in the package
+        """
+        package = self.package_reader().Read(str(source_file.resolve()))
+        try:
+            return [(str(f.Name), int(f.Size())) for f in package.Files]
+        finally:
+            package.Dispose()
+
+    def uncompress_package_filtered(self, source_file: Path, output_path: Path, name_filter: Callable[[str], bool]):
+        """
+            Extracts only package files whose name passes name_filter
+        """
+        if source_file is None or output_path is None:
+            return
+        package = self.package_reader().Read(str(source_file.resolve()))
+        try:
+            func = self.func[self.packaged_file_info, self.boolean](lambda f: bool(name_filter(str(f.Name))))
+            self.packager.UncompressPackage(package, str(output_path.resolve()), func)
+        finally:
+            package.Dispose()
+
     def convert_file(self, source_file: Path, output_path: Path):
         if source_file is None or output_path is None:
             return
@@ -54,6 +107,140 @@ class LSLibUtil:
         resource = self.resource_utils.LoadResource(input_str, self.load_params)
         self.resource_utils.SaveResource(resource, output_str, out_format, self.conversion_params)
 
+    def convert_files(self, pairs: list[tuple[Path, Path]]) -> list[Optional[str]]:
+        """
+            Converts many resources with a single call into .NET. Paths and output formats are
+            marshaled as arrays once and the load/save loop runs on the CLR side, instead of three
+            interop round trips per file. A failing file doesn't stop the batch.
+
+        :param pairs: (source file, output path) tuples, output format is taken from the extension
+        :return: Error message per pair, None for files converted successfully
+        """
+        if not pairs:
+            return []
+        inputs = [str(source.resolve()) for source, _ in pairs]
+        outputs = [str(output.resolve()) for _, output in pairs]
+        formats = [self._output_format(output) for output in outputs]
+
+        return self._convert_batch(inputs, outputs, formats, from_text=False)
+
+    def convert_texts(self, pairs: list[tuple[str, Path]]) -> list[Optional[str]]:
+        """
+            Same as convert_files for lsx documents held in memory, nothing is read from disk.
+            Strings are marshaled as they are and encoded to utf-8 on the CLR side.
+
+        :param pairs: (lsx document, output path) tuples, output format is taken from the extension
+        :return: Error message per pair, None for files converted successfully
+        """
+        if not pairs:
+            return []
+        inputs = [text for text, _ in pairs]
+        outputs = [str(output.resolve()) for _, output in pairs]
+        formats = [self._output_format(output) for output in outputs]
+        return self._convert_batch(inputs, outputs, formats, from_text=True)
+
+    def _convert_batch(self, inputs: list[str], outputs: list[str], formats: list, from_text: bool) -> list[Optional[str]]:
+        batch_convert = self._batch_converter(from_text)
+        if batch_convert is None:
+            return [self._convert_one(i, o, f, from_text) for i, o, f in zip(inputs, outputs, formats)]
+
+        errors = self.array.CreateInstance(self.string, len(inputs))
+        batch_convert(self.array[self.string](inputs),
+                      self.array[self.string](outputs),
+                      self.array[self.resource_format](formats),
+                      errors)
+        return [None if e is None else str(e) for e in errors]
+
+    def _output_format(self, output: str):
+        suffix = Path(output).suffix.lower()
+        out_format = self._formats.get(suffix, None)
+        if out_format is None:
+            out_format = self.resource_utils.ExtensionToResourceFormat(output)
+            self._formats[suffix] = out_format
+        return out_format
+
+    def _convert_one(self, input_str: str, output_str: str, out_format, from_text: bool = False) -> Optional[str]:
+        try:
+            if from_text:
+                stream = self.memory_stream(self.encoding.UTF8.GetBytes(input_str))
+                resource = self.resource_utils.LoadResource(stream, self.resource_format.LSX, self.load_params)
+            else:
+                resource = self.resource_utils.LoadResource(input_str, self.load_params)
+            self.resource_utils.SaveResource(resource, output_str, out_format, self.conversion_params)
+            return None
+        except Exception as e:
+            return str(e)
+
+    def _batch_converter(self, from_text: bool = False):
+        """
+            Compiles (once) an expression tree equivalent to
+                for (i = 0; i < inputs.Length; i++)
+                    try { SaveResource(LoadResource(inputs[i], load_params), outputs[i], formats[i], conversion_params); }
+                    catch (Exception ex) { errors[i] = ex.Message; }
+            from_text loads inputs[i] as an lsx document instead of a path:
+                LoadResource(new MemoryStream(Encoding.UTF8.GetBytes(inputs[i])), ResourceFormat.LSX, load_params)
+
+        :return: Delegate taking (inputs, outputs, formats, errors) arrays, None if it couldn't be built
+        """
+        if from_text in self._batch_convert:
+            return self._batch_convert[from_text] or None
+        try:
+            from System import Action, Exception as ClrException, Int32, Object, Type, Void  # type: ignore
+            from System.Linq.Expressions import Expression, ParameterExpression  # type: ignore
+
+            def clr_type(t):
+                return self.clr.GetClrType(t)
+
+            string_array = clr_type(self.string).MakeArrayType()
+            format_array = clr_type(self.resource_format).MakeArrayType()
+            inputs = Expression.Parameter(string_array, 'inputs')
+            outputs = Expression.Parameter(string_array, 'outputs')
+            formats = Expression.Parameter(format_array, 'formats')
+            errors = Expression.Parameter(string_array, 'errors')
+            i = Expression.Variable(clr_type(Int32), 'i')
+            ex = Expression.Variable(clr_type(ClrException), 'ex')
+            done = Expression.Label('done')
+
+            resource_utils = clr_type(self.resource_utils)
+            if from_text:
+                stream_type = clr_type(self.memory_stream)
+                load_resource = resource_utils.GetMethod('LoadResource', self.array[Type]([
+                    stream_type.BaseType, clr_type(self.resource_format), clr_type(self.resource_load_parameters)]))
+                get_bytes = clr_type(self.encoding).GetMethod('GetBytes', self.array[Type]([clr_type(self.string)]))
+                utf8_bytes = Expression.Call(Expression.Constant(self.encoding.UTF8), get_bytes, Expression.ArrayIndex(inputs, i))
+                stream = Expression.New(stream_type.GetConstructor(self.array[Type]([get_bytes.ReturnType])), utf8_bytes)
+                load_args = [stream, Expression.Constant(self.resource_format.LSX), Expression.Constant(self.load_params)]
+            else:
+                load_resource = resource_utils.GetMethod('LoadResource', self.array[Type]([
+                    clr_type(self.string), clr_type(self.resource_load_parameters)]))
+                load_args = [Expression.ArrayIndex(inputs, i), Expression.Constant(self.load_params)]
+            save_resource = next(m for m in resource_utils.GetMethods()
+                                 if m.Name == 'SaveResource' and len(m.GetParameters()) == 4)
+
+            load = Expression.Call(load_resource, self.array[Expression](load_args))
+            save = Expression.Call(save_resource, load, Expression.ArrayIndex(outputs, i),
+                                   Expression.ArrayIndex(formats, i), Expression.Constant(self.conversion_params))
+            store_error = Expression.Assign(Expression.ArrayAccess(errors, i), Expression.Property(ex, 'Message'))
+            convert = Expression.TryCatch(Expression.Block(clr_type(Void), save),
+                                          Expression.Catch(ex, Expression.Block(clr_type(Void), store_error)))
+            loop = Expression.Loop(
+                Expression.IfThenElse(Expression.LessThan(i, Expression.ArrayLength(inputs)),
+                                      Expression.Block(convert, Expression.PreIncrementAssign(i)),
+                                      Expression.Break(done)),
+                done)
+            body = Expression.Block(self.array[ParameterExpression]([i]),
+                                    self.array[Expression]([Expression.Assign(i, Expression.Constant(0)), loop]))
+
+            lambda_type = clr_type(Action).Assembly.GetType('System.Action`4').MakeGenericType(
+                self.array[Type]([string_array, string_array, format_array, string_array]))
+            compiled = Expression.Lambda(lambda_type, body, self.array[ParameterExpression]([inputs, outputs, formats, errors])).Compile()
+            # Compile() is typed as Delegate, so invoke it through DynamicInvoke
+            self._batch_convert[from_text] = lambda *args: compiled.DynamicInvoke(self.array[Object](list(args)))
+        except Exception as e:
+            RunLog.warning(f'[lslib] Batch conversion unavailable, converting file by file:\n\tReason: {e}', 'Batch conversion unavailable', str(e))
+            self._batch_convert[from_text] = False
+        return self._batch_convert[from_text] or None
+
     def convert_loca_file(self, source_file: Path, output_path: Path):
         file = None
         try:
@@ -71,3 +258,12 @@ class LSLibUtil:
     @staticmethod
     def is_loca_type(suffix: str):
         return LOCA_TYPE == suffix
+
+    @staticmethod
+    def matches_patterns(name: str, patterns: list[str]) -> bool:
+        """
+            Check package file name (posix path inside the pak) against glob patterns
+        """
+        name = name.replace('\\', '/')
+        base_name = name.rsplit('/', 1)[-1]
+        return any(fnmatch(base_name, p) or fnmatch(name, p) for p in patterns)
@@ -1,12 +1,18 @@
 import json
 import os
+import sys
 import uuid
+from io import BytesIO
 from pathlib import Path
 
 import xmltodict
 from colorama import Fore
 
-from helpers.LSLibUtil import LSLibUtil
+from helpers import RunLog
+from helpers.ConvertContext import ConvertContext
+from helpers.LSLibUtil import CONVERT_BATCH_SIZE, LSLibUtil
+from helpers.MemoryTracker import memory_phase
+from helpers.StatsModel import Field, StatObject, StatsDocument
 
 
 def map_modifier_type(attribute_type: str) -> str:
@@ -19,7 +25,7 @@ def map_modifier_type(attribute_type: str) -> str:
     elif attribute_type == "4":
         return "Template"
     else:
-        print(f'{Fore.YELLOW}[info] Unknown modifier type in Rulebook [{attribute_type}] {Fore.RESET}')
+        RunLog.warning(f'[info] Unknown modifier type in Rulebook [{attribute_type}]', 'Unknown modifier type in Rulebook', attribute_type)
         return attribute_type
 
 
@@ -32,6 +38,9 @@ class LSXconvert:
     lslib_util: LSLibUtil = None
     root_path = None
 
+    # leave lsf conversion of resources to the project build, which converts them after rewriting their paths
+    defer_lsf = False
+
     lsf_types = ['Templates', 'SkeletonBank', 'MaterialBank', 'TextureBank', 'VisualBank', 'EffectBank', 'Tags',
                  'MultiEffectInfos', 'CharacterVisualBank', 'Material', 'MaterialPresetBank', 'PhysicsBank']
 
@@ -46,17 +55,49 @@ class LSXconvert:
         self.db = db
         self.root_path = root_path
         self.lslib_util = lslib_util
+        # resources not converted to lsf because of defer_lsf
+        self.deferred_lsf: list[str] = []
 
     def setUUID(self, uuid = None):
         self.uuid = uuid
 
-    # Main call convert function
+    # Main call convert function, converts the file to lsf if needed and writes the .tbl or .mei file next to it
     def convert(self, file):
-        self.file = file
-        self.readxml(file)
-        converted_data, file_path, source_ext, dest_ext = self.convert_all()
-        return self.writexml(converted_data, file_path, source_ext, dest_ext)
-    
+        try: # Try adding recovered entries to auxiliary db
+            with open(self.root_path / 'auxdb_self_recovered.temp', encoding="utf-8") as f:
+                recovered = json.load(f)
+        except Exception as e:
+            recovered = {}
+        with open(file, 'rb') as f:
+            data, suffix, lsf = self.convert_bytes(f.read(), file, recovered)
+
+        if lsf == '.lsfx':
+            RunLog.info(f'[info] Convert file to lsfx: {os.path.basename(self.file)} (Reason: VFX to lsefx not yet supported)', Fore.YELLOW)
+            self.lsx2lsf(lsfx=True)
+        elif lsf is not None:
+            if self.defer_lsf:
+                self.deferred_lsf.append(self.file)
+            else:
+                self.lsx2lsf()
+
+        if data is None:
+            return False
+        with open(self.output_path(file, suffix), 'wb') as f:
+            f.write(data)
+        return True
+
+    # Convert lsx data without touching the disk, name is the file name of the source
+    # :return: (tbl or mei xml, None when there is nothing to write; its suffix; '.lsf' or '.lsfx' when the source needs LSLib)
+    def convert_bytes(self, data, name, recovered = None):
+        self.file = name
+        with memory_phase('parse'):
+            self.data = xmltodict.parse(data)
+        self.auxIDfix = recovered or {}
+        with memory_phase('convert'):
+            converted_data, suffix, lsf = self.convert_all()
+        with memory_phase('write'):
+            return self.serialize(converted_data), suffix, lsf
+
     # Read data from xml file
     def readxml(self, file):
         self.file = file
@@ -64,48 +105,48 @@ class LSXconvert:
             self.data = xmltodict.parse(f.read())
         return self.data
 
-    # Write data to xml file
-    def writexml(self, data, file = None, source_ext = '.lsx', dest_ext = '.tbl'):
-        if file is None:
-            file = self.file
+    # Serialize converted data to xml
+    def serialize(self, data):
         if data is None:
-            return False
-        if source_ext is None:
-            source_ext = '.lsx'
-        if dest_ext is None:
-            dest_ext = '.tbl'
-        out = file.replace(source_ext, dest_ext)
-        with open(out, 'w', encoding="utf-8") as f:
-            f.write(xmltodict.unparse(data, pretty=True, indent='  '))
-        return True
+            return None
+        if isinstance(data, StatsDocument):
+            output = BytesIO()
+            data.write(output)
+            return output.getvalue()
+        return xmltodict.unparse(data, pretty=True, indent='  ').encode('utf-8')
+
+    # Output file for a converted lsx file
+    @staticmethod
+    def output_path(file, suffix = '.tbl'):
+        if suffix == '.mei':
+            base_file = file.replace('.lsx', '')
+            if not base_file.endswith('.lsf'):
+                base_file = base_file + '.lsf'
+            return base_file.replace('.lsf', '.mei')
+        return file.replace('.lsx', suffix)
 
     # Convert function logic
+    # :return: (converted data, suffix of its file, suffix of the LSLib output the source needs)
     def convert_all(self):
         # Get data type
         self.file_type = self.getDataType()
 
         # Ignore Texture Atlas
         if self.file_type in ['IconUVList', 'TextureAtlasInfo']:
-            print(f'{Fore.YELLOW}[info] Skipped file: {os.path.basename(self.file)} (Reason: Texture atlas doesnt need conversion){Fore.WHITE}')
-            return None, None, None, None
+            RunLog.info(f'[info] Skipped file: {os.path.basename(self.file)} (Reason: Texture atlas doesnt need conversion)', Fore.YELLOW)
+            return None, None, None
 
         # Convert VFX (lsfx.lsx to lsfx)
         if self.file_type in ['Effect','Dependencies']:
-            print(f'{Fore.YELLOW}[info] Convert file to lsfx: {os.path.basename(self.file)} (Reason: VFX to lsefx not yet supported){Fore.WHITE}')
-            self.lsx2lsf(lsfx=True)
             # TODO: add conversion to lsefx and return
-            return None, None, None, None
+            return None, None, '.lsfx'
 
         # Convert Visual Resource or Templates to LSF
         if self.file_type in self.lsf_types:
-            self.lsx2lsf()
             # Convert to .mei file
             if self.file_type == 'MultiEffectInfos':
-                base_file = self.file.replace('.lsx', '')
-                if not base_file.endswith('.lsf'):
-                    base_file = base_file + '.lsf'
-                return self.build_mei_file(), base_file, '.lsf', '.mei'
-            return None, None, None, None
+                return self.build_mei_file(), '.mei', '.lsf'
+            return None, None, '.lsf'
 
         # Override uuid
         if self.uuid is None:
@@ -113,39 +154,37 @@ class LSXconvert:
         else:
             nodeUUID = self.db['LSX'].get(self.file_type, self.uuid)
             if nodeUUID != self.uuid:
-                print(f"{Fore.YELLOW}[lsx] ID Override for {os.path.basename(self.file)}: {nodeUUID} ({self.data['save']['region'].get('@id', None)}){Fore.WHITE}")
+                RunLog.info(f"[lsx] ID Override for {os.path.basename(self.file)}: {nodeUUID} ({self.data['save']['region'].get('@id', None)})", Fore.YELLOW)
 
-        construct = {'stats': {'@stat_object_definition_id': nodeUUID, 'stat_objects': {'stat_object': []}}}
+        return self.build_stats(nodeUUID), '.tbl', None
 
-        try: # Try adding recovered entries to auxiliary db
-            with open(self.root_path / 'auxdb_self_recovered.temp', encoding="utf-8") as f:
-                self.auxIDfix = json.load(f)
-        except Exception as e:
-            self.auxIDfix = {}
+    # Build the stats document of a parsed lsx file
+    def build_stats(self, nodeUUID):
+        construct = StatsDocument(nodeUUID)
 
         root = self.data['save']['region']['node']['children']['node']
         for x in root: # loop every node in root
             if isinstance(x, str): # root only contains 1 node
                 t = self.loop_elements(root)
-                construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
+                construct.append(t)
                 break
             else: # construct xml node
                 t = self.loop_elements(x)
-            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
-        return construct, None, None, None
+            construct.append(t)
+        return construct
 
     # Loop all elements in node
     def loop_elements(self, elem):
-        t = []
+        t = StatObject()
         for akey, aval in elem.items():
             t = self.loop_builder(t, akey, aval)
 
         if self.lastName == '':
             self.lastName = self.gen_uuid()
         if not self.node_has_entry(t, 'NameFS'):
-            t.append({'@name':'NameFS','@type':'FixedStringTableFieldDefinition','@value':self.lastName})
+            t.append(Field('NameFS', 'FixedStringTableFieldDefinition', self.lastName))
         if not self.node_has_entry(t, 'Name'):
-            t.append({'@name':'Name','@type':'NameTableFieldDefinition','@value':self.lastName})
+            t.append(Field('Name', 'NameTableFieldDefinition', self.lastName))
         self.lastName = ''
         return t
 
@@ -162,9 +201,9 @@ class LSXconvert:
                     for ax in xval:
                         ax['@id'] = aval['node'].get('@id', None)
                         if builder.get(ax['@id'], None) is None:
-                            builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), '@value': f'{ax["attribute"]["@value"]}'}
+                            builder[ax['@id']] = Field(ax['@id'], self.gen_dict_keytype(ax['@id']), f'{ax["attribute"]["@value"]}')
                         else:
-                            builder[ax['@id']]['@value'] = f'{builder[ax["@id"]]["@value"]};{ax["attribute"]["@value"]}'
+                            builder[ax['@id']].value = f'{builder[ax["@id"]].value};{ax["attribute"]["@value"]}'
                     for ax, bx in builder.items():
                         t.append(bx)
                 return t
@@ -181,14 +220,14 @@ class LSXconvert:
 
                     if tbl_type == "ModifierTableFieldDefinition":
                         attribute_type = map_modifier_type(attribute_type)
-                        builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), 'modifier': {'@value': attribute_value, '@type': attribute_type}}
+                        builder[ax['@id']] = Field(ax['@id'], self.gen_dict_keytype(ax['@id']), children={'modifier': {'@value': attribute_value, '@type': attribute_type}})
                     elif tbl_type == "EnumerationListTableFieldDefinition":
                         pass
                     else:
-                        builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), '@value': attribute_value}
+                        builder[ax['@id']] = Field(ax['@id'], self.gen_dict_keytype(ax['@id']), attribute_value)
 
                 else:
-                    builder[ax['@id']]['@value'] = f'{builder[ax["@id"]]["@value"]};{ax["attribute"]["@value"]}'
+                    builder[ax['@id']].value = f'{builder[ax["@id"]].value};{ax["attribute"]["@value"]}'
             for ax, bx in builder.items():
                 t.append(bx)
         elif self.file_type == 'Rulebook' and aval == 'children':
@@ -196,12 +235,12 @@ class LSXconvert:
                 abilities_data = self.node_get_entry(t, 'Abilities')
 
                 if not abilities_data:
-                    abilities_data = {'@name':'Abilities', '@type':self.gen_dict_keytype('Abilities'), 'value': {'modifier': []}}
+                    abilities_data = Field('Abilities', self.gen_dict_keytype('Abilities'), children={'value': {'modifier': []}})
                     t.append(abilities_data)
 
                 attribute_type, attribute_value = self.get_type_value(lnode['node'])
                 attribute_type = map_modifier_type(attribute_type)
-                abilities_data['value']['modifier'].append({'@value': attribute_value, '@type': attribute_type})
+                abilities_data.children['value']['modifier'].append({'@value': attribute_value, '@type': attribute_type})
             else:
                 # :-(
                 if akey == 'ActionsCapabilities':
@@ -217,7 +256,9 @@ class LSXconvert:
                 for item in items:
                     value_list.append(item['attribute']['@value'])
 
-                t.append({'@name':akey, '@type':node_type, '@enumeration_type_name':self.db['DataTypes']['EnumTypes'].get(akey), '@version': '1', '@value':";".join(value_list)})
+                field = Field(akey, node_type, attrs={'enumeration_type_name': self.db['DataTypes']['EnumTypes'].get(akey), 'version': '1'})
+                field.set('value', ";".join(value_list))
+                t.append(field)
 
         return t
 
@@ -235,15 +276,16 @@ class LSXconvert:
                 attribute_value = attribute['@value']
         return attribute_type, attribute_value
 
-    # Generate dict lsx node from xml node
+    # Generate field from xml node
     def gen_dict(self, node):
         fname, fext = os.path.splitext(os.path.basename(self.file))
         try:
-            ndict = {}
+            field = Field()
 
             # Attach values to keys
             for key, val in node.items():
-                if key == '@id':
+                key = key.removeprefix('@')
+                if key == 'id':
                     # Hardcoded lsx name fixes
                     if self.file_type == 'DefaultValues':
                         if val == 'TableUUID':
@@ -259,33 +301,33 @@ class LSXconvert:
                         if val == 'ChangeScript':
                             val = 'ScriptName'
 
-                    ndict['@name'] = val
+                    field.name = sys.intern(val)
                     continue
-                if key == '@type':
-                    ndict[key] = self.gen_dict_keytype(ndict.get('@name', None), ndict.get('@name', None))
+                if key == 'type':
+                    field.type = sys.intern(self.gen_dict_keytype(field.name, field.name))
                     continue
-                if key == '@value' and ndict.get('@type', None) == 'TranslatedStringTableFieldDefinition':
-                    ndict['@handle'] = val
-                    ndict['@version'] = '1'
+                if key == 'value' and field.type == 'TranslatedStringTableFieldDefinition':
+                    field.set('handle', val)
+                    field.set('version', '1')
                     continue
 
                 # Enum specific fields
-                if ndict.get('@type', None) == 'EnumerationTableFieldDefinition' or ndict.get('@type', None) == 'EnumerationListTableFieldDefinition':
-                    ndict['@version'] = '1'
-                    ndict['@enumeration_type_name'] = self.db['DataTypes']['EnumTypes'].get(ndict.get('@name', None), ndict.get('@name', None))
-                    val = self.db['DataTypes']['EnumSubTypes'].get(ndict.get('@name', None), {})
+                if field.type == 'EnumerationTableFieldDefinition' or field.type == 'EnumerationListTableFieldDefinition':
+                    field.set('version', '1')
+                    field.set('enumeration_type_name', self.db['DataTypes']['EnumTypes'].get(field.name, field.name))
+                    val = self.db['DataTypes']['EnumSubTypes'].get(field.name, {})
                     if isinstance(val, dict):
-                        ndict['@value'] = val.get(node['@value'], node['@value'])
+                        field.set('value', val.get(node['@value'], node['@value']))
                     else:
-                        ndict['@value'] = node['@value']
+                        field.set('value', node['@value'])
 
-                if ndict.get(key, None) is None:
-                    if key == '@value' and ndict['@name'] == 'Name':
+                if field.get(key, None) is None:
+                    if key == 'value' and field.name == 'Name':
                         self.lastName = val
-                    ndict[key] = val
-            return ndict
+                    field.set(key, val)
+            return field
         except Exception as e:
-            print(f'[lsx] Exception: {e}; Ignored')
+            RunLog.warning(f'[lsx] Exception: {e}; Ignored', 'Exception ignored', str(e), os.path.basename(self.file))
 
     # Translate lsx node type to tbl type
     def gen_dict_keytype(self, key = None, val = None):
@@ -374,24 +416,12 @@ class LSXconvert:
         return str(uuid.uuid4())
 
     # Check if node contains element
-    def node_has_entry(self, node, entry):
-        try:
-            for x in node:
-                if x.get('@name', None) == entry:
-                    return True
-            return False
-        except Exception:
-            return False
+    def node_has_entry(self, node: StatObject, entry):
+        return node.has(entry)
 
     # Get entry from node
-    def node_get_entry(self, node, entry):
-        try:
-            for x in node:
-                if x.get('@name', None) == entry:
-                    return x
-            return None
-        except Exception:
-            return None
+    def node_get_entry(self, node: StatObject, entry):
+        return node.get(entry)
 
     def getDataType(self, file = None):
         if not file is None:
@@ -412,19 +442,52 @@ class LSXconvert:
             file = self.file
 
         file_path = Path(file)
-        trimmed_file_path = file_path
-        # Due to unpacking some files get multiple suffix, so trim duplicates
-        while trimmed_file_path.suffix in {'.lsf', '.lsx'}:
-            trimmed_file_path = trimmed_file_path.with_suffix('')
-        if lsfx:
-            output = trimmed_file_path.with_suffix(".lsfx")
-        else:
-            output = trimmed_file_path.with_suffix(".lsf")
+        output = self.lsf_output_path(file_path, lsfx)
         if output.exists():
             os.remove(output)
 
         self.lslib_util.convert_file(file_path, output)
 
         if verbose:
-            print(f'{Fore.GREEN}[info] Converted {os.path.basename(self.file)} (Converted to LSF){Fore.RESET}')
+            RunLog.info(f'[info] Converted {os.path.basename(self.file)} (Converted to LSF)')
         return True
+
+    # Convert many files to LSF with one LSLib call per batch, returns files that failed.
+    # With texts (lsx documents of files, already in memory) LSLib doesn't read the files again.
+    def lsx2lsf_batch(self, files, lsfx = False, texts = None):
+        pairs = []
+        for file in files:
+            file_path = Path(file)
+            output = self.lsf_output_path(file_path, lsfx)
+            if output.exists():
+                os.remove(output)
+            pairs.append((file_path, output))
+
+        failed = []
+        for start in range(0, len(pairs), CONVERT_BATCH_SIZE):
+            batch = pairs[start:start + CONVERT_BATCH_SIZE]
+            if texts is None:
+                errors = self.lslib_util.convert_files(batch)
+            else:
+                errors = self.lslib_util.convert_texts([(text, output) for text, (_, output) in zip(texts[start:start + CONVERT_BATCH_SIZE], batch)])
+            failed.extend(str(file_path) for (file_path, _), error in zip(batch, errors) if error is not None)
+        return failed
+
+    @staticmethod
+    def lsf_output_path(file_path: Path, lsfx = False) -> Path:
+        trimmed_file_path = file_path
+        # Due to unpacking some files get multiple suffix, so trim duplicates
+        while trimmed_file_path.suffix in {'.lsf', '.lsx'}:
+            trimmed_file_path = trimmed_file_path.with_suffix('')
+        if lsfx:
+            return trimmed_file_path.with_suffix(".lsfx")
+        return trimmed_file_path.with_suffix(".lsf")
+
+
+# Convert lsx data (name is its file name) to tbl or mei xml without touching the disk, None when there is
+# nothing to write. Sets ctx.suffix to the suffix of the result and ctx.lsf when the source still needs LSLib.
+def convert_lsx_bytes(data: bytes, name: str, ctx: ConvertContext) -> bytes:
+    converter = LSXconvert(ctx.db)
+    converter.setUUID(ctx.uuid)
+    output, ctx.suffix, ctx.lsf = converter.convert_bytes(data, name, ctx.recovered)
+    return output
@@ -0,0 +1,435 @@
+import os
+
+import xmltodict
+
+from helpers import RunLog
+from helpers.LSXtoTBL import LSXconvert, map_modifier_type
+from helpers.Stats2kit import StatsConvert
+
+# Converters as they were before the stats model, streaming writers, chunks and in-memory locale fixes.
+# They build the nested xmltodict dicts and unparse them, sharing nothing with the model layer, and are
+# the reference verify runs compare the current converters against. Only file handling and logging
+# follow the current converters, keep the conversion logic as is.
+
+
+class LegacyStatsConvert(StatsConvert):
+    # Every file goes through convert_all, no streaming treasure tables or chunks
+    def convert_text(self, text, name, output):
+        self.file = name
+        self.data = text
+        return self.writexml(self.convert_all(save_recovered=False), output)
+
+    # Convert function logic
+    def convert_all(self, save_recovered = True):
+        if self.uuid is None:
+            nodeUUID = ''
+        else:
+            nodeUUID = self.uuid
+        if self.auxdb is None:
+            self.auxdb = {}
+
+        construct = {'stats': {'@stat_object_definition_id': nodeUUID, 'stat_objects': {'stat_object': []}}}
+        auxIDfix = {}
+
+        # Special handling for awesome treasure tables
+        if self.data.startswith(("treasure", "new treasuretable")):
+            self.process_treasure_table(construct)
+        else: # All other files
+            # Read line by line
+            t = []
+            i = 0
+            dupes = []
+
+            for line in self.data.split("\n"):
+                i += 1
+                raw = line.split('"')[1::2]
+
+                if len(raw) > 0: # Ignore duplicate entries
+                    if raw[0] in dupes:
+                        continue
+                    dupes.append(raw[0])
+                if line[:3:] == "new": # Data definition entries
+                    if len(t) > 0: # Data seperation
+                        if not (not t):
+                            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
+                        t = []
+                        i = 0
+                    dupes = []
+                    newUID = self.gen_uuid()
+                    stat_name = raw[0]
+                    if os.path.basename(self.file).startswith("Spell_"):
+                        stat_name = raw[0].removeprefix(f'{os.path.basename(self.file).split(".")[0].replace("Spell_","")}_')
+
+                    fname, fext = os.path.splitext(os.path.basename(self.file).replace("Spell_",""))
+                    if fname == "Projectile" or fname == "Target" or fname == "Zone" or fname == "Shout" or fname == "ProjectileStrike" or fname == "Rush" or fname == "Teleportation" or fname == "Throw":
+                        auxIDfix[f'{fname}_{stat_name}'] = newUID
+                    else:
+                        auxIDfix[stat_name] = newUID
+
+                    t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': newUID})
+                    t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': stat_name})
+                    continue
+                if line[:5:] == "using": # Skip parent if IDs not in aux db
+                    t.append({'@name': 'Using', '@type': 'BaseClassTableFieldDefinition', '@value': self.auxdb.get(raw[0],raw[0])})
+                    continue
+                if line[:4:] == "data": # Data entries
+                    builder = self.gen_dict(raw)
+                    if not builder is None:
+                        t.append(builder)
+                    continue
+            # Append current construct if file did not end on an empty line
+            if i != 0:
+                if not (not t):
+                    construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
+
+        # Try fixing parent IDs
+        isRecovered = True
+        for i, x in enumerate(construct['stats']['stat_objects']['stat_object']):
+            for y, val in enumerate(x['fields']['field']):
+                if val['@name'] == 'Using' and not self.is_guid(val['@value']):
+                    construct['stats']['stat_objects']['stat_object'][i]['fields']['field'][y]['@value'] = auxIDfix.get(val['@value'],'')
+                    if construct['stats']['stat_objects']['stat_object'][i]['fields']['field'][y]['@value'] == '':
+                        isRecovered = False
+        if not isRecovered:
+            RunLog.warning(f'[stats] Missing parent entries in: {os.path.basename(self.file)}', 'Missing parent entries', file=os.path.basename(self.file))
+        self.auxIDfix = auxIDfix
+        if save_recovered:
+            self.save_recovered(auxIDfix)
+        return construct
+
+    # Generate xml object to construct entry data
+    def gen_dict(self, data, legacy = False):
+        fname, fext = os.path.splitext(os.path.basename(self.file).replace("Spell_",""))
+        try:
+            builder = {'@name': data[0], '@type': self.db['DataTypes'].get(data[0], ''), '@value':''}
+            if fname == 'Interrupt': # Hardcoded Properties checks
+                if data[0] == 'Properties':
+                    builder['@type'] = 'StringTableFieldDefinition'
+                if data[0] == 'EnableContext':
+                    data[0] = 'EnabledContext'
+                    builder['@name'] = data[0]
+                if data[0] == 'EnableCondition':
+                    data[0] = 'EnabledConditions'
+                    builder['@name'] = data[0]
+            if self.db['DataTypes'].get(data[0], '') == "TranslatedStringTableFieldDefinition": # Translated entries
+                builder['@handle'] = data[1].split(";")[0]
+                builder['@version'] = "1"
+            else: # All normal entries
+                if data[1] == "":
+                    builder['@value'] = ""
+                    builder['@clear_inherited_value'] = "true"
+                if builder['@value'] == '':
+                    builder['@value'] = data[1]
+            if self.db['DataTypes'].get(data[0], '') == '':
+                if not data[0] in ['SpellType', 'StatusType']:
+                    RunLog.warning(f'[stats] Missing Pre-Configured Data Type: {data[0]}', 'Missing Pre-Configured Data Type', data[0], os.path.basename(self.file))
+            if self.db['DataTypes'].get(data[0], '') == "EnumerationListTableFieldDefinition" or self.db['DataTypes'].get(data[0], '') == "EnumerationTableFieldDefinition": # Enum types
+                # Special handling for status/spell sheathing fields named the same but different enums
+                if fname.startswith('Status_') and data[0] == 'Sheathing':
+                    enum_type_lookup = f'{data[0]}_Status'
+                else:
+                    enum_type_lookup = data[0]
+                builder['@enumeration_type_name'] = self.db['DataTypes']['EnumTypes'].get(enum_type_lookup, enum_type_lookup)
+
+                builder['@version'] = "1"
+                if not builder['@value'] == '':
+                    val = self.db['DataTypes']['EnumSubTypes'].get(builder['@enumeration_type_name'], builder['@value'])
+                    if isinstance(val, dict):
+                        builder['@value'] = val.get(builder['@value'], builder['@value'])
+            if self.db['DataTypes'].get(data[0], '') == "BoolTableFieldDefinition":
+                if not builder['@value'] == '':
+                    val = self.db['DataTypes']['EnumSubTypes'].get('BoolTableFieldDefinition', builder['@value'])
+                    if isinstance(val, dict):
+                        builder['@value'] = val.get(builder['@value'], builder['@value'])
+            return builder
+        except Exception as e:
+            RunLog.warning(f'[stats] Exception: {e}; Ignored', 'Exception ignored', str(e), os.path.basename(self.file))
+            return None
+
+    # Convert treasure table logic
+    def process_treasure_table(self, construct: dict):
+        t = []
+        has_subtable = False
+        base_table_uuid = ""
+        base_table_name = ""
+        is_substat = 'false'
+
+        for line in self.data.split("\n"):
+            tokens = line.split(" ")
+
+            # Skip
+            if line == '' or line.startswith("treasure"):
+                continue
+
+            # If we have data and a new table or secondary subtable, output field to main dictionary
+            if not (not t) and (line.startswith("new treasuretable") or line.startswith("new subtable") and has_subtable):
+                construct['stats']['stat_objects']['stat_object'].append({'@is_substat': is_substat, 'fields': {'field': t}})
+                t = []
+                is_substat = 'false'
+                if line.startswith("new subtable"):
+                    is_substat = 'true'
+
+            # Initialize new field section for new table
+            if line.startswith("new treasuretable"):
+                has_subtable = False
+                base_table_uuid = self.gen_uuid()
+                base_table_name = tokens[2].strip('"')
+                t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': base_table_uuid})
+                t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': base_table_name})
+                continue
+
+            if line.startswith("new subtable"):
+                if has_subtable:
+                    builder = self.gen_dict(["Using", base_table_uuid])
+                    if not builder is None:
+                        t.append(builder)
+                    t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': self.gen_uuid()})
+                    t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': str(base_table_name + '_substat')})
+                else:
+                    has_subtable = True
+
+                builder = self.gen_dict(["DropCount", tokens[2].strip('"')])
+                if not builder is None:
+                    t.append(builder)
+                continue
+
+            if line.startswith("object category"):
+                fields = tokens[2].strip('"').split(',')
+                builder = self.gen_dict(["ObjectCategory", fields[0].strip('"')])
+                if not builder is None:
+                    t.append(builder)
+                builder = self.gen_dict(["Frequency", fields[1].strip('"')])
+                if not builder is None:
+                    t.append(builder)
+                continue
+
+            if line.startswith(("MinLevel", "MaxLevel", "StartLevel", "EndLevel", "CanMerge")):
+                field_name = tokens[0]
+                field_value = tokens[1].strip('"')
+                if field_name == "MinLevel" or field_name == "MaxLevel":
+                    field_name = str(field_name + 'Diff')
+                elif field_name == "CanMerge":
+                    if field_value == '1':
+                        field_value = 'Yes'
+                    else:
+                        field_value = 'No'
+                builder = self.gen_dict([field_name, field_value])
+                if not builder is None:
+                    t.append(builder)
+                continue
+
+        if not (not t):
+            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': is_substat, 'fields': {'field': t}})
+
+
+class LegacyLSXconvert(LSXconvert):
+    # Build the stats dict of a parsed lsx file
+    def build_stats(self, nodeUUID):
+        construct = {'stats': {'@stat_object_definition_id': nodeUUID, 'stat_objects': {'stat_object': []}}}
+
+        root = self.data['save']['region']['node']['children']['node']
+        for x in root: # loop every node in root
+            if isinstance(x, str): # root only contains 1 node
+                t = self.loop_elements(root)
+                construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
+                break
+            else: # construct xml node
+                t = self.loop_elements(x)
+            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
+        return construct
+
+    # Loop all elements in node
+    def loop_elements(self, elem):
+        t = []
+        for akey, aval in elem.items():
+            t = self.loop_builder(t, akey, aval)
+
+        if self.lastName == '':
+            self.lastName = self.gen_uuid()
+        if not self.node_has_entry(t, 'NameFS'):
+            t.append({'@name':'NameFS','@type':'FixedStringTableFieldDefinition','@value':self.lastName})
+        if not self.node_has_entry(t, 'Name'):
+            t.append({'@name':'Name','@type':'NameTableFieldDefinition','@value':self.lastName})
+        self.lastName = ''
+        return t
+
+    def loop_builder(self, t, akey, aval, lnode=None):
+        if akey == 'attribute': # Add attribute to builder
+            for node in aval:
+                t.append(self.gen_dict(node))
+        elif akey == 'children': # Combine children and add to builder
+            builder = {}
+            if isinstance(aval['node'], list): # 1 layer
+                chk_node = aval['node']
+            elif not aval['node'].get('children', None) is None: # Multilayer
+                for xkey, xval in aval['node']['children'].items():
+                    for ax in xval:
+                        ax['@id'] = aval['node'].get('@id', None)
+                        if builder.get(ax['@id'], None) is None:
+                            builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), '@value': f'{ax["attribute"]["@value"]}'}
+                        else:
+                            builder[ax['@id']]['@value'] = f'{builder[ax["@id"]]["@value"]};{ax["attribute"]["@value"]}'
+                    for ax, bx in builder.items():
+                        t.append(bx)
+                return t
+            else: # 1 layer but only one node
+                chk_node = [aval['node']]
+
+            for ax in chk_node:
+                if not ax.get('children', None) is None:
+                    t = self.loop_builder(t, ax['@id'], 'children', ax['children'])
+                    continue
+                if builder.get(ax['@id'], None) is None:
+                    tbl_type = self.gen_dict_keytype(ax['@id'])
+                    attribute_type, attribute_value = self.get_type_value(ax)
+
+                    if tbl_type == "ModifierTableFieldDefinition":
+                        attribute_type = map_modifier_type(attribute_type)
+                        builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), 'modifier': {'@value': attribute_value, '@type': attribute_type}}
+                    elif tbl_type == "EnumerationListTableFieldDefinition":
+                        pass
+                    else:
+                        builder[ax['@id']] = {'@name': ax['@id'], '@type': self.gen_dict_keytype(ax['@id']), '@value': attribute_value}
+
+                else:
+                    builder[ax['@id']]['@value'] = f'{builder[ax["@id"]]["@value"]};{ax["attribute"]["@value"]}'
+            for ax, bx in builder.items():
+                t.append(bx)
+        elif self.file_type == 'Rulebook' and aval == 'children':
+            if akey == 'AbilityChanges':
+                abilities_data = self.node_get_entry(t, 'Abilities')
+
+                if not abilities_data:
+                    abilities_data = {'@name':'Abilities', '@type':self.gen_dict_keytype('Abilities'), 'value': {'modifier': []}}
+                    t.append(abilities_data)
+
+                attribute_type, attribute_value = self.get_type_value(lnode['node'])
+                attribute_type = map_modifier_type(attribute_type)
+                abilities_data['value']['modifier'].append({'@value': attribute_value, '@type': attribute_type})
+            else:
+                # :-(
+                if akey == 'ActionsCapabilities':
+                    akey = 'ActionCapabilities'
+
+                node_type = self.gen_dict_keytype(akey)
+                if isinstance(lnode['node'], list):
+                    items = lnode['node']
+                else:
+                    items = [lnode['node']]
+
+                value_list = []
+                for item in items:
+                    value_list.append(item['attribute']['@value'])
+
+                t.append({'@name':akey, '@type':node_type, '@enumeration_type_name':self.db['DataTypes']['EnumTypes'].get(akey), '@version': '1', '@value':";".join(value_list)})
+
+        return t
+
+    # Generate dict lsx node from xml node
+    def gen_dict(self, node):
+        fname, fext = os.path.splitext(os.path.basename(self.file))
+        try:
+            ndict = {}
+
+            # Attach values to keys
+            for key, val in node.items():
+                if key == '@id':
+                    # Hardcoded lsx name fixes
+                    if self.file_type == 'DefaultValues':
+                        if val == 'TableUUID':
+                            val = 'ProgressionUUID'
+                        if val == 'OriginUUID':
+                            val = 'Origin'
+                        if val == 'Add' and fname != 'Spells':
+                            val = 'DefaultValues'
+                    if fname == 'ClassDescriptions' and val == 'ParentGuid':
+                        val = 'ParentUUID'
+                    if fname == 'Rulebook':
+                        # Larian please, I beg you...
+                        if val == 'ChangeScript':
+                            val = 'ScriptName'
+
+                    ndict['@name'] = val
+                    continue
+                if key == '@type':
+                    ndict[key] = self.gen_dict_keytype(ndict.get('@name', None), ndict.get('@name', None))
+                    continue
+                if key == '@value' and ndict.get('@type', None) == 'TranslatedStringTableFieldDefinition':
+                    ndict['@handle'] = val
+                    ndict['@version'] = '1'
+                    continue
+
+                # Enum specific fields
+                if ndict.get('@type', None) == 'EnumerationTableFieldDefinition' or ndict.get('@type', None) == 'EnumerationListTableFieldDefinition':
+                    ndict['@version'] = '1'
+                    ndict['@enumeration_type_name'] = self.db['DataTypes']['EnumTypes'].get(ndict.get('@name', None), ndict.get('@name', None))
+                    val = self.db['DataTypes']['EnumSubTypes'].get(ndict.get('@name', None), {})
+                    if isinstance(val, dict):
+                        ndict['@value'] = val.get(node['@value'], node['@value'])
+                    else:
+                        ndict['@value'] = node['@value']
+
+                if ndict.get(key, None) is None:
+                    if key == '@value' and ndict['@name'] == 'Name':
+                        self.lastName = val
+                    ndict[key] = val
+            return ndict
+        except Exception as e:
+            RunLog.warning(f'[lsx] Exception: {e}; Ignored', 'Exception ignored', str(e), os.path.basename(self.file))
+
+    # Check if node contains element
+    def node_has_entry(self, node, entry):
+        try:
+            for x in node:
+                if x.get('@name', None) == entry:
+                    return True
+            return False
+        except Exception:
+            return False
+
+    # Get entry from node
+    def node_get_entry(self, node, entry):
+        try:
+            for x in node:
+                if x.get('@name', None) == entry:
+                    return x
+            return None
+        except Exception:
+            return None
+
+
+# Locale fix reading the whole file into a dict and unparsing it again
+class LegacyFixLocale:
+    def fix(self, file, verbose=True):
+        try:
+            with open(file, 'r+b') as f:
+                data = xmltodict.parse(f.read())
+            dupes = 0
+            vfix = 0
+            db = {}
+            construct = []
+
+            # Fix dupes
+            for x in data["contentList"]["content"]:
+                if not x['@contentuid'] in db.keys():
+                    construct.append(x)
+                    db[x['@contentuid']] = x['@version']
+                    continue
+                dupes += 1
+                if int(x['@version']) > int(db[x['@contentuid']]):
+                    db[x['@contentuid']] = x['@version']
+
+            # Set Versions all to 1
+            for x in construct:
+                if x['@version'] != '1':
+                    vfix += 1
+                x['@version'] = '1'
+
+            data["contentList"]["content"] = construct
+            with open(str(file).replace('.xml', '_fix.xml'), 'w', encoding="utf-8") as f:
+                f.write(xmltodict.unparse(data, pretty=True, indent='  '))
+            if verbose:
+                RunLog.info(f'[locale] Fixed {os.path.basename(file)} (Duplicates: {dupes}; Version Resets: {vfix})')
+            return True
+        except Exception as e:
+            return False
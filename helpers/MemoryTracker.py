@@ -0,0 +1,237 @@
+import ctypes
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from colorama import Fore
+
+from helpers import RunLog
+from helpers.ProgressEvents import ProgressEvent, ProgressKind
+
+MB = 1024 * 1024
+
+
+@dataclass
+class FileMemory:
+    stage: str
+    file: str
+    size: int
+    peak_alloc: int     # peak bytes python allocated on top of what was in use before the file (tracemalloc)
+    peak_rss: int       # peak resident set size of the process while converting the file
+    # phase of the conversion (read/parse, convert, write) -> its peak_alloc on top of what was in use
+    # when the phase started, and its peak_rss
+    stages: dict[str, dict] = field(default_factory=dict)
+
+    def peak_stage(self) -> str:
+        return max(self.stages, key=lambda name: self.stages[name]['peak_alloc'], default=None)
+
+
+# file window of the conversion running on this thread, for memory_phase
+_current = threading.local()
+
+
+@contextmanager
+def memory_phase(name: str):
+    """
+        Measures a phase of the file converted on this thread (parse, convert, write) as a sub-stage
+        of it when a MemoryTracker tracks the file, does nothing otherwise
+    """
+    scope = getattr(_current, 'scope', None)
+    if scope is None:
+        yield
+        return
+    tracker, window, stages = scope
+    with tracker.phase(window, stages, name):
+        yield
+
+
+def current_rss() -> int:
+    """
+        Resident set size of this process in bytes (0 if it can't be read on this platform)
+    """
+    try:
+        if sys.platform == 'win32':
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return 0
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, AttributeError, ValueError):
+        return 0
+
+
+# Opt-in memory accounting for conversions. Python allocations are traced with tracemalloc
+# (peak per file and per stage) and the process RSS is sampled on a background thread, which
+# also catches memory held outside python (e.g. by LSLib). Subscribe it to ConvertAPI.progress
+# and wrap per file work in file(), same as ConvertProfiler.
+# tracemalloc peaks are process wide, so they are only exact while one file converts at a time.
+class MemoryTracker:
+    def __init__(self, threshold_mb: float = 0, interval: float = 0.05):
+        """
+        :param threshold_mb: Files with a higher peak allocation are flagged (0 to flag none)
+        :param interval: Seconds between RSS samples
+        """
+        self.threshold = int(threshold_mb * MB)
+        self.interval = interval
+        self.stages: dict[str, dict] = {}
+        self.files: list[FileMemory] = []
+        self.flagged: list[FileMemory] = []
+        self.peak_rss = 0
+        # open measurement windows (stages and files), the sampler raises their peak_rss
+        self._windows: list[dict] = []
+        self._stage_windows: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample_loop, name='memory_sampler', daemon=True)
+        self._sampler.start()
+
+    def __call__(self, event: ProgressEvent):
+        thread_id = threading.get_ident()
+        if event.kind == ProgressKind.STAGE_START:
+            tracemalloc.reset_peak()
+            self._stage_windows[thread_id] = self._open_window(event.stage)
+        elif event.kind == ProgressKind.STAGE_END:
+            window = self._stage_windows.pop(thread_id, None)
+            if window is None:
+                return
+            self._close_window(window)
+            with self._lock:
+                stage = self.stages.setdefault(event.stage, {'peak_alloc': 0, 'peak_rss': 0, 'files': 0})
+                stage['peak_alloc'] = max(stage['peak_alloc'], window['peak_alloc'])
+                stage['peak_rss'] = max(stage['peak_rss'], window['peak_rss'])
+                stage['files'] += event.index
+
+    @contextmanager
+    def file(self, path: Path):
+        """
+            Records peak allocation and peak RSS while the block runs
+        """
+        stage_window = self._stage_windows.get(threading.get_ident(), None)
+        window = self._open_window('other' if stage_window is None else stage_window['stage'])
+        # the peak is reset per file, keep what the stage reached so far
+        if stage_window is not None:
+            self._update_peak(stage_window)
+        tracemalloc.reset_peak()
+        stages = {}
+        outer = getattr(_current, 'scope', None)
+        _current.scope = (self, window, stages)
+        try:
+            yield
+        finally:
+            _current.scope = outer
+            self._close_window(window)
+            if stage_window is not None:
+                stage_window['peak_alloc'] = max(stage_window['peak_alloc'],
+                                                 window['base'] + window['peak_alloc'] - stage_window['base'])
+            try:
+                size = path.stat().st_size if path.is_file() else 0
+            except OSError:
+                size = 0
+            record = FileMemory(window['stage'], str(path), size, window['peak_alloc'], window['peak_rss'], stages)
+            with self._lock:
+                self.files.append(record)
+                if 0 < self.threshold < record.peak_alloc:
+                    self.flagged.append(record)
+            if 0 < self.threshold < record.peak_alloc:
+                peak_stage = record.peak_stage()
+                RunLog.warning(f'[memory] {path.name} peaked at {record.peak_alloc / MB:.1f} MB'
+                               f'{"" if peak_stage is None else f", most in {peak_stage}"} (threshold {self.threshold / MB:.0f} MB, file size {size / MB:.1f} MB)',
+                               'Memory threshold exceeded', window['stage'], path.name)
+
+    @contextmanager
+    def phase(self, file_window: dict, stages: dict, name: str):
+        """
+            Records peak allocation and peak RSS of a phase of the file measured in file_window into stages
+        """
+        # the peak is reset per phase, keep what the file reached so far
+        self._update_peak(file_window)
+        window = self._open_window(name)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self._close_window(window)
+            file_window['peak_alloc'] = max(file_window['peak_alloc'],
+                                            window['base'] + window['peak_alloc'] - file_window['base'])
+            stage = stages.setdefault(name, {'peak_alloc': 0, 'peak_rss': 0})
+            stage['peak_alloc'] = max(stage['peak_alloc'], window['peak_alloc'])
+            stage['peak_rss'] = max(stage['peak_rss'], window['peak_rss'])
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.files.clear()
+            self.flagged.clear()
+            self.peak_rss = 0
+
+    def report(self, top: int = 20) -> dict:
+        with self._lock:
+            files = sorted(self.files, key=lambda f: f.peak_alloc, reverse=True)
+            return {
+                'threshold': self.threshold,
+                'peak_rss': self.peak_rss,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'files': len(files),
+                'largest_files': [asdict(f) for f in files[:top]],
+                'over_threshold': [asdict(f) for f in self.flagged]
+            }
+
+    def all_files(self) -> list[dict]:
+        with self._lock:
+            return [asdict(f) for f in self.files]
+
+    def print_summary(self, top: int = 20):
+        report = self.report(top)
+        print(f'{Fore.CYAN}[memory] Peak RSS {report["peak_rss"] / MB:.1f} MB, {report["files"]} files tracked{Fore.RESET}')
+        for name, stage in report['stages'].items():
+            print(f'\t{name}: peak alloc {stage["peak_alloc"] / MB:.1f} MB, peak RSS {stage["peak_rss"] / MB:.1f} MB')
+        if report['largest_files']:
+            print(f'{Fore.CYAN}[memory] Largest peak allocations:{Fore.RESET}')
+            for f in report['largest_files']:
+                phases = ', '.join(f'{name} {stage["peak_alloc"] / MB:.1f}' for name, stage in f['stages'].items())
+                print(f'\t{f["peak_alloc"] / MB:8.1f} MB {f["size"] / 1024:10.1f} KB  [{f["stage"]}] {f["file"]}'
+                      f'{f" ({phases} MB)" if phases else ""}')
+        if report['over_threshold']:
+            print(f'{Fore.YELLOW}[memory] {len(report["over_threshold"])} files above {self.threshold / MB:.0f} MB{Fore.RESET}')
+
+    def _open_window(self, stage: str) -> dict:
+        window = {'stage': stage, 'base': tracemalloc.get_traced_memory()[0], 'peak_alloc': 0, 'peak_rss': current_rss()}
+        with self._lock:
+            self._windows.append(window)
+        return window
+
+    def _close_window(self, window: dict):
+        rss = current_rss()
+        with self._lock:
+            self._windows = [w for w in self._windows if w is not window]
+            window['peak_rss'] = max(window['peak_rss'], rss)
+            self.peak_rss = max(self.peak_rss, window['peak_rss'])
+        self._update_peak(window)
+
+    @staticmethod
+    def _update_peak(window: dict):
+        window['peak_alloc'] = max(window['peak_alloc'], tracemalloc.get_traced_memory()[1] - window['base'])
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss()
+            with self._lock:
+                self.peak_rss = max(self.peak_rss, rss)
+                for window in self._windows:
+                    window['peak_rss'] = max(window['peak_rss'], rss)
@@ -0,0 +1,154 @@
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from colorama import Fore
+
+from helpers import RunLog
+from helpers.CancelToken import CancelToken, ConvertCancelled
+
+
+def dir_size(path: Path) -> int:
+    """
+        Total size in bytes of all files below path (0 if path does not exist)
+    """
+    if path is None or not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+# Bookkeeping for temp disk space used by unpacked paks
+class TempDiskBudget:
+    def __init__(self, limit_bytes: int = 0):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        """
+            Block until size bytes fit under the limit. A reservation is always granted when
+            nothing else is reserved, so a single pak larger than the limit can still be processed.
+
+        :param size: Number of bytes to reserve
+        :return: Number of bytes actually reserved
+        """
+        with self._cond:
+            if self.limit_bytes > 0:
+                while self.used_bytes > 0 and self.used_bytes + size > self.limit_bytes:
+                    self._cond.wait()
+            self.used_bytes += size
+            return size
+
+    def adjust(self, reserved: int, actual: int) -> int:
+        """
+            Replace a reservation estimate with the measured size
+        """
+        with self._cond:
+            self.used_bytes += actual - reserved
+            self._cond.notify_all()
+            return actual
+
+    def release(self, size: int):
+        with self._cond:
+            self.used_bytes = max(0, self.used_bytes - size)
+            self._cond.notify_all()
+
+
+# Pipelined queue for converting many paks (unpack -> convert -> build -> cleanup)
+class PakBatchQueue:
+    def __init__(self,
+                 unpack: Callable[[Path], Path],
+                 process: Callable[[Path, Path], None],
+                 concurrency: int = 1,
+                 temp_limit_bytes: int = 0,
+                 cancel: CancelToken = None):
+        """
+        :param unpack: Unpacks a pak and returns the temp dir holding its contents
+        :param process: Converts and builds the unpacked temp dir (called with pak file and temp dir)
+        :param concurrency: Number of paks unpacked in parallel while another pak is processed
+        :param temp_limit_bytes: Ceiling for temp disk usage of unpacked paks (0 for no limit)
+        :param cancel: Checked between paks, cancelling stops the queue and removes all temp dirs
+        """
+        self.unpack = unpack
+        self.process = process
+        self.concurrency = max(1, concurrency)
+        self.budget = TempDiskBudget(temp_limit_bytes)
+        self.cancel = cancel
+        # largest unpacked/packed size ratio seen so far, used to estimate reservations
+        self._unpack_ratio = 1.0
+
+    def run(self, pak_files: list[Path]) -> list[Path]:
+        """
+            Runs all paks through the pipeline. Unpacking happens on worker threads, while
+            conversion and project building stay on the calling thread, as converters keep
+            per-file state and project builds may prompt the user.
+
+        :param pak_files: Paks to convert
+        :return: Paks that failed
+        :raises ConvertCancelled: The cancel token was cancelled
+        """
+        # bounded so unpacked but unprocessed paks can't pile up on disk
+        unpacked = queue.Queue(maxsize=self.concurrency)
+        failed = []
+
+        def unpack_worker(pak_file: Path):
+            reserved = 0
+            tmp_dir = None
+            try:
+                self._check_cancel()
+                pak_size = max(1, pak_file.stat().st_size)
+                reserved = self.budget.acquire(int(pak_size * self._unpack_ratio))
+                self._check_cancel()
+                tmp_dir = self.unpack(pak_file)
+                unpacked_size = dir_size(tmp_dir)
+                self._unpack_ratio = max(self._unpack_ratio, unpacked_size / pak_size)
+                reserved = self.budget.adjust(reserved, unpacked_size)
+                unpacked.put((pak_file, tmp_dir, reserved, None))
+            except Exception as e:
+                self._cleanup(tmp_dir)
+                self.budget.release(reserved)
+                unpacked.put((pak_file, None, 0, e))
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='pak_unpack')
+        futures = [pool.submit(unpack_worker, pak_file) for pak_file in pak_files]
+        try:
+            for i in range(len(pak_files)):
+                self._check_cancel()
+                pak_file, tmp_dir, reserved, error = unpacked.get()
+                RunLog.info(f'[batch] Processing {pak_file.name} ({i + 1}/{len(pak_files)})', Fore.CYAN)
+                try:
+                    if error is not None:
+                        raise error
+                    self.process(pak_file, tmp_dir)
+                except ConvertCancelled:
+                    raise
+                except Exception as e:
+                    failed.append(pak_file)
+                    RunLog.error(f'[batch] Failed to convert {pak_file.name}:\n\tError: {e}')
+                finally:
+                    self._cleanup(tmp_dir)
+                    self.budget.release(reserved)
+        finally:
+            # paks not started are dropped, ones still unpacking finish into the queue and are removed here
+            pool.shutdown(wait=False, cancel_futures=True)
+            while not unpacked.empty() or not all(f.done() for f in futures):
+                try:
+                    _, tmp_dir, reserved, _ = unpacked.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                self._cleanup(tmp_dir)
+                self.budget.release(reserved)
+
+        return failed
+
+    def _check_cancel(self):
+        if self.cancel is not None:
+            self.cancel.check()
+
+    @staticmethod
+    def _cleanup(tmp_dir: Path):
+        if tmp_dir is not None and tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
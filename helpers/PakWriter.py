@@ -0,0 +1,159 @@
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from helpers import RunLog
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_LZ4 = 'lz4'
+COMPRESSION_METHODS = [COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_LZ4]
+
+# LSPK v18 (Baldur's Gate 3) layout, same as LSLib's PackageWriter
+PAK_SIGNATURE = b'LSPK'
+PAK_VERSION = 18
+HEADER_FORMAT = '<IQIBB16sH'    # version, file list offset, file list size, flags, priority, md5, parts
+ENTRY_FORMAT = '<256sIHBBII'    # name, offset (low 32 bits), offset (high 16 bits), part, flags, size on disk, uncompressed size
+NAME_SIZE = 256
+# entry flags: compression method in the low bits, level above
+FLAG_ZLIB = 0x01
+FLAG_LZ4 = 0x02
+FLAG_DEFAULT_LEVEL = 0x20
+
+
+def lz4_store_block(data: bytes) -> bytes:
+    """
+        Lz4 block holding data as a single literal run, valid input for any lz4 decoder.
+        Used for the file list when the lz4 package is not installed.
+    """
+    length = len(data)
+    if length < 15:
+        return bytes([length << 4]) + data
+    remaining = length - 15
+    return bytes([0xF0]) + b'\xff' * (remaining // 255) + bytes([remaining % 255]) + data
+
+
+# Streams files into a .pak while they are produced. Compression runs on a thread pool
+# (zlib and lz4 release the GIL), compressed data is written in the order files were added,
+# with a bounded number of files in flight so memory stays flat for large projects.
+class PakWriter:
+    def __init__(self, path: Path, compression: str = COMPRESSION_ZLIB, workers: int = 0, priority: int = 0):
+        """
+        :param path: Pak file to write, replaced if it exists
+        :param compression: none (fast, for local testing), zlib or lz4 (needs the lz4 package)
+        :param workers: Threads compressing files (0 for cpu count)
+        :param priority: Load priority stored in the pak header
+        """
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f'Unknown pak compression {compression}, expected one of {", ".join(COMPRESSION_METHODS)}')
+        if compression == COMPRESSION_LZ4 and lz4_block is None:
+            RunLog.warning(f'[pak] lz4 package not installed, compressing {path.name} with zlib', 'lz4 package not installed', file=path.name)
+            compression = COMPRESSION_ZLIB
+        self.path = path
+        self.compression = compression
+        self.priority = priority
+        self.workers = workers or os.cpu_count() or 1
+        # name -> entry fields, re-adding a name replaces the entry
+        self.entries: dict[str, tuple] = {}
+        # names added so far, including files still compressing
+        self.names: set[str] = set()
+        self.bytes_in = 0
+        self._pending: deque[tuple[str, int, Future]] = deque()
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='pak_compress') if compression != COMPRESSION_NONE else None
+        self._file = open(path, 'wb')
+        self._file.write(PAK_SIGNATURE + struct.pack(HEADER_FORMAT, 0, 0, 0, 0, 0, bytes(16), 0))
+
+    def add(self, name: str, data: bytes):
+        """
+            Queues data for the pak under name (posix path inside the pak)
+        """
+        name = name.replace('\\', '/')
+        if len(name.encode('utf-8')) >= NAME_SIZE:
+            raise ValueError(f'Path too long for a pak entry: {name}')
+        self.bytes_in += len(data)
+        self.names.add(name)
+        if self._pool is None:
+            self._write(name, len(data), data)
+            return
+        self._pending.append((name, len(data), self._pool.submit(self._compress, data)))
+        # keep a few files per worker in flight, write the oldest once the window is full
+        while len(self._pending) > self.workers * 4 or (self._pending and self._pending[0][2].done()):
+            pending_name, size, future = self._pending.popleft()
+            self._write(pending_name, size, future.result())
+
+    def __contains__(self, name: str) -> bool:
+        return name.replace('\\', '/') in self.names
+
+    def add_file(self, name: str, file: Path):
+        self.add(name, file.read_bytes())
+
+    def close(self) -> Path:
+        """
+            Writes the remaining files, the file list and the header
+
+        :return: Path of the written pak
+        """
+        try:
+            while self._pending:
+                name, size, future = self._pending.popleft()
+                self._write(name, size, future.result())
+
+            entries = b''.join(struct.pack(ENTRY_FORMAT, name.encode('utf-8'), *fields) for name, fields in self.entries.items())
+            packed = lz4_block.compress(entries, store_size=False) if lz4_block is not None else lz4_store_block(entries)
+            file_list_offset = self._file.tell()
+            self._file.write(struct.pack('<II', len(self.entries), len(packed)))
+            self._file.write(packed)
+            file_list_size = self._file.tell() - file_list_offset
+
+            self._file.seek(len(PAK_SIGNATURE))
+            self._file.write(struct.pack(HEADER_FORMAT, PAK_VERSION, file_list_offset, file_list_size, 0, self.priority, bytes(16), 1))
+        finally:
+            self._shutdown()
+        return self.path
+
+    def abort(self):
+        """
+            Stops writing and removes the unfinished pak
+        """
+        self._shutdown(cancel=True)
+        self.path.unlink(missing_ok=True)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == COMPRESSION_LZ4:
+            return lz4_block.compress(data, store_size=False)
+        return zlib.compress(data)
+
+    def _write(self, name: str, size: int, data: bytes):
+        offset = self._file.tell()
+        if self.compression == COMPRESSION_NONE:
+            flags, uncompressed_size = 0, 0
+        else:
+            flags = (FLAG_LZ4 if self.compression == COMPRESSION_LZ4 else FLAG_ZLIB) | FLAG_DEFAULT_LEVEL
+            uncompressed_size = size
+        self._file.write(data)
+        self.entries[name] = (offset & 0xFFFFFFFF, offset >> 32, 0, flags, len(data), uncompressed_size)
+
+    def _shutdown(self, cancel: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=cancel)
+            self._pool = None
+        self._pending.clear()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,190 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from colorama import Fore
+
+from helpers.PakBatchQueue import dir_size
+from helpers.ProgressEvents import ProgressEvent, ProgressKind
+
+
+@dataclass
+class FileProfile:
+    stage: str
+    file: str
+    seconds: float
+    size: int
+    entries: int
+
+
+def count_entries(path: Path) -> int:
+    """
+        Rough number of entries in a source file: stat entries in txt files, nodes in lsx,
+        content lines in locale xml, files in a project dir
+    """
+    try:
+        if path.is_dir():
+            return sum(1 for f in path.rglob('*') if f.is_file())
+        with open(path, encoding='utf-8-sig', errors='replace') as f:
+            if path.suffix == '.txt':
+                return sum(1 for line in f if line.startswith('new '))
+            data = f.read()
+        if path.suffix == '.xml':
+            return data.count('<content ')
+        return data.count('<node ')
+    except OSError:
+        return 0
+
+
+# Sampling profiler attributing time to conversion stages and single source files.
+# Subscribe it to ConvertAPI.progress to learn about stages, wrap per file work in file().
+# Stacks of threads currently inside a stage are sampled and collapsed into
+# "stage;file;frame;frame... count" lines, the input format of flamegraph.pl, speedscope etc.
+class ConvertProfiler:
+    def __init__(self, interval: float = 0.002):
+        """
+        :param interval: Seconds between stack samples
+        """
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.stages: dict[str, dict] = {}
+        self.files: list[FileProfile] = []
+        self.samples = 0
+        # thread id -> [stage, file] currently worked on by that thread
+        self._labels: dict[int, list] = {}
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread = None
+        self._start_time = time.perf_counter()
+
+    def __call__(self, event: ProgressEvent):
+        thread_id = threading.get_ident()
+        if event.kind == ProgressKind.STAGE_START:
+            self._ensure_sampler()
+            self._labels[thread_id] = [event.stage, None]
+        elif event.kind == ProgressKind.STAGE_END:
+            self._labels.pop(thread_id, None)
+            with self._lock:
+                stage = self.stages.setdefault(event.stage, {'seconds': 0.0, 'files': 0, 'bytes': 0, 'runs': 0})
+                stage['seconds'] += event.elapsed
+                stage['files'] += event.index
+                stage['bytes'] += event.stage_bytes
+                stage['runs'] += 1
+
+    @contextmanager
+    def file(self, path: Path):
+        """
+            Attributes samples and wall time of the block to path
+        """
+        thread_id = threading.get_ident()
+        created = thread_id not in self._labels
+        label = self._labels.setdefault(thread_id, ['other', None])
+        previous = label[1]
+        label[1] = path.name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            label[1] = previous
+            if created:
+                self._labels.pop(thread_id, None)
+            try:
+                size = dir_size(path) if path.is_dir() else path.stat().st_size
+            except OSError:
+                size = 0
+            with self._lock:
+                self.files.append(FileProfile(label[0], str(path), seconds, size, count_entries(path)))
+
+    def reset(self):
+        """
+            Drops collected data, so the next report only covers the next run
+        """
+        with self._lock:
+            self.stacks.clear()
+            self.stages.clear()
+            self.files.clear()
+            self.samples = 0
+            self._start_time = time.perf_counter()
+
+    def top(self, count: int = 20) -> list[FileProfile]:
+        with self._lock:
+            return sorted(self.files, key=lambda f: f.seconds, reverse=True)[:count]
+
+    def report(self, top: int = 20) -> dict:
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            files = len(self.files)
+        return {
+            'elapsed': time.perf_counter() - self._start_time,
+            'samples': self.samples,
+            'sample_interval': self.interval,
+            'stages': stages,
+            'files': files,
+            'slowest_files': [asdict(f) for f in self.top(top)]
+        }
+
+    def write(self, output_dir: Path, top: int = 20) -> Path:
+        """
+            Writes stacks.folded (collapsed stacks) and files.json (every profiled file)
+
+        :return: output_dir
+        """
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            stacks = list(self.stacks.items())
+            files = [asdict(f) for f in self.files]
+        with open(output_dir / 'stacks.folded', 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks):
+                f.write(f'{stack} {count}\n')
+        with open(output_dir / 'files.json', 'w', encoding='utf-8') as f:
+            json.dump(files, f, indent=4)
+        return output_dir
+
+    def print_summary(self, top: int = 20):
+        report = self.report(top)
+        print(f'{Fore.CYAN}[profile] {report["files"]} files, {report["samples"]} samples in {report["elapsed"]:.1f}s{Fore.RESET}')
+        for name, stage in report['stages'].items():
+            print(f'\t{name}: {stage["seconds"]:.2f}s, {stage["files"]} files, {stage["bytes"] / 1024 / 1024:.1f} MB')
+        if report['slowest_files']:
+            print(f'{Fore.CYAN}[profile] Slowest files:{Fore.RESET}')
+            for f in report['slowest_files']:
+                print(f'\t{f["seconds"]:8.3f}s {f["size"] / 1024:10.1f} KB {f["entries"]:7d} entries  [{f["stage"]}] {f["file"]}')
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler_sampler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            labels = dict(self._labels)
+            if not labels:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, (stage, file) in labels.items():
+                frame = frames.get(thread_id, None)
+                if frame is None or thread_id == own_id:
+                    continue
+                stacks.append(self._collapse(stage, file, frame))
+            with self._lock:
+                self.stacks.update(stacks)
+                self.samples += 1
+
+    @staticmethod
+    def _collapse(stage: str, file: str, frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{Path(code.co_filename).stem}.{code.co_name}')
+            frame = frame.f_back
+        names.reverse()
+        prefix = stage if file is None else f'{stage};{file}'
+        return ';'.join([prefix] + names).replace(' ', '_')
@@ -0,0 +1,173 @@
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class ProgressKind(Enum):
+    STAGE_START = 'stage_start'
+    STAGE_END = 'stage_end'
+    FILE_DONE = 'file_done'
+    FILE_SKIPPED = 'file_skipped'
+    FILE_FAILED = 'file_failed'
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    kind: ProgressKind
+    stage: str
+    file: Optional[Path] = None
+    index: int = 0          # files finished in stage (done, skipped or failed)
+    total: int = 0          # files expected in stage
+    bytes: int = 0          # size of the file this event is about
+    stage_bytes: int = 0    # bytes finished in stage so far
+    elapsed: float = 0.0    # seconds since stage start
+    message: str = ''
+
+    @property
+    def rate(self) -> float:
+        """
+            Files per second in current stage
+        """
+        return self.index / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+            Estimated seconds left in current stage (None until the first file finished)
+        """
+        if self.index == 0 or self.total < self.index:
+            return None
+        return (self.total - self.index) * self.elapsed / self.index
+
+
+# Tracks one running stage and publishes its file events
+class StageTracker:
+    def __init__(self, reporter: 'ProgressReporter', stage: str, total: int):
+        self.reporter = reporter
+        self.stage = stage
+        self.total = total
+        self.index = 0
+        self.stage_bytes = 0
+        self.start_time = time.perf_counter()
+
+    def file_done(self, file: Path, size: int = None):
+        self._file_event(ProgressKind.FILE_DONE, file, size)
+
+    def file_skipped(self, file: Path, reason: str = ''):
+        self._file_event(ProgressKind.FILE_SKIPPED, file, 0, reason)
+
+    def file_failed(self, file: Path, error: Exception = None):
+        self._file_event(ProgressKind.FILE_FAILED, file, 0, '' if error is None else str(error))
+
+    def emit(self, kind: ProgressKind, file: Path = None, size: int = 0, message: str = ''):
+        self.reporter.emit(ProgressEvent(
+            kind=kind,
+            stage=self.stage,
+            file=file,
+            index=self.index,
+            total=self.total,
+            bytes=size,
+            stage_bytes=self.stage_bytes,
+            elapsed=time.perf_counter() - self.start_time,
+            message=message
+        ))
+
+    def _file_event(self, kind: ProgressKind, file: Path, size: Optional[int], message: str = ''):
+        if size is None:
+            try:
+                size = file.stat().st_size
+            except OSError:
+                size = 0
+        self.index += 1
+        self.stage_bytes += size
+        self.emit(kind, file, size, message)
+
+    def __enter__(self):
+        self.emit(ProgressKind.STAGE_START)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.emit(ProgressKind.STAGE_END, message='' if exc_val is None else str(exc_val))
+        return False
+
+
+# Publishes progress events to subscribed callbacks
+class ProgressReporter:
+    def __init__(self):
+        self._subscribers: list[Callable[[ProgressEvent], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[ProgressEvent], None]):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[ProgressEvent], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def emit(self, event: ProgressEvent):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                pass  # a broken consumer must never stop a conversion
+
+    def stage(self, stage: str, total: int = 0) -> StageTracker:
+        """
+            Use as context manager, publishes stage start and end around the block
+        """
+        return StageTracker(self, stage, total)
+
+
+# Subscriber collecting events in a queue for consumers on another thread
+class ProgressQueue:
+    def __init__(self, maxsize: int = 0):
+        self.events: queue.Queue[ProgressEvent] = queue.Queue(maxsize)
+
+    def __call__(self, event: ProgressEvent):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            pass  # drop events rather than block the conversion
+
+
+# Subscriber rendering a rate limited single line progress bar to the console
+class ConsoleProgressBar:
+    def __init__(self, stream=None, interval: float = 0.1, width: int = 30):
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.width = width
+        self._last_draw = 0.0
+
+    def __call__(self, event: ProgressEvent):
+        if event.kind == ProgressKind.STAGE_START:
+            self._last_draw = 0.0
+            return
+        now = time.perf_counter()
+        if event.kind != ProgressKind.STAGE_END and now - self._last_draw < self.interval:
+            return
+        self._last_draw = now
+        self.stream.write('\r' + self.render(event))
+        if event.kind == ProgressKind.STAGE_END:
+            self.stream.write('\n')
+        self.stream.flush()
+
+    def render(self, event: ProgressEvent) -> str:
+        if event.total > 0:
+            filled = int(self.width * min(event.index, event.total) / event.total)
+        else:
+            filled = self.width if event.kind == ProgressKind.STAGE_END else 0
+        bar = '#' * filled + '-' * (self.width - filled)
+        eta = event.eta
+        eta_text = '--:--' if eta is None else f'{int(eta // 60):02d}:{int(eta % 60):02d}'
+        mb_rate = event.stage_bytes / 1024 / 1024 / event.elapsed if event.elapsed > 0 else 0.0
+        return (f'[{event.stage}] [{bar}] {event.index}/{event.total} '
+                f'{event.rate:.1f} files/s {mb_rate:.1f} MB/s ETA {eta_text}')
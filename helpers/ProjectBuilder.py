@@ -1,3 +1,4 @@
+import os
 import re
 import shutil
 import uuid
@@ -5,7 +6,18 @@ from pathlib import Path
 
 from colorama import Fore
 
+from helpers import RunLog
+from helpers.AssetPathRewriter import AssetPathRewriter
+from helpers.CancelToken import CancelToken, ConvertCancelled
+from helpers.ConvertPlan import ATLAS_TYPES, PEEK_BYTES, REGION_ID
+from helpers.LSLibUtil import CONVERT_BATCH_SIZE
 from helpers.LSXtoTBL import LSXconvert
+from helpers.PakWriter import COMPRESSION_ZLIB, PakWriter
+
+# Toolkit only parts of a project, left out of the pak
+PAK_EXCLUDED_DIRS = ['Editor/', 'Projects/']
+# Rewritten resource documents held for the next lsf conversion batch, in characters
+RESOURCE_PENDING_LIMIT = 64 * 1024 * 1024
 
 
 class ProjectBuilder:
@@ -13,9 +25,14 @@ class ProjectBuilder:
     path_to_templates = None
 
     # Init
-    def __init__(self, path_to_templates: Path, conv_lsx: LSXconvert = None):
+    def __init__(self, path_to_templates: Path, conv_lsx: LSXconvert = None,
+                 build_pak: bool = False, pak_compression: str = COMPRESSION_ZLIB, pak_workers: int = 0):
         self.conv_lsx = conv_lsx
         self.path_to_templates = path_to_templates
+        # also stream every project into <output_dir>/<project name>.pak while building it
+        self.build_pak = build_pak
+        self.pak_compression = pak_compression
+        self.pak_workers = pak_workers
 
     # Check if path is a workspace resembling a project
     def is_project(self, dirs):
@@ -29,15 +46,15 @@ class ProjectBuilder:
         return True
 
     # Build all saved projects
-    def build_all(self, projects: list[Path], output_dir: Path, prompt: bool = False):
+    def build_all(self, projects: list[Path], output_dir: Path, prompt: bool = False, cancel: CancelToken = None):
         for x in projects:
-            self.build(x, output_dir, prompt)
+            self.build(x, output_dir, prompt, cancel)
 
-    # Build a projects for use with Toolkit
-    def build(self, source_path: Path, output_dir: Path, prompt: bool = False):
+    # Build a projects for use with Toolkit, cancelling removes the unfinished project
+    def build(self, source_path: Path, output_dir: Path, prompt: bool = False, cancel: CancelToken = None):
         project_root_name = source_path.name
         if not self.is_project(source_path):
-            print(f'{Fore.YELLOW}[Project] {project_root_name} is not a valid project{Fore.RESET}')
+            RunLog.warning(f'[Project] {project_root_name} is not a valid project', 'Not a valid project', file=project_root_name)
             return False
 
         # Vars
@@ -46,6 +63,8 @@ class ProjectBuilder:
 
         # Prompt user for input
         if prompt:
+            # queued messages first, so the prompt is the last line
+            RunLog.flush()
             print(f'{Fore.CYAN}[Project] Attempting to create Project \'{project_root_name}\'\nEnter Project name (type X to skip or leave empty to use default): {Fore.RESET}')
             name = input()
             if name == 'X' or name == 'x': # Skip
@@ -56,6 +75,7 @@ class ProjectBuilder:
                 project_root_name = name
 
         project_output_path = output_dir.joinpath(project_name)
+        pak = None
 
         try:
             # Workspace structure and metadata
@@ -72,9 +92,16 @@ class ProjectBuilder:
             for sub_dir in structure:
                 project_output_path.joinpath(sub_dir).mkdir(parents=True, exist_ok=True)
             self.createMeta(project_output_path, project_name, project_root_name, project_uuid)
+            if self.build_pak:
+                pak = PakWriter(output_dir.joinpath(f'{project_name}.pak'), self.pak_compression, self.pak_workers)
+                self.add_to_pak(pak, project_output_path, project_output_path.joinpath(f'Mods/{project_name}/meta.lsx'))
 
-            # Copy all files to the correct location
+            # Copy all files to the correct location, resources are converted to lsf in batches from memory
+            lsf_files = []
+            lsf_texts = []
             for file in source_path.rglob('*'):
+                if not cancel is None:
+                    cancel.check()
                 if file.is_dir():
                     continue
 
@@ -104,51 +131,103 @@ class ProjectBuilder:
                 new_output_file = new_output_path.joinpath(file.name)
                 new_output_file_str = str(new_output_file.as_posix())
 
-                if not new_output_file.exists() and file.exists():
-                    shutil.copy(str(file.as_posix()), new_output_file_str)
+                if new_output_file.exists() or not file.exists():
+                    continue
 
-                # Edit paths if lsf file and re-convert
-                try:
-                    file_type = self.conv_lsx.getDataType(new_output_file_str)
-                    if not file_type in self.conv_lsx.lsf_types and not file_type in ['IconUVList', 'TextureAtlasInfo']:
-                        continue # Ignore all non lsf files
-
-                    with open(new_output_file_str, 'r', encoding="utf-8") as f:
-                        data = f.read()
-
-                    # Visual Resource Generated Path
-                    if file_type in self.conv_lsx.lsf_types:
-                        try:
-                            loc = re.search(r'Generated/.*?/', data).group().split('/')
-                            if not loc[1] == 'Public':
-                                data = data.replace('Generated/', f'Generated/Public/{project_name}/')
-                            else:
-                                data = data.replace('Generated/Public/', f'Generated/Public/{project_name}/')
-                        except Exception as e:
-                            pass # Ignore outlier files
-                    # UI Resource Public Path
-                    data = re.sub(r'(?!.*Public/Shared/Assets/)Public/.*?/Assets/', f'Public/{project_name}/Assets/', data)
-
-                    with open(new_output_file_str, 'w', encoding="utf-8") as f:
-                        f.write(data)
-
-                    self.conv_lsx.lsx2lsf(new_output_file_str, False)
-                except Exception as e:
-                    continue # Failsafe
+                # Edit paths if lsf file and re-convert, other files are final
+                resource = self.rewrite_resource(file, project_name)
+                if resource is not None:
+                    # written once, LSLib converts the document in memory instead of reading the file back
+                    copied = resource.replace('\n', os.linesep).encode('utf-8')
+                    new_output_file.write_bytes(copied)
+                    lsf_files.append(new_output_file_str)
+                    lsf_texts.append(resource)
+                    if len(lsf_files) >= CONVERT_BATCH_SIZE or sum(len(t) for t in lsf_texts) >= RESOURCE_PENDING_LIMIT:
+                        self.convert_resources(lsf_files, lsf_texts, pak, project_output_path)
+                elif pak is None:
+                    shutil.copy(str(file.as_posix()), new_output_file_str)
+                    continue
+                else:
+                    # read once, the same bytes go into the project and the pak
+                    copied = file.read_bytes()
+                    new_output_file.write_bytes(copied)
+                if pak is not None:
+                    self.add_to_pak(pak, project_output_path, new_output_file, copied)
+
+            # Convert the remaining edited files to lsf
+            if not cancel is None:
+                cancel.check()
+            self.convert_resources(lsf_files, lsf_texts, pak, project_output_path)
+
+            if pak is not None:
+                pak_path = pak.close()
+                RunLog.info(f'[Project] Packed {pak_path.name} ({len(pak.entries)} files, '
+                            f'{pak_path.stat().st_size / 1024 / 1024:.1f} MB, {pak.compression})')
 
             # File Cleanup
             #TODO remove duplicate files, conversion leftovers or localization files
 
-            print(f'{Fore.GREEN}[Project] Project {project_name} successfully created{Fore.RESET}')
+            RunLog.info(f'[Project] Project {project_name} successfully created')
             #raise Exception('Cleanup')
             return True
+        except ConvertCancelled:
+            RunLog.warning(f'[Project] Cancelled creating project {project_root_name}')
+            if pak is not None:
+                pak.abort()
+            shutil.rmtree(project_output_path, ignore_errors=True)
+            raise
         except Exception as e:
             # Failed (failsafe catch)
-            print(f'{Fore.RED}[Project] Failed to create project {project_root_name}\n\tReason: {e}{Fore.RESET}')
+            RunLog.error(f'[Project] Failed to create project {project_root_name}\n\tReason: {e}')
+            if pak is not None:
+                pak.abort()
             if Path(project_output_path).exists():
                 shutil.rmtree(project_output_path)
             return False
 
+    # Document of an lsf resource or UI file with Generated/ and Public/ paths pointing to the project, None if not one
+    def rewrite_resource(self, file: Path, project_name: str) -> str:
+        if file.suffix != '.lsx':
+            return None
+        try:
+            raw = file.read_bytes()
+            match = REGION_ID.search(raw[:PEEK_BYTES])
+            file_type = self.conv_lsx.getDataType(str(file)) if match is None else match.group(1).decode('utf-8')
+            if not file_type in self.conv_lsx.lsf_types and not file_type in ATLAS_TYPES:
+                return None # Ignore all non lsf files
+
+            # same newline handling as reading in text mode
+            data = raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+            # Visual resources also get their Generated path, UI files only Public asset paths
+            return AssetPathRewriter(project_name, file_type in self.conv_lsx.lsf_types).rewrite(data)
+        except Exception as e:
+            return None # Failsafe
+
+    # Convert edited resources to lsf with one LSLib call, outputs go into the pak replacing copied lsf files
+    def convert_resources(self, lsf_files: list[str], lsf_texts: list[str], pak: PakWriter, project_path: Path):
+        failed_files = set()
+        for failed_file in self.conv_lsx.lsx2lsf_batch(lsf_files, texts=lsf_texts):
+            RunLog.warning(f'[Project] Could not convert {Path(failed_file).name} to LSF', 'Could not convert to LSF', file=Path(failed_file).name)
+            failed_files.add(Path(failed_file))
+
+        if pak is not None:
+            for lsf_file in lsf_files:
+                if not Path(lsf_file) in failed_files:
+                    self.add_to_pak(pak, project_path, self.conv_lsx.lsf_output_path(Path(lsf_file)), replace=True)
+        lsf_files.clear()
+        lsf_texts.clear()
+
+    # Add a project file to the pak under its path in the project, toolkit only files are left out
+    def add_to_pak(self, pak: PakWriter, project_path: Path, file: Path, data: bytes = None, replace: bool = False):
+        name = file.relative_to(project_path).as_posix()
+        if (name in pak and not replace) or any(name.startswith(d) for d in PAK_EXCLUDED_DIRS):
+            return
+        if data is None:
+            if not file.is_file():
+                return
+            data = file.read_bytes()
+        pak.add(name, data)
+
     # Create metadata
     def createMeta(self, pdir, pname, pname_raw, pguid):
 
@@ -0,0 +1,207 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+from colorama import Fore
+
+QUIET = 0    # errors and the summary
+NORMAL = 1   # + progress messages and the first occurrence of every warning
+VERBOSE = 2  # + every repeated warning
+LOG_LEVELS = {'quiet': QUIET, 'normal': NORMAL, 'verbose': VERBOSE}
+
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+COLORS = {ERROR: Fore.RED, WARNING: Fore.YELLOW, INFO: Fore.GREEN}
+SUMMARY_TOP = 10
+
+# a record is (time, severity, message, color, (warning, field, file) or None)
+
+
+# Console output and JSONL run log written by a background thread, so converters only queue messages.
+# Warnings with a key are counted per (warning, field, file), only the first one of each key is
+# printed and logged unless verbose, the counts are logged and summarized when the run log is closed.
+class RunLogger:
+    def __init__(self, log_dir: Path = None, level: int = NORMAL):
+        """
+        :param log_dir: Dir run_<time>.jsonl files are written to, None for console output only
+        :param level: QUIET, NORMAL or VERBOSE console output, the run log gets every queued record
+        """
+        self.log_dir = log_dir
+        self.level = level
+        self.path = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counts: dict[tuple, int] = {}
+        self.errors = 0
+        self.warnings = 0
+
+    def emit(self, severity: str, message: str, color: str = None, key: tuple = None):
+        with self._lock:
+            if severity == ERROR:
+                self.errors += 1
+            elif severity == WARNING:
+                self.warnings += 1
+            if key is not None:
+                count = self.counts.get(key, 0) + 1
+                self.counts[key] = count
+                if count > 1 and self.level < VERBOSE:
+                    return
+            if self._thread is None:
+                self._start()
+        self._queue.put((time.time(), severity, message, color or COLORS[severity], key))
+
+    def replay(self, records: list[tuple]):
+        """
+            Queues records collected by a BufferedLog in a worker process
+        """
+        for _, severity, message, color, key in records:
+            self.emit(severity, message, color, key)
+
+    def flush(self):
+        """
+            Waits until every queued record is printed, e.g. before asking for input
+        """
+        if self._thread is not None:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+
+    def close(self):
+        """
+            Writes the warning counts, prints the summary and starts a new run log with the next record
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            counts, self.counts = self.counts, {}
+            errors, warnings = self.errors, self.warnings
+            self.errors = self.warnings = 0
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+        if self.path is not None:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for (warning, field, file), count in counts.items():
+                    f.write(json.dumps({'type': 'count', 'warning': warning, 'field': field, 'file': file, 'count': count}) + '\n')
+        self.print_summary(counts, errors, warnings)
+
+    def print_summary(self, counts: dict[tuple, int], errors: int, warnings: int):
+        color = Fore.RED if errors else Fore.YELLOW if warnings else Fore.GREEN
+        log_file = '' if self.path is None else f', run log: {self.path}'
+        print(f'{color}[log] {errors} errors, {warnings} warnings ({len(counts)} distinct){log_file}{Fore.RESET}')
+        repeated = sorted(((count, key) for key, count in counts.items() if count > 1), reverse=True)
+        for count, (warning, field, file) in repeated[:SUMMARY_TOP]:
+            print(f'\t{warning}: {field} x{count}' + ('' if file is None else f' ({file})'))
+        if len(repeated) > SUMMARY_TOP:
+            print(f'\t... {len(repeated) - SUMMARY_TOP} more repeated warnings in the run log')
+
+    def _start(self):
+        if self.log_dir is not None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            self.path = self.log_dir / f'run_{time.strftime("%Y%m%d_%H%M%S")}.jsonl'
+        self._thread = threading.Thread(target=self._run, args=(self.path,), name='run-log', daemon=True)
+        self._thread.start()
+
+    def _run(self, path: Path):
+        f = None if path is None else open(path, 'a', encoding='utf-8')
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                if isinstance(record, threading.Event):
+                    if f is not None:
+                        f.flush()
+                    record.set()
+                    continue
+                timestamp, severity, message, color, key = record
+                if severity == ERROR or self.level >= NORMAL:
+                    print(f'{color}{message}{Fore.RESET}')
+                if f is not None:
+                    entry = {'time': round(timestamp, 3), 'severity': severity, 'message': message}
+                    if key is not None:
+                        entry.update(warning=key[0], field=key[1], file=key[2])
+                    f.write(json.dumps(entry) + '\n')
+        finally:
+            if f is not None:
+                f.close()
+
+
+# Collects records in pipeline and chunk worker processes, they are handed back with the results
+class BufferedLog:
+    def __init__(self):
+        self.records: list[tuple] = []
+
+    def emit(self, severity: str, message: str, color: str = None, key: tuple = None):
+        self.records.append((time.time(), severity, message, color or COLORS[severity], key))
+
+    def drain(self) -> list[tuple]:
+        records, self.records = self.records, []
+        return records
+
+
+_logger = None
+
+
+def install(logger):
+    """
+        Sends messages of every converter to logger, without one they are printed right away
+    """
+    global _logger
+    _logger = logger
+    if isinstance(logger, RunLogger):
+        atexit.register(logger.close)
+
+
+def installed():
+    return _logger
+
+
+def emit(severity: str, message: str, color: str = None, key: tuple = None):
+    if _logger is None:
+        print(f'{color or COLORS[severity]}{message}{Fore.RESET}')
+    else:
+        _logger.emit(severity, message, color, key)
+
+
+def error(message: str):
+    emit(ERROR, message)
+
+
+def warning(message: str, warning: str = None, field: str = None, file: str = None):
+    """
+        :param warning: Kind of warning, repeated warnings of the same kind, field and file are only counted
+    """
+    emit(WARNING, message, key=None if warning is None else (warning, field, file))
+
+
+def info(message: str, color: str = Fore.GREEN):
+    emit(INFO, message, color)
+
+
+def flush():
+    if isinstance(_logger, RunLogger):
+        _logger.flush()
+
+
+def drain() -> list[tuple]:
+    """
+        Records collected in a worker process since the last call
+    """
+    return _logger.drain() if isinstance(_logger, BufferedLog) else []
+
+
+def replay(records: list[tuple]):
+    if not records:
+        return
+    if isinstance(_logger, RunLogger):
+        _logger.replay(records)
+    else:
+        for _, severity, message, color, key in records:
+            emit(severity, message, color, key)
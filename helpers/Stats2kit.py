@@ -1,10 +1,21 @@
 import json
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
 from pathlib import Path
 
 import xmltodict
-from colorama import Fore
+
+from helpers import RunLog
+from helpers.ConvertContext import ConvertContext
+from helpers.MemoryTracker import memory_phase
+from helpers.StatsModel import Field, StatObject, StatsDocument, StatsWriter
+from helpers.TreasureTable import TreasureTableConvert
+
+# chunks per chunk worker, a few more chunks than workers evens out entries of different size
+CHUNKS_PER_WORKER = 2
 
 
 class StatsConvert():
@@ -14,9 +25,18 @@ class StatsConvert():
     db = None
     auxdb = None
     root_path = None
+    auxIDfix = None
+    # use the old in-memory treasure table parser instead of the streaming one
+    legacy_treasure_table = False
+    # files of at least this size are split into chunks converted in parallel (0 to never split)
+    chunk_threshold_kb = 0
+    # processes converting chunks (0 for cpu count)
+    chunk_workers = 0
 
     # Init
     def __init__(self, db=None, auxdb=None, root_path: Path = None):
+        self._treasure_table = None
+        self._chunk_pool = None
         self.db = db
         self.auxdb = auxdb
         self.root_path = root_path
@@ -24,26 +44,80 @@ class StatsConvert():
     def setUUID(self, uuid=None):
         self.uuid = uuid
 
-    # Main call convert function
+    # Main call convert function, writes the .stats file next to the source and saves the recovered IDs
     def convert(self, file):
-        self.file = file
-        with open(file, encoding="utf-8-sig") as f:
-            self.data = f.read()
-        return self.writexml(self.convert_all())
-
-    # Write data to xml file
-    def writexml(self, data, file = None):
-        if file is None:
-            file = self.file
+        with memory_phase('read'), open(file, encoding="utf-8-sig") as f:
+            text = f.read()
+        out = self.output_path(file)
+        converted = False
+        try:
+            with open(out + '.tmp', 'wb') as f:
+                converted = self.convert_text(text, file, f)
+        finally:
+            if not converted:
+                os.remove(out + '.tmp')
+        if not converted:
+            return False
+        os.replace(out + '.tmp', out)
+        self.save_recovered(self.auxIDfix)
+        return True
+
+    # Convert stats text to xml written to output (a binary stream) without touching the disk.
+    # name is the file name of the source, IDs of the entries it defines are left in auxIDfix.
+    def convert_text(self, text, name, output):
+        self.file = name
+        self.data = text
+        # treasure tables and chunks are written while converting, measured as one phase
+        if not self.legacy_treasure_table and self.is_treasure_table(text[:32]):
+            with memory_phase('convert'):
+                return self.write_treasure_table(text.split("\n"), output)
+        # characters instead of bytes, close enough for the threshold
+        if self.use_chunks(len(text)):
+            with memory_phase('convert'):
+                return self.write_chunked(output)
+        with memory_phase('convert'):
+            data = self.convert_all(save_recovered=False)
+        with memory_phase('write'):
+            return self.writexml(data, output)
+
+    @staticmethod
+    def is_treasure_table(data):
+        return data.startswith(("treasure", "new treasuretable"))
+
+    # Stream treasure tables to output while converting, without building the whole document
+    def write_treasure_table(self, lines, output):
+        self.treasure_table_converter().write(lines, output, '' if self.uuid is None else self.uuid)
+        self.auxIDfix = {}
+        return True
+
+    def treasure_table_converter(self):
+        if self._treasure_table is None or self._treasure_table.db is not self.db:
+            self._treasure_table = TreasureTableConvert(self.db)
+        return self._treasure_table
+
+    # Write data as xml to output (a binary stream)
+    def writexml(self, data, output):
         if data is None:
             return False
-        out = file.replace('.txt', '.stats').replace('Spell_', '')
-        with open(out, 'w') as f:
-            f.write(xmltodict.unparse(data, pretty=True, indent='  '))
+        if isinstance(data, StatsDocument):
+            data.write(output)
+        else:
+            output.write(self.unparse(data).encode('utf-8'))
         return True
 
+    # Output file for a stats txt file
+    @staticmethod
+    def output_path(file):
+        return file.replace('.txt', '.stats').replace('Spell_', '')
+
+    @staticmethod
+    def unparse(data):
+        if isinstance(data, StatsDocument):
+            return data.to_xml()
+        return xmltodict.unparse(data, pretty=True, indent='  ')
+
     # Convert function logic
-    def convert_all(self):
+    def convert_all(self, save_recovered = True):
         if self.uuid is None:
             nodeUUID = ''
         else:
@@ -51,130 +125,265 @@ class StatsConvert():
         if self.auxdb is None:
             self.auxdb = {}
 
-        construct = {'stats': {'@stat_object_definition_id': nodeUUID, 'stat_objects': {'stat_object': []}}}
+        construct = StatsDocument(nodeUUID)
         auxIDfix = {}
 
         # Special handling for awesome treasure tables
-        if self.data.startswith(("treasure", "new treasuretable")):
-            self.process_treasure_table(construct)
+        if self.is_treasure_table(self.data):
+            if self.legacy_treasure_table:
+                self.process_treasure_table(construct)
+            else:
+                construct = self.treasure_table_converter().build(self.data.split("\n"), nodeUUID)
         else: # All other files
-            # Read line by line
-            t = []
-            i = 0
-            dupes = []
+            for t in self.convert_entries(self.data.split("\n"), auxIDfix):
+                construct.append(t)
 
-            for line in self.data.split("\n"):
-                i += 1
-                raw = line.split('"')[1::2]
+        # Try fixing parent IDs
+        if not self.fix_parents(construct.objects, auxIDfix):
+            RunLog.warning(f'[stats] Missing parent entries in: {os.path.basename(self.file)}', 'Missing parent entries', file=os.path.basename(self.file))
+        self.auxIDfix = auxIDfix
+        if save_recovered:
+            self.save_recovered(auxIDfix)
+        return construct
 
-                if len(raw) > 0: # Ignore duplicate entries
-                    if raw[0] in dupes:
-                        continue
-                    dupes.append(raw[0])
-                if line[:3:] == "new": # Data definition entries
-                    if len(t) > 0: # Data seperation
-                        if not (not t):
-                            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
-                        t = []
-                        i = 0
-                    dupes = []
-                    newUID = self.gen_uuid()
-                    stat_name = raw[0]
-                    if os.path.basename(self.file).startswith("Spell_"):
-                        stat_name = raw[0].removeprefix(f'{os.path.basename(self.file).split(".")[0].replace("Spell_","")}_')
-
-                    fname, fext = os.path.splitext(os.path.basename(self.file).replace("Spell_",""))
-                    if fname == "Projectile" or fname == "Target" or fname == "Zone" or fname == "Shout" or fname == "ProjectileStrike" or fname == "Rush" or fname == "Teleportation" or fname == "Throw":
-                        auxIDfix[f'{fname}_{stat_name}'] = newUID
-                    else:
-                        auxIDfix[stat_name] = newUID
+    # Read entries line by line. uuids gives the IDs of new entries in order (generated when None),
+    # final=False for chunks that continue with another chunk, their last entry is always kept.
+    def convert_entries(self, lines, auxIDfix, uuids = None, final = True) -> list[StatObject]:
+        auxdb = self.parent_ids(lines)
+        objects = []
+        t = StatObject()
+        i = 0
+        dupes = []
 
-                    t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': newUID})
-                    t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': stat_name})
-                    continue
-                if line[:5:] == "using": # Skip parent if IDs not in aux db
-                    t.append({'@name': 'Using', '@type': 'BaseClassTableFieldDefinition', '@value': self.auxdb.get(raw[0],raw[0])})
-                    continue
-                if line[:4:] == "data": # Data entries
-                    builder = self.gen_dict(raw)
-                    if not builder is None:
-                        t.append(builder)
+        for line in lines:
+            i += 1
+            raw = line.split('"')[1::2]
+
+            if len(raw) > 0: # Ignore duplicate entries
+                if raw[0] in dupes:
                     continue
-                # if line == '': # Data seperator
-                #     if not (not t):
-                #         construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
-                #     t = []
-                #     i = 0
-                #     dupes = []
-            # Append current construct if file did not end on an empty line
-            if i != 0:
-                if not (not t):
-                    construct['stats']['stat_objects']['stat_object'].append({'@is_substat': 'false', 'fields': {'field': t}})
-                t = []
-                i = 0
+                dupes.append(raw[0])
+            if line[:3:] == "new": # Data definition entries
+                if len(t) > 0: # Data seperation
+                    if not (not t):
+                        objects.append(t)
+                    t = StatObject()
+                    i = 0
                 dupes = []
+                newUID = self.gen_uuid() if uuids is None else next(uuids)
+                stat_name, aux_key = self.entry_names(raw[0])
+                auxIDfix[aux_key] = newUID
 
-        # Try fixing parent IDs
+                t.append(Field('UUID', 'IdTableFieldDefinition', newUID))
+                t.append(Field('Name', 'NameTableFieldDefinition', stat_name))
+                continue
+            if line[:5:] == "using": # Skip parent if IDs not in aux db
+                t.append(Field('Using', 'BaseClassTableFieldDefinition', auxdb.get(raw[0],raw[0])))
+                continue
+            if line[:4:] == "data": # Data entries
+                builder = self.gen_dict(raw)
+                if not builder is None:
+                    t.append(builder)
+                continue
+            # if line == '': # Data seperator
+            #     if not (not t):
+            #         objects.append(t)
+            #     t = StatObject()
+            #     i = 0
+            #     dupes = []
+        # Append current construct if file did not end on an empty line
+        if i != 0 or not final:
+            if not (not t):
+                objects.append(t)
+        return objects
+
+    # Aux db IDs of the parents used in lines. An aux db kept in SQLite (AuxDB) is queried once
+    # for all of them, an auxdb.json table is already in memory and returned as is.
+    def parent_ids(self, lines) -> dict:
+        if isinstance(self.auxdb, dict):
+            return self.auxdb
+        names = []
+        for line in lines:
+            if line[:5:] == "using":
+                raw = line.split('"')[1::2]
+                if len(raw) > 0:
+                    names.append(raw[0])
+        return self.auxdb.lookup(names)
+
+    # Entry name written to the output and its key in auxIDfix
+    def entry_names(self, name):
+        base = os.path.basename(self.file)
+        stat_name = name
+        if base.startswith("Spell_"):
+            stat_name = name.removeprefix(f'{base.split(".")[0].replace("Spell_","")}_')
+
+        fname, fext = os.path.splitext(base.replace("Spell_",""))
+        if fname == "Projectile" or fname == "Target" or fname == "Zone" or fname == "Shout" or fname == "ProjectileStrike" or fname == "Rush" or fname == "Teleportation" or fname == "Throw":
+            return stat_name, f'{fname}_{stat_name}'
+        return stat_name, stat_name
+
+    # Replace parents that are not IDs yet with IDs of entries in the same file, False if any is missing
+    def fix_parents(self, objects, auxIDfix) -> bool:
         isRecovered = True
-        for i, x in enumerate(construct['stats']['stat_objects']['stat_object']):
-            for y, val in enumerate(x['fields']['field']):
-                if val['@name'] == 'Using' and not self.is_guid(val['@value']):
-                    construct['stats']['stat_objects']['stat_object'][i]['fields']['field'][y]['@value'] = auxIDfix.get(val['@value'],'')
-                    if construct['stats']['stat_objects']['stat_object'][i]['fields']['field'][y]['@value'] == '':
+        for x in objects:
+            for val in x.fields:
+                if val.name == 'Using' and not self.is_guid(val.value):
+                    val.value = auxIDfix.get(val.value,'')
+                    if val.value == '':
                         isRecovered = False
+        return isRecovered
+
+    # Whether a file of size bytes is converted in chunks
+    def use_chunks(self, size):
+        return self.chunk_threshold_kb > 0 and size >= self.chunk_threshold_kb * 1024 and self.chunk_worker_count() > 1
+
+    def chunk_worker_count(self):
+        return self.chunk_workers or os.cpu_count() or 1
+
+    # Split a large file at entry boundaries, convert the chunks on a process pool and write them to output in order.
+    # Entry IDs are assigned here first, so each chunk resolves parents defined in other chunks on its own.
+    def write_chunked(self, output):
+        file = self.file
+        if self.auxdb is None:
+            self.auxdb = {}
+        lines = self.data.split("\n")
+        auxIDfix, chunks = self.plan_chunks(lines, self.chunk_worker_count() * CHUNKS_PER_WORKER)
+        if len(chunks) < 2:
+            return self.writexml(self.convert_all(save_recovered=False), output)
+
+        pool = self.chunk_pool()
+        futures = []
+        try:
+            futures = [pool.submit(convert_chunk_worker, file, "\n".join(lines[start:end]), uuids, parents, end == len(lines))
+                       for start, end, uuids, parents in chunks]
+            isRecovered = True
+            writer = StatsWriter(output)
+            writer.begin('' if self.uuid is None else self.uuid)
+            for future in futures:
+                xml, recovered, records = future.result()
+                RunLog.replay(records)
+                output.write(xml.encode('utf-8'))
+                isRecovered = isRecovered and recovered
+            writer.end()
+        except BrokenProcessPool:
+            self.close_chunk_pool()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
         if not isRecovered:
-            print(f'{Fore.YELLOW}[stats] Missing parent entries in: {os.path.basename(self.file)}{Fore.WHITE}')
+            RunLog.warning(f'[stats] Missing parent entries in: {os.path.basename(file)}', 'Missing parent entries', file=os.path.basename(file))
+        self.auxIDfix = auxIDfix
+        return True
+
+    # Walk the lines the way convert_entries does, without converting, to assign entry IDs and pick chunk boundaries
+    # :return: (auxIDfix of the whole file, [(first line, end line, IDs of the chunk entries, parent IDs the chunk needs)])
+    def plan_chunks(self, lines, count):
+        auxdb = self.parent_ids(lines)
+        auxIDfix = {}
+        entries = [] # (line, ID) of every new entry
+        parents = [] # (line, parent as written after aux db lookup)
+        dupes = []
+        for index, line in enumerate(lines):
+            raw = line.split('"')[1::2]
+            if len(raw) > 0:
+                if raw[0] in dupes:
+                    continue
+                dupes.append(raw[0])
+            if line[:3:] == "new":
+                dupes = []
+                newUID = self.gen_uuid()
+                auxIDfix[self.entry_names(raw[0])[1]] = newUID
+                entries.append((index, newUID))
+            elif line[:5:] == "using":
+                parents.append((index, auxdb.get(raw[0],raw[0])))
+            elif line[:4:] == "data" and len(raw) > 1 and raw[0] == 'Using':
+                parents.append((index, raw[1]))
+
+        # chunks start on an entry, the first one also takes lines before the first entry
+        # an entry on the very last line is dropped like in convert_all only when it follows another entry in its chunk
+        starts = sorted({entries[len(entries) * k // count][0] for k in range(1, count) if entries} - {0, len(lines) - 1})
+        bounds = list(zip([0] + starts, starts + [len(lines)]))
+        chunks = []
+        e = p = 0
+        for start, end in bounds:
+            uuids = []
+            while e < len(entries) and entries[e][0] < end:
+                uuids.append(entries[e][1])
+                e += 1
+            needed = {}
+            while p < len(parents) and parents[p][0] < end:
+                if parents[p][1] in auxIDfix:
+                    needed[parents[p][1]] = auxIDfix[parents[p][1]]
+                p += 1
+            chunks.append((start, end, uuids, needed))
+        return auxIDfix, chunks
+
+    def chunk_pool(self):
+        if self._chunk_pool is None:
+            self._chunk_pool = ProcessPoolExecutor(self.chunk_worker_count(), initializer=init_worker, initargs=(self.db, self.auxdb))
+        return self._chunk_pool
+
+    # Stop the chunk workers, a new pool is started with the current databases when needed again
+    def close_chunk_pool(self):
+        if self._chunk_pool is not None:
+            self._chunk_pool.shutdown(cancel_futures=True)
+            self._chunk_pool = None
+
+    # Save IDs recovered from the current file for the lsx converter
+    def save_recovered(self, auxIDfix):
         with open(self.root_path / 'auxdb_self_recovered.temp', 'w') as f:
             f.write(json.dumps(auxIDfix, indent=4))
-        return construct
 
-    # Generate xml object to construct entry data
+    # Generate field to construct entry data
     def gen_dict(self, data, legacy = False):
         fname, fext = os.path.splitext(os.path.basename(self.file).replace("Spell_",""))
         try:
-            builder = {'@name': data[0], '@type': self.db['DataTypes'].get(data[0], ''), '@value':''}
+            data_type = self.db['DataTypes'].get(data[0], '')
+            builder = Field(data[0], data_type, '')
             if fname == 'Interrupt': # Hardcoded Properties checks
                 if data[0] == 'Properties':
-                    builder['@type'] = 'StringTableFieldDefinition'
+                    builder.type = 'StringTableFieldDefinition'
                 if data[0] == 'EnableContext':
                     data[0] = 'EnabledContext'
-                    builder['@name'] = data[0]
+                    builder.name = data[0]
                 if data[0] == 'EnableCondition':
                     data[0] = 'EnabledConditions'
-                    builder['@name'] = data[0]
-            if self.db['DataTypes'].get(data[0], '') == "TranslatedStringTableFieldDefinition": # Translated entries
-                builder['@handle'] = data[1].split(";")[0]
-                builder['@version'] = "1"
+                    builder.name = data[0]
+                data_type = self.db['DataTypes'].get(data[0], '')
+            if data_type == "TranslatedStringTableFieldDefinition": # Translated entries
+                builder.set('handle', data[1].split(";")[0])
+                builder.set('version', "1")
             else: # All normal entries
                 if data[1] == "":
-                    builder['@value'] = ""
-                    builder['@clear_inherited_value'] = "true"
-                if builder['@value'] == '':
-                    builder['@value'] = data[1]
-            if self.db['DataTypes'].get(data[0], '') == '':
+                    builder.set('clear_inherited_value', "true")
+                builder.value = data[1]
+            if data_type == '':
                 if not data[0] in ['SpellType', 'StatusType']:
-                    print(f'{Fore.YELLOW}[stats] Missing Pre-Configured Data Type: {data[0]}{Fore.WHITE}')
-            if self.db['DataTypes'].get(data[0], '') == "EnumerationListTableFieldDefinition" or self.db['DataTypes'].get(data[0], '') == "EnumerationTableFieldDefinition": # Enum types
+                    RunLog.warning(f'[stats] Missing Pre-Configured Data Type: {data[0]}', 'Missing Pre-Configured Data Type', data[0], os.path.basename(self.file))
+            if data_type == "EnumerationListTableFieldDefinition" or data_type == "EnumerationTableFieldDefinition": # Enum types
                 # Special handling for status/spell sheathing fields named the same but different enums
                 if fname.startswith('Status_') and data[0] == 'Sheathing':
                     enum_type_lookup = f'{data[0]}_Status'
                 else:
                     enum_type_lookup = data[0]
-                builder['@enumeration_type_name'] = self.db['DataTypes']['EnumTypes'].get(enum_type_lookup, enum_type_lookup)
+                enum_type_name = self.db['DataTypes']['EnumTypes'].get(enum_type_lookup, enum_type_lookup)
+                builder.set('enumeration_type_name', enum_type_name)
 
-                builder['@version'] = "1"
-                if not builder['@value'] == '':
-                    val = self.db['DataTypes']['EnumSubTypes'].get(builder['@enumeration_type_name'], builder['@value'])
+                builder.set('version', "1")
+                if not builder.value == '':
+                    val = self.db['DataTypes']['EnumSubTypes'].get(enum_type_name, builder.value)
                     if isinstance(val, dict):
-                        builder['@value'] = val.get(builder['@value'], builder['@value'])
-            if self.db['DataTypes'].get(data[0], '') == "BoolTableFieldDefinition":
-                if not builder['@value'] == '':
-                    val = self.db['DataTypes']['EnumSubTypes'].get('BoolTableFieldDefinition', builder['@value'])
+                        builder.value = val.get(builder.value, builder.value)
+            if data_type == "BoolTableFieldDefinition":
+                if not builder.value == '':
+                    val = self.db['DataTypes']['EnumSubTypes'].get('BoolTableFieldDefinition', builder.value)
                     if isinstance(val, dict):
-                        builder['@value'] = val.get(builder['@value'], builder['@value'])
+                        builder.value = val.get(builder.value, builder.value)
             return builder
         except Exception as e:
-            print(f'[stats] Exception: {e}; Ignored')
+            RunLog.warning(f'[stats] Exception: {e}; Ignored', 'Exception ignored', str(e), os.path.basename(self.file))
             return None
 
     # Generate a new UUID
@@ -188,8 +397,8 @@ class StatsConvert():
         return False
 
     # Convert treasure table logic
-    def process_treasure_table(self, construct: dict):
-        t = []
+    def process_treasure_table(self, construct: StatsDocument):
+        t = StatObject()
         has_subtable = False
         base_table_uuid = ""
         base_table_name = ""
@@ -204,8 +413,9 @@ class StatsConvert():
 
             # If we have data and a new table or secondary subtable, output field to main dictionary
             if not (not t) and (line.startswith("new treasuretable") or line.startswith("new subtable") and has_subtable):
-                construct['stats']['stat_objects']['stat_object'].append({'@is_substat': is_substat, 'fields': {'field': t}})
-                t = []
+                t.is_substat = is_substat
+                construct.append(t)
+                t = StatObject()
                 is_substat = 'false'
                 if line.startswith("new subtable"):
                     is_substat = 'true'
@@ -215,8 +425,8 @@ class StatsConvert():
                 has_subtable = False
                 base_table_uuid = self.gen_uuid()
                 base_table_name = tokens[2].strip('"')
-                t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': base_table_uuid})
-                t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': base_table_name})
+                t.append(Field('UUID', 'IdTableFieldDefinition', base_table_uuid))
+                t.append(Field('Name', 'NameTableFieldDefinition', base_table_name))
                 continue
 
             if line.startswith("new subtable"):
@@ -224,8 +434,8 @@ class StatsConvert():
                     builder = self.gen_dict(["Using", base_table_uuid])
                     if not builder is None:
                         t.append(builder)
-                    t.append({'@name': 'UUID', '@type': 'IdTableFieldDefinition', '@value': self.gen_uuid()})
-                    t.append({'@name': 'Name', '@type': 'NameTableFieldDefinition', '@value': str(base_table_name + '_substat')})
+                    t.append(Field('UUID', 'IdTableFieldDefinition', self.gen_uuid()))
+                    t.append(Field('Name', 'NameTableFieldDefinition', str(base_table_name + '_substat')))
                 else:
                     has_subtable = True
 
@@ -260,4 +470,52 @@ class StatsConvert():
                 continue
 
         if not (not t):
-            construct['stats']['stat_objects']['stat_object'].append({'@is_substat': is_substat, 'fields': {'field': t}})
+            t.is_substat = is_substat
+            construct.append(t)
+
+
+# Convert the text of a stats file (name is its file name) to .stats xml without touching the disk,
+# IDs of the entries it defines are put into ctx.recovered for the lsx files converted after it
+def convert_stats_text(text: str, name: str, ctx: ConvertContext) -> bytes:
+    converter = StatsConvert(ctx.db, ctx.auxdb)
+    converter.setUUID(ctx.uuid)
+    output = BytesIO()
+    if not converter.convert_text(text, name, output):
+        return None
+    ctx.recovered = converter.auxIDfix
+    return output.getvalue()
+
+
+# Converter used by pipeline worker processes, set up once per process
+_worker_converter: StatsConvert = None
+
+
+def init_worker(db, auxdb):
+    global _worker_converter
+    _worker_converter = StatsConvert(db, auxdb)
+    # warnings go back to the main process with each result
+    RunLog.install(RunLog.BufferedLog())
+
+
+# Pipeline transform stage, converts already read text without touching the disk
+def convert_worker(file: str, text: str, fuuid: str = None):
+    converter = _worker_converter
+    converter.setUUID(fuuid)
+    output = BytesIO()
+    if not converter.convert_text(text, file, output):
+        return None, None, converter.auxIDfix, RunLog.drain()
+    return converter.output_path(file), output.getvalue(), converter.auxIDfix, RunLog.drain()
+
+
+# Converts one chunk of a large file, using the entry IDs assigned by StatsConvert.plan_chunks
+# :return: (stat_object elements of the chunk, whether every parent was found, log records)
+def convert_chunk_worker(file: str, text: str, uuids: list[str], parents: dict, final: bool):
+    converter = _worker_converter
+    converter.file = file
+    objects = converter.convert_entries(text.split("\n"), {}, iter(uuids), final)
+    recovered = converter.fix_parents(objects, parents)
+    output = StringIO()
+    writer = StatsWriter(output)
+    for stat_object in objects:
+        writer.write_object(stat_object)
+    return output.getvalue(), recovered, RunLog.drain()
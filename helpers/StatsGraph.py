@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from colorama import Fore
+
+from helpers import RunLog
+
+GRAPH_VERSION = 1
+
+
+def fingerprint(*tables) -> str:
+    """
+        Hash of the databases a conversion depends on, outputs of every file change with them.
+        Databases not held in memory (AuxDB) give their own digest instead of being dumped.
+    """
+    digest = hashlib.sha1()
+    for table in tables:
+        if isinstance(table, dict):
+            digest.update(json.dumps(table, sort_keys=True).encode('utf-8'))
+        else:
+            digest.update(table.digest.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def scan_entries(file: Path) -> dict[str, str]:
+    """
+        Entries defined in a stats txt file and the parent each one uses (None without using),
+        read the same way StatsConvert reads names. Treasure tables have no entries.
+    """
+    entries = {}
+    current = None
+    with open(file, encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            if line.startswith('treasure') or line.startswith('new treasuretable'):
+                return {}
+            if line.startswith('new'):
+                raw = line.split('"')[1::2]
+                current = raw[0] if raw else None
+                if current is not None:
+                    entries[current] = None
+            elif line.startswith('using') and current is not None:
+                raw = line.split('"')[1::2]
+                if raw:
+                    entries[current] = raw[0]
+    return entries
+
+
+@dataclass
+class RebuildPlan:
+    files: int = 0
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    # file to rebuild -> why (changed, missing output or the inherited entry it depends on)
+    rebuild: dict[str, str] = field(default_factory=dict)
+    cycles: list[list[str]] = field(default_factory=list)
+    full: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            'files': self.files,
+            'changed': self.changed,
+            'removed': self.removed,
+            'rebuild': self.rebuild,
+            'cycles': self.cycles,
+            'full': self.full
+        }
+
+    def print_summary(self, verbose: bool = False):
+        RunLog.info(f'[stats] Rebuilding {len(self.rebuild)}/{self.files} stats files '
+                    f'({len(self.changed)} changed, {len(self.removed)} removed)', Fore.CYAN)
+        if self.full:
+            RunLog.info('[stats] Databases changed since the last run, every file is rebuilt', Fore.YELLOW)
+        elif verbose:
+            for file, reason in self.rebuild.items():
+                RunLog.info(f'\t{Path(file).name}: {reason}', Fore.RESET)
+        for cycle in self.cycles:
+            RunLog.warning(f'[stats] Inheritance cycle: {" -> ".join(cycle + cycle[:1])}', 'Inheritance cycle', cycle[0])
+
+
+# Persisted inheritance graph of stats entries (entry -> parent, entry -> file), so a partial
+# run only regenerates files whose output can change: changed files and every file with an
+# entry inheriting, directly or through other entries, from an entry defined in them.
+# Only changed files are scanned again, unchanged ones come from the graph file.
+class StatsGraph:
+    def __init__(self, path: Path):
+        """
+        :param path: Json file the graph is kept in
+        """
+        self.path = path
+        self.fingerprint = None
+        # file -> {'mtime', 'size', 'entries': {entry: parent}}
+        self.files: dict[str, dict] = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version', None) == GRAPH_VERSION:
+                self.fingerprint = data['fingerprint']
+                self.files = data['files']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': GRAPH_VERSION, 'fingerprint': self.fingerprint, 'files': self.files}, f)
+
+    def update(self, files: list[Path], root: Path = None) -> tuple[list[str], list[str], dict[str, dict]]:
+        """
+            Scans files that are new or changed (by mtime and size) since they were last recorded
+
+        :param files: Stats txt files that exist now
+        :param root: Recorded files below root that are not in files are dropped as removed
+        :return: (changed files, removed files, previous entries of changed and removed files)
+        """
+        changed = []
+        previous = {}
+        current = set()
+        for file in files:
+            key = str(file)
+            current.add(key)
+            stat = file.stat()
+            record = self.files.get(key, None)
+            if record is not None and record['mtime'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+                continue
+            if record is not None:
+                previous[key] = record['entries']
+            self.files[key] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'entries': scan_entries(file)}
+            changed.append(key)
+
+        removed = []
+        prefix = None if root is None else str(root) + os.sep
+        for key in list(self.files):
+            if key in current:
+                continue
+            if prefix is not None and key.startswith(prefix):
+                previous[key] = self.files.pop(key)['entries']
+                removed.append(key)
+            elif not os.path.exists(key):
+                # other trees that are gone, e.g. temp dirs of unpacked paks
+                del self.files[key]
+        return changed, removed, previous
+
+    def dependents(self, entries: set[str]) -> dict[str, str]:
+        """
+            Entries inheriting from any of entries, directly or transitively
+
+        :return: Dependent entry -> the entry it was reached from
+        """
+        children: dict[str, list[str]] = {}
+        for record in self.files.values():
+            for entry, parent in record['entries'].items():
+                if parent is not None:
+                    children.setdefault(parent, []).append(entry)
+
+        reached = {}
+        pending = deque(entries)
+        while pending:
+            entry = pending.popleft()
+            for child in children.get(entry, []):
+                if child not in reached and child not in entries:
+                    reached[child] = entry
+                    pending.append(child)
+        return reached
+
+    def defining_files(self) -> dict[str, list[str]]:
+        """
+            Entry -> files defining it
+        """
+        defined: dict[str, list[str]] = {}
+        for file, record in self.files.items():
+            for entry in record['entries']:
+                defined.setdefault(entry, []).append(file)
+        return defined
+
+    def cycles(self) -> list[list[str]]:
+        """
+            Inheritance cycles, every entry has at most one parent so each cycle is found with one walk
+        """
+        parents = {}
+        for record in self.files.values():
+            for entry, parent in record['entries'].items():
+                if parent is not None:
+                    parents[entry] = parent
+
+        state: dict[str, int] = {}  # 1 on the current walk, 2 done
+        cycles = []
+        for start in parents:
+            walk = []
+            entry = start
+            while entry is not None and entry not in state:
+                state[entry] = 1
+                walk.append(entry)
+                entry = parents.get(entry, None)
+            if entry is not None and state[entry] == 1:
+                cycles.append(walk[walk.index(entry):])
+            for visited in walk:
+                state[visited] = 2
+        return cycles
+
+    def plan(self, files: list[Path], root: Path = None, db_fingerprint: str = None,
+             changed: list[Path] = None, outputs: dict[str, Path] = None) -> RebuildPlan:
+        """
+            Minimal set of files to regenerate, recording the current state of files in the graph
+
+        :param files: Stats txt files that would be converted
+        :param root: Dir files were collected from, recorded files below it that are gone count as removed
+        :param db_fingerprint: fingerprint() of the databases, a different one than last time rebuilds everything
+        :param changed: Files to treat as changed, instead of detecting changes by mtime and size
+        :param outputs: Source file -> output file, sources without an up to date output are always rebuilt
+        """
+        plan = RebuildPlan(files=len(files))
+        detected, plan.removed, previous = self.update(files, root)
+        plan.changed = detected if changed is None else [str(f) for f in changed]
+        plan.cycles = self.cycles()
+
+        if db_fingerprint is not None and db_fingerprint != self.fingerprint:
+            self.fingerprint = db_fingerprint
+            plan.full = True
+            plan.rebuild = {str(f): 'databases changed' for f in files}
+            return plan
+
+        for file in plan.changed:
+            if file in self.files:
+                plan.rebuild[file] = 'changed'
+
+        # entries of changed or removed files get new UUIDs (or disappear), so everything inheriting from them changes
+        seeds = set()
+        for file in plan.changed + plan.removed:
+            seeds.update(self.files.get(file, {'entries': {}})['entries'])
+            seeds.update(previous.get(file, {}))
+        defined = self.defining_files()
+        for entry, cause in self.dependents(seeds).items():
+            for file in defined.get(entry, []):
+                if file not in plan.rebuild:
+                    plan.rebuild[file] = f'{entry} inherits from {cause}'
+
+        # a whole cycle depends on itself, rebuild it together once any part of it is rebuilt
+        for cycle in plan.cycles:
+            cycle_files = {file for entry in cycle for file in defined.get(entry, [])}
+            if cycle_files & plan.rebuild.keys():
+                for file in cycle_files - plan.rebuild.keys():
+                    plan.rebuild[file] = f'inheritance cycle {" -> ".join(cycle)}'
+
+        if outputs is not None:
+            for file in files:
+                key = str(file)
+                output = outputs.get(key, None)
+                if key not in plan.rebuild and output is not None and not self._output_current(file, output):
+                    plan.rebuild[key] = 'output missing or older than source'
+        return plan
+
+    @staticmethod
+    def _output_current(source: Path, output: Path) -> bool:
+        try:
+            return output.stat().st_mtime_ns >= source.stat().st_mtime_ns
+        except OSError:
+            return False
+
+
+# Report without converting: py -m helpers.StatsGraph <dir> [--changed <files>]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stats files to regenerate after source changes')
+    parser.add_argument('source', type=Path, help='Dir with stats txt files')
+    parser.add_argument('--graph', type=Path, default=Path('stats_graph.json'), help='Graph file (default ./stats_graph.json)')
+    parser.add_argument('--changed', type=Path, nargs='*', default=None, help='Treat these files as changed instead of detecting changes')
+    parser.add_argument('--json', action='store_true', help='Print the plan as json')
+    parser.add_argument('--dryRun', action='store_true', help='Do not save the updated graph')
+    args = parser.parse_args()
+
+    source = args.source.resolve()
+    graph = StatsGraph(args.graph)
+    stats_files = sorted(source.rglob('*.txt'))
+    changed = None if args.changed is None else [f.resolve() for f in args.changed]
+    rebuild_plan = graph.plan(stats_files, source, changed=changed)
+    if args.json:
+        print(json.dumps(rebuild_plan.to_dict(), indent=4))
+    else:
+        rebuild_plan.print_summary(verbose=True)
+    if not args.dryRun:
+        graph.save()
@@ -0,0 +1,225 @@
+import sys
+from io import StringIO
+from xml.sax.saxutils import XMLGenerator
+from xml.sax.xmlreader import AttributesImpl
+
+NEWLINE = '\n'
+INDENT = '  '
+
+
+# Single <field> of a stat object
+class Field:
+    __slots__ = ('name', 'type', 'value', 'value_at', 'attrs', 'children')
+
+    def __init__(self, name: str = None, type: str = None, value: str = None, attrs: dict = None, children: dict = None):
+        """
+        :param name: Field name, interned as the same names repeat across all objects
+        :param type: Table field definition type, interned
+        :param value: Field value (None to leave the attribute out)
+        :param attrs: Additional xml attributes in output order (handle, version, enumeration_type_name...)
+        :param children: Child elements in xmltodict form (e.g. modifier nodes)
+        """
+        self.name = None if name is None else sys.intern(name)
+        self.type = None if type is None else sys.intern(type)
+        self.value = value
+        # attrs written before the value, the value keeps the place it was first set at like a dict key
+        self.value_at = 0
+        self.attrs = attrs
+        self.children = children
+
+    # dict style access by xml attribute name, used while building fields attribute by attribute
+    def get(self, key: str, default=None):
+        if key == 'name':
+            return default if self.name is None else self.name
+        if key == 'type':
+            return default if self.type is None else self.type
+        if key == 'value':
+            return default if self.value is None else self.value
+        if self.attrs is None:
+            return default
+        return self.attrs.get(key, default)
+
+    def set(self, key: str, value):
+        if key == 'name':
+            self.name = sys.intern(value)
+        elif key == 'type':
+            self.type = sys.intern(value)
+        elif key == 'value':
+            if self.value is None and self.attrs is not None:
+                self.value_at = len(self.attrs)
+            self.value = value
+        else:
+            if self.attrs is None:
+                self.attrs = {}
+            self.attrs[key] = value
+
+    # xml attributes in output order
+    def items(self):
+        if self.name is not None:
+            yield 'name', self.name
+        if self.type is not None:
+            yield 'type', self.type
+        value_at = self.value_at if self.value is not None else -1
+        if value_at == 0:
+            yield 'value', self.value
+        if self.attrs is not None:
+            for i, (key, value) in enumerate(self.attrs.items(), 1):
+                yield key, value
+                if i == value_at:
+                    yield 'value', self.value
+
+    def to_dict(self) -> dict:
+        """
+            Field in the xmltodict form used before the model existed
+        """
+        field = {}
+        for key, value in self.items():
+            field[f'@{key}'] = value
+        if self.children is not None:
+            field.update(self.children)
+        return field
+
+
+# <stat_object> holding its fields plus an index for lookups by name
+class StatObject:
+    __slots__ = ('is_substat', 'fields', 'index')
+
+    def __init__(self, is_substat: str = 'false', fields: list[Field] = None):
+        self.is_substat = is_substat
+        self.fields: list[Field] = []
+        self.index: dict[str, Field] = {}
+        if fields is not None:
+            for field in fields:
+                self.append(field)
+
+    def append(self, field: Field):
+        if field is None:
+            return
+        self.fields.append(field)
+        # first field wins, same as scanning the list
+        if field.name not in self.index:
+            self.index[field.name] = field
+
+    def has(self, name: str) -> bool:
+        return name in self.index
+
+    def get(self, name: str) -> Field:
+        return self.index.get(name, None)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def to_dict(self) -> dict:
+        return {'@is_substat': self.is_substat, 'fields': {'field': [f.to_dict() for f in self.fields]}}
+
+
+# Root <stats> document both converters produce
+class StatsDocument:
+    __slots__ = ('definition_id', 'objects')
+
+    def __init__(self, definition_id: str = ''):
+        self.definition_id = definition_id
+        self.objects: list[StatObject] = []
+
+    def append(self, stat_object: StatObject):
+        self.objects.append(stat_object)
+
+    def to_dict(self) -> dict:
+        return {'stats': {'@stat_object_definition_id': self.definition_id,
+                          'stat_objects': {'stat_object': [o.to_dict() for o in self.objects]}}}
+
+    def write(self, output):
+        """
+            Serializes the document to a text stream, same output as xmltodict.unparse(pretty=True, indent='  ')
+        """
+        writer = StatsWriter(output)
+        writer.begin(self.definition_id)
+        for stat_object in self.objects:
+            writer.write_object(stat_object)
+        writer.end()
+
+    def to_xml(self) -> str:
+        output = StringIO()
+        self.write(output)
+        return output.getvalue()
+
+
+# Incremental writer for stats documents, objects can be written as soon as they are complete
+class StatsWriter:
+    def __init__(self, output):
+        self.handler = XMLGenerator(output, 'utf-8')
+        self.count = 0
+
+    def begin(self, definition_id: str = ''):
+        handler = self.handler
+        handler.startDocument()
+        handler.startElement('stats', AttributesImpl({'stat_object_definition_id': str(definition_id)}))
+        handler.ignorableWhitespace(NEWLINE)
+        handler.ignorableWhitespace(INDENT)
+        handler.startElement('stat_objects', AttributesImpl({}))
+        handler.ignorableWhitespace(NEWLINE)
+
+    def write_object(self, stat_object: StatObject):
+        handler = self.handler
+        handler.ignorableWhitespace(INDENT * 2)
+        handler.startElement('stat_object', AttributesImpl({'is_substat': str(stat_object.is_substat)}))
+        handler.ignorableWhitespace(NEWLINE)
+        handler.ignorableWhitespace(INDENT * 3)
+        handler.startElement('fields', AttributesImpl({}))
+        handler.ignorableWhitespace(NEWLINE)
+        for field in stat_object.fields:
+            _write_field(handler, field)
+        handler.ignorableWhitespace(INDENT * 3)
+        handler.endElement('fields')
+        handler.ignorableWhitespace(NEWLINE)
+        handler.ignorableWhitespace(INDENT * 2)
+        handler.endElement('stat_object')
+        handler.ignorableWhitespace(NEWLINE)
+        self.count += 1
+
+    def end(self):
+        handler = self.handler
+        handler.ignorableWhitespace(INDENT)
+        handler.endElement('stat_objects')
+        handler.ignorableWhitespace(NEWLINE)
+        handler.endElement('stats')
+        handler.endDocument()
+
+
+def _write_field(handler: XMLGenerator, field: Field):
+    attrs = {key: str(value) for key, value in field.items()}
+
+    handler.ignorableWhitespace(INDENT * 4)
+    handler.startElement('field', AttributesImpl(attrs))
+    if field.children:
+        handler.ignorableWhitespace(NEWLINE)
+        for tag, node in field.children.items():
+            _write_node(handler, tag, node, 5)
+        handler.ignorableWhitespace(INDENT * 4)
+    handler.endElement('field')
+    handler.ignorableWhitespace(NEWLINE)
+
+
+# Writes child elements given in xmltodict form (attributes prefixed with @)
+def _write_node(handler: XMLGenerator, tag: str, node, depth: int):
+    nodes = node if isinstance(node, list) else [node]
+    for item in nodes:
+        attrs = {}
+        children = []
+        for key, value in item.items():
+            if key.startswith('@'):
+                attrs[key[1:]] = str(value)
+            else:
+                children.append((key, value))
+        handler.ignorableWhitespace(INDENT * depth)
+        handler.startElement(tag, AttributesImpl(attrs))
+        if children:
+            handler.ignorableWhitespace(NEWLINE)
+            for child_tag, child in children:
+                _write_node(handler, child_tag, child, depth + 1)
+            handler.ignorableWhitespace(INDENT * depth)
+        handler.endElement(tag)
+        handler.ignorableWhitespace(NEWLINE)
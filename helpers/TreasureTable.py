@@ -0,0 +1,134 @@
+import sys
+import uuid
+from typing import Iterable, Iterator
+
+from helpers import RunLog
+from helpers.StatsModel import Field, StatObject, StatsDocument, StatsWriter
+
+LEVEL_FIELDS = {'MinLevel': 'MinLevelDiff', 'MaxLevel': 'MaxLevelDiff', 'StartLevel': 'StartLevel', 'EndLevel': 'EndLevel'}
+
+
+# Streaming state machine converting TreasureTable.txt into stat objects.
+# Same output as StatsConvert.process_treasure_table, but lines are dispatched on their first token,
+# field types are looked up once per field name and finished tables can be written right away.
+class TreasureTableConvert:
+    def __init__(self, db: dict):
+        self.db = db
+        self._specs: dict[str, tuple] = {}
+
+    def records(self, lines: Iterable[str]) -> Iterator[StatObject]:
+        """
+            Parses treasure table lines, yielding every table and subtable once it is complete
+        """
+        t = StatObject()
+        has_subtable = False
+        base_table_uuid = ''
+        base_table_name = ''
+        is_substat = 'false'
+
+        for line in lines:
+            line = line.rstrip('\n')
+            if line == '' or line.startswith('treasure'):
+                continue
+            tokens = line.split(' ')
+            keyword = tokens[0]
+
+            if keyword == 'new' and len(tokens) > 1 and tokens[1] == 'treasuretable':
+                if t:
+                    t.is_substat = is_substat
+                    yield t
+                    t = StatObject()
+                    is_substat = 'false'
+                has_subtable = False
+                base_table_uuid = str(uuid.uuid4())
+                base_table_name = tokens[2].strip('"')
+                t.append(Field('UUID', 'IdTableFieldDefinition', base_table_uuid))
+                t.append(Field('Name', 'NameTableFieldDefinition', base_table_name))
+
+            elif keyword == 'new' and len(tokens) > 1 and tokens[1] == 'subtable':
+                if t and has_subtable:
+                    t.is_substat = is_substat
+                    yield t
+                    t = StatObject()
+                    is_substat = 'true'
+                if has_subtable:
+                    t.append(self.make_field('Using', base_table_uuid))
+                    t.append(Field('UUID', 'IdTableFieldDefinition', str(uuid.uuid4())))
+                    t.append(Field('Name', 'NameTableFieldDefinition', base_table_name + '_substat'))
+                else:
+                    has_subtable = True
+                t.append(self.make_field('DropCount', tokens[2].strip('"')))
+
+            elif keyword == 'object' and len(tokens) > 1 and tokens[1] == 'category':
+                fields = tokens[2].strip('"').split(',')
+                t.append(self.make_field('ObjectCategory', fields[0].strip('"')))
+                t.append(self.make_field('Frequency', fields[1].strip('"')))
+
+            elif keyword in LEVEL_FIELDS:
+                t.append(self.make_field(LEVEL_FIELDS[keyword], tokens[1].strip('"')))
+
+            elif keyword == 'CanMerge':
+                t.append(self.make_field('CanMerge', 'Yes' if tokens[1].strip('"') == '1' else 'No'))
+
+        if t:
+            t.is_substat = is_substat
+            yield t
+
+    def write(self, lines: Iterable[str], output, definition_id: str = '') -> int:
+        """
+            Converts and writes tables to output while reading, without keeping the document in memory
+
+        :return: Number of stat objects written
+        """
+        writer = StatsWriter(output)
+        writer.begin(definition_id)
+        for record in self.records(lines):
+            writer.write_object(record)
+        writer.end()
+        return writer.count
+
+    def build(self, lines: Iterable[str], definition_id: str = '') -> StatsDocument:
+        document = StatsDocument(definition_id)
+        for record in self.records(lines):
+            document.append(record)
+        return document
+
+    # Same field layout as StatsConvert.gen_dict, with the db lookups cached per field name
+    def make_field(self, name: str, value: str) -> Field:
+        field_name, field_type, enum_type_name, value_map = self._spec(name)
+        if field_type == 'TranslatedStringTableFieldDefinition':
+            return Field(field_name, field_type, '', {'handle': value.split(';')[0], 'version': '1'})
+
+        attrs = None
+        if value == '':
+            attrs = {'clear_inherited_value': 'true'}
+        if enum_type_name is not None:
+            attrs = attrs or {}
+            attrs['enumeration_type_name'] = enum_type_name
+            attrs['version'] = '1'
+        if value_map is not None and value != '':
+            value = value_map.get(value, value)
+        return Field(field_name, field_type, value, attrs)
+
+    def _spec(self, name: str) -> tuple:
+        spec = self._specs.get(name, None)
+        if spec is not None:
+            return spec
+
+        data_types = self.db['DataTypes']
+        field_type = data_types.get(name, '')
+        enum_type_name = None
+        value_map = None
+        if field_type == '':
+            RunLog.warning(f'[stats] Missing Pre-Configured Data Type: {name}', 'Missing Pre-Configured Data Type', name)
+        if field_type in ['EnumerationListTableFieldDefinition', 'EnumerationTableFieldDefinition']:
+            enum_type_name = data_types['EnumTypes'].get(name, name)
+            value_map = data_types['EnumSubTypes'].get(enum_type_name, None)
+        elif field_type == 'BoolTableFieldDefinition':
+            value_map = data_types['EnumSubTypes'].get('BoolTableFieldDefinition', None)
+        if not isinstance(value_map, dict):
+            value_map = None
+
+        spec = (sys.intern(name), sys.intern(field_type), enum_type_name, value_map)
+        self._specs[name] = spec
+        return spec